@@ -1,39 +1,40 @@
 import streamlit as st
 import os
 import pandas as pd
-import requests
 import datetime
-import json
-import altair as alt
 import zoneinfo
 import time # Importar time para simular un retraso si es necesario
 import streamlit.components.v1 as components # Importar components
-import html # Importar el módulo html para escapar
+
+from lemargo.agregados import AgregadosDashboard
+from lemargo.almacenamiento import migrar_desde_json, obtener_almacen
+from lemargo.api import HOST_POR_OMISION, ConsultaDestinos, crear_servidor, iniciar_en_hilo
+from lemargo.cache import CacheBase
+from lemargo.esquema import CLASE_CANCELADO, CLASE_DEMORA, CLASE_FACTURADO
+from lemargo.fichas import COLUMNAS_FICHA, generar_html_fichas, resumen_consulta
+from lemargo.historial import HistorialActualizaciones
+from lemargo.indice import IndiceDestinos
+from lemargo.ingesta import hash_contenido, leer_libros
+from lemargo.metricas import ETIQUETAS_TRAMOS, desglose, tabla_tramos
+from lemargo.cola import ColaNotificaciones, TrabajadorCola
+from lemargo.notificaciones import DespachadorNotificaciones, firebase_inicializado, inicializar_firebase
+from lemargo import pipeline
+from lemargo.pipeline import ContextoCarga, ejecutar_carga
+from lemargo.suscripciones import AlmacenSuscripciones
 
 # --- Configuración de Zona Horaria ---
 # Define la zona horaria de la Ciudad de México para manejar fechas y horas.
 cdmx_tz = zoneinfo.ZoneInfo("America/Mexico_City")
 
-# --- Importaciones y Configuración de Firebase Admin SDK ---
-# Importa los módulos necesarios de Firebase Admin SDK para interactuar con Firebase.
-import firebase_admin
-from firebase_admin import credentials, messaging
-
-# --- Carga Segura de Credenciales de Firebase ---
-# Carga las claves de Firebase (cuenta de servicio, clave VAPID y configuración del frontend)
-# directamente desde los secretos configurados en Streamlit Cloud.
-try:
-    FIREBASE_SERVICE_ACCOUNT_JSON = json.loads(st.secrets.get("FIREBASE_SERVICE_ACCOUNT"))
-    FIREBASE_VAPID_KEY = st.secrets.get("FIREBASE_VAPID_KEY")
-    FIREBASE_CONFIG = st.secrets.get("FIREBASE_CONFIG")
-    
-    # Inicializa el SDK de Firebase Admin si aún no está inicializado.
-    if not firebase_admin._apps:
-        cred = credentials.Certificate(FIREBASE_SERVICE_ACCOUNT_JSON)
-        firebase_admin.initialize_app(cred)
-    st.info("✅ Firebase Admin SDK inicializado correctamente.")
-except Exception as e:
-    st.error(f"❌ Error al inicializar Firebase Admin SDK. Asegúrate de que las claves estén en los Secrets de Streamlit Cloud. Error: {e}")
+# --- Credenciales de Firebase ---
+# La clave VAPID y la configuración del frontend se leen de los secretos configurados en
+# Streamlit Cloud. El SDK de Firebase Admin (cuenta de servicio) no se importa aquí: se
+# inicializa una sola vez por proceso, cuando el trabajador de la cola va a enviar el primer
+# aviso (ver crear_despachador_fcm), de modo que la página de consulta no paga ese costo.
+FIREBASE_VAPID_KEY = st.secrets.get("FIREBASE_VAPID_KEY")
+FIREBASE_CONFIG = st.secrets.get("FIREBASE_CONFIG")
+if not FIREBASE_VAPID_KEY or not FIREBASE_CONFIG:
+    st.error("❌ Faltan las claves de Firebase (FIREBASE_VAPID_KEY y FIREBASE_CONFIG). Asegúrate de que estén en los Secrets de Streamlit Cloud.")
     st.stop() # Detiene la ejecución de la aplicación si hay un error crítico.
 
 # --- Credenciales de Administrador ---
@@ -42,15 +43,35 @@ ADMIN_USER = st.secrets.get("ADMIN_USER")
 ADMIN_PASS = st.secrets.get("ADMIN_PASS")
 
 # --- Rutas de Archivos de Datos ---
-# Define las rutas para la base de datos principal (JSON) y el historial de actualizaciones.
-DB_PATH = "golden_record.json"
-HISTORIAL_PATH = "historial_actualizaciones.json"
-FCM_TOKENS_PATH = "fcm_tokens.json" # Nueva ruta para el archivo de tokens FCM
+# Define el almacenamiento de la base de datos principal y las rutas del historial de actualizaciones.
+# La base se guarda en formato columnar (Parquet por defecto); el JSON anterior se migra una sola vez.
+# Los nombres son los de lemargo/pipeline.py, que también usa la carga por línea de comandos.
+DB_FORMAT = pipeline.FORMATO_BASE # Opciones: "parquet", "feather", "json" o "sqlite" (consultas en el motor, sin cargar la base)
+ALMACEN_DB = obtener_almacen(DB_FORMAT, ruta_base=pipeline.RUTA_BASE)
+DB_PATH = ALMACEN_DB.ruta
+LEGACY_DB_PATH = "golden_record.json" # Base en JSON de versiones anteriores
+HISTORIAL_PATH = pipeline.HISTORIAL_PATH # Registro de cargas (SQLite, solo inserción)
+LEGACY_HISTORIAL_PATH = "historial_actualizaciones.json" # Lista JSON de versiones anteriores (se migra una sola vez)
+HISTORIAL_POR_PAGINA = 10
+METRICAS_PATH = pipeline.METRICAS_PATH # Tiempos por etapa y contadores de cada carga (una línea JSON por carga)
+CARGAS_EN_DESGLOSE = 20 # Cargas recientes que se comparan en el desglose de tiempos
+FICHAS_POR_PAGINA = 50 # Fichas visibles antes de pedir "Mostrar más"
+SUSCRIPCIONES_PATH = pipeline.SUSCRIPCIONES_PATH # Suscripciones FCM (destino <-> token) en SQLite
+FCM_TOKENS_PATH = "fcm_tokens.json" # Archivo de tokens de versiones anteriores (se migra una sola vez)
+HASH_PATH = pipeline.HASH_PATH # Hash SHA-256 del último archivo Excel procesado
+COLA_NOTIFICACIONES_PATH = pipeline.COLA_NOTIFICACIONES_PATH # Cola persistente (SQLite) de notificaciones pendientes
+AGREGADOS_PATH = pipeline.AGREGADOS_PATH # Conteos por día, producto, estado y destino para el dashboard
 
 # --- Constantes de Configuración ---
+# Número máximo de lotes de notificaciones (hasta 500 mensajes cada uno) enviados en paralelo.
+FCM_MAX_HILOS = 4
+
 # Número de días para mantener los registros con estado 'FACTURADO' o 'CANCELADO'
 # antes de que sean eliminados de la base de datos.
-RETENTION_DAYS = 7 
+RETENTION_DAYS = pipeline.DIAS_RETENCION
+
+# Segundos que una carga espera a que termine la de otro administrador antes de desistir.
+BLOQUEO_ESPERA_S = 120
 
 # --- Configuración de PWA (Progressive Web App) ---
 # Inserta etiquetas HTML para configurar la aplicación como una PWA, incluyendo el manifiesto y los iconos.
@@ -65,218 +86,175 @@ def pwa_setup():
         <link rel="icon" type="image/png" sizes="192x192" href="public/icons/icon-192.png">
     """, unsafe_allow_html=True)
 
-# --- Configuración de Firebase Cloud Messaging (FCM) en el Frontend ---
-# Inserta el código JavaScript necesario para inicializar Firebase en el navegador,
-# solicitar permisos de notificación y obtener el token de registro de FCM.
-# Ahora, el token se envía automáticamente a un campo oculto de Streamlit.
-def fcm_pwa_setup(fcm_token_input_id):
-    # Elimina cualquier espacio en blanco o salto de línea al inicio/final de la cadena JSON.
-    firebase_config_raw = st.secrets.get("FIREBASE_CONFIG").strip() 
-    # Escapa la cadena JSON para que sea segura para el atributo HTML.
-    firebase_config_html_safe = html.escape(firebase_config_raw, quote=True)
-    
-    vapid_key_js = st.secrets.get("FIREBASE_VAPID_KEY")
-
-    # Define la URL del Service Worker aquí.
-    # ¡IMPORTANTE! Vuelve a la ruta relativa para cumplir con la política del mismo origen.
-    service_worker_url = "/public/firebase-messaging-sw.js" 
-
-    js_code = f"""
-    <div id="firebase-config-data" data-firebase-config='{firebase_config_html_safe}' data-vapid-key="{vapid_key_js}"></div>
-    
-    <!-- Importa los scripts de Firebase desde CDN -->
-    <script src="https://www.gstatic.com/firebasejs/8.10.0/firebase-app.js"></script>
-    <script src="https://www.gstatic.com/firebasejs/8.10.0/firebase-messaging.js"></script>
-
-    <script>
-    console.log("FCM Setup script loaded via components.v1.html.");
-    
-    // Obtener la configuración de Firebase y la clave VAPID del atributo data-
-    const configDataElement = document.getElementById('firebase-config-data');
-    const firebaseConfigString = configDataElement.dataset.firebaseConfig;
-    const vapidKey = configDataElement.dataset.vapidKey;
-    const serviceWorkerUrl = "{service_worker_url}"; // Pasa la URL del SW a JS
-
-    console.log("Raw Firebase Config String from data-attribute:", firebaseConfigString);
-    console.log("VAPID Key from data-attribute:", vapidKey);
-    console.log("Service Worker URL:", serviceWorkerUrl); // Ahora debería ser la URL relativa
-
-    let firebaseConfig;
-    try {{
-        firebaseConfig = JSON.parse(firebaseConfigString);
-        console.log("Parsed Firebase Config:", firebaseConfig);
-    }} catch (e) {{
-        console.error("Error parsing Firebase config from data-attribute:", e);
-    }}
-
-    // Function to initialize Firebase and Messaging after CDN scripts are loaded
-    function initFirebaseAndMessaging() {{
-        console.log("Attempting to initialize Firebase and Messaging...");
-        console.log("Type of global 'firebase':", typeof firebase);
-        console.log("Current Firebase apps length:", firebase.apps ? firebase.apps.length : 'undefined'); // Log para depuración
-        
-        // Check if Firebase is already initialized
-        if (!firebase.apps.length) {{ 
-            if (typeof firebase !== 'undefined' && typeof firebase.initializeApp === 'function') {{
-                console.log("Global Firebase object found and initializeApp is a function.");
-                firebase.initializeApp(firebaseConfig);
-                console.log("Firebase app initialized successfully.");
-            }} else {{
-                console.error("Global Firebase object or initializeApp method is missing after firebase-app.js script load.");
-                return; // Exit if Firebase app cannot be initialized
-            }}
-        }} else {{
-            console.log("Firebase app named '[DEFAULT]' already exists. Skipping re-initialization.");
-        }}
-
-        // Asegurarse de que firebase.messaging esté disponible
-        if (typeof firebase.messaging === 'function') {{
-            const messaging = firebase.messaging();
-            console.log("Firebase Messaging initialized successfully.");
-
-            // **IMPORTANTE:** Registra el Service Worker para manejar notificaciones en segundo plano.
-            if ('serviceWorker' in navigator) {{
-                navigator.serviceWorker.register(serviceWorkerUrl) // Usa la variable
-                .then((registration) => {{
-                    console.log('Service Worker registrado con éxito:', registration);
-                    messaging.useServiceWorker(registration);
-                }})
-                .catch((err) => {{
-                    console.error('Error al registrar el Service Worker:', err);
-                }});
-            }} else {{
-                console.warn('Service Workers no soportados en este navegador.');
-            }}
-
-            // Función para obtener el token de registro de FCM y enviarlo a Streamlit.
-            async function getAndSendFcmToken() {{
-                console.log('getAndSendFcmToken: Intentando obtener el token FCM...');
-                const permission = await Notification.requestPermission();
-                console.log('getAndSendFcmToken: Permiso de notificación:', permission);
-
-                if (permission === 'granted') {{
-                    messaging.getToken({{ vapidKey: vapidKey }}).then((currentToken) => {{
-                        if (currentToken) {{
-                            console.log('getAndSendFcmToken: FCM Registration Token:', currentToken);
-                            const hiddenInput = document.querySelector('input[aria-label="FCM Token (oculto)"]');
-                            if (hiddenInput) {{
-                                hiddenInput.value = currentToken;
-                                hiddenInput.dispatchEvent(new Event('change', {{ bubbles: true }}));
-                                console.log('getAndSendFcmToken: Token enviado a Streamlit.');
-                            }} else {{
-                                console.warn('getAndSendFcmToken: Elemento de entrada oculto de Streamlit no encontrado por aria-label.');
-                            }}
-                        }} else {{
-                            console.log('getAndSendFcmToken: No se pudo obtener el token. No hay token actual.');
-                        }}
-                    }}).catch((err) => {{
-                        console.error('getAndSendFcmToken: Ocurrió un error al obtener el token: ', err);
-                    }});
-                }} else {{
-                    console.warn('getAndSendFcmToken: Permiso de notificación denegado o no concedido.');
-                }}
-            }}
-            
-            window.triggerFcmTokenAcquisition = getAndSendFcmToken;
-            console.log("triggerFcmTokenAcquisition function exposed globally.");
-        }} else {{
-            console.error("Global firebase.messaging method is missing after firebase-messaging.js script load.");
-        }}
-    }}
-
-    // Asegurar que los scripts de Firebase se carguen antes de intentar inicializar
-    document.addEventListener('DOMContentLoaded', initFirebaseAndMessaging);
-    window.addEventListener('load', initFirebaseAndMessaging); // Fallback para asegurar la carga completa
-    </script>
-    """
-    components.html(js_code, height=0, width=0)
-
-# --- Función para Enviar Notificaciones Push con FCM ---
-# Envía una notificación push a un token de registro de FCM específico utilizando Firebase Admin SDK.
-def enviar_notificacion_por_token(token, titulo, mensaje):
-    if not token:
-        st.error("❌ No hay un token de FCM válido para enviar la notificación.")
+# --- Componente de Suscripción a Notificaciones (FCM) ---
+# Componente bidireccional (componentes/fcm_setup/index.html) que inicializa Firebase en el
+# navegador, reutiliza el Service Worker registrado y devuelve el token de FCM a Python.
+# Se dibuja siempre en la misma posición y con la misma clave, así que el iframe se monta una
+# sola vez por sesión: en cada re-ejecución solo recibe los argumentos vigentes.
+SERVICE_WORKER_URL = "/public/firebase-messaging-sw.js" # Ruta relativa (política del mismo origen)
+_componente_fcm = components.declare_component(
+    "fcm_setup", path=os.path.join(os.path.dirname(os.path.abspath(__file__)), "componentes", "fcm_setup")
+)
+
+# Muestra el botón de suscripción para 'destino' (None lo oculta) y guarda la suscripción
+# cuando el navegador devuelve el token. 'resultado' (las fichas del destino) se guarda en el
+# navegador como la última consulta, que el Service Worker actualiza con cada aviso.
+def suscripcion_notificaciones(destino, resultado=None):
+    respuesta = _componente_fcm(
+        firebase_config=FIREBASE_CONFIG.strip(),
+        vapid_key=FIREBASE_VAPID_KEY,
+        service_worker_url=SERVICE_WORKER_URL,
+        destino=destino,
+        consulta=resumen_consulta(destino, resultado) if destino and resultado is not None else None,
+        key="fcm_setup",
+        default=None,
+    )
+    if not respuesta:
+        return
+    if respuesta.get('error'):
+        if respuesta.get('destino') == destino:
+            st.warning(f"⚠️ No se pudo activar las notificaciones: {respuesta['error']}")
         return
 
+    # El valor del componente se conserva entre re-ejecuciones: cada (destino, token) se guarda una sola vez.
+    suscripcion = (respuesta['destino'], respuesta['token'])
+    registradas = st.session_state.setdefault('suscripciones_fcm_registradas', set())
+    if suscripcion not in registradas:
+        # Agrega la suscripción sin afectar a otros dispositivos del mismo destino
+        obtener_suscripciones().suscribir(*suscripcion)
+        registradas.add(suscripcion)
+    if respuesta['destino'] == destino:
+        st.success(f"✅ ¡Suscripción exitosa! Ahora recibirás notificaciones para el destino **{destino}**.")
+
+# --- Historial de Actualizaciones ---
+# Devuelve el registro de cargas compartido por todo el proceso. La primera vez importa el
+# antiguo 'historial_actualizaciones.json' si existe.
+@st.cache_resource(show_spinner=False)
+def obtener_historial():
+    historial = HistorialActualizaciones(HISTORIAL_PATH)
     try:
-        message = messaging.Message(
-            notification=messaging.Notification(
-                title=titulo,
-                body=mensaje,
-            ),
-            token=token,
-        )
-        response = messaging.send(message)
-        st.success(f"✅ Notificación enviada con éxito. ID de respuesta: {response}")
-    except Exception as e:
-        st.error(f"❌ Error al enviar notificación: {e}")
-
-# --- Carga de Historial de Actualizaciones ---
-# Carga el historial de las fechas de actualización de la base de datos desde un archivo JSON.
-def cargar_historial():
-    if os.path.exists(HISTORIAL_PATH):
-        try:
-            with open(HISTORIAL_PATH, "r") as f:
-                return json.load(f)
-        except Exception:
-            return []
-    return []
-
-# --- Guardado de Historial de Actualizaciones ---
-# Guarda una nueva fecha de actualización en el historial.
-def guardar_historial(fecha_hora):
-    historial = cargar_historial()
-    historial.append(fecha_hora)
-    try:
-        with open(HISTORIAL_PATH, "w") as f:
-            json.dump(historial, f)
+        historial.migrar_desde_json(LEGACY_HISTORIAL_PATH)
     except Exception as e:
-        st.error(f"Error guardando historial: {e}")
-
-# --- Carga de Datos (con caché) ---
-# Carga la base de datos principal desde un archivo JSON, utilizando caché para optimizar el rendimiento.
-@st.cache_data(show_spinner=False)
+        st.error(f"Error al migrar '{LEGACY_HISTORIAL_PATH}': {e}")
+    return historial
+
+# --- Carga de Datos (caché compartida) ---
+# Carga la base de datos principal desde el almacenamiento columnar. Una sola copia en memoria
+# se comparte entre todas las sesiones del proceso y solo se recarga cuando el archivo cambia,
+# así que no hace falta limpiar la caché después de guardar.
+# Los tipos (fechas y categorías) se conservan, por lo que no es necesario volver a convertirlos.
+@st.cache_resource(show_spinner=False)
+def obtener_cache_datos():
+    return CacheBase(ALMACEN_DB)
+
+# Devuelve una vista (sin copia) de la base vigente; no debe modificarse in situ.
 def cargar_datos():
-    if os.path.exists(DB_PATH):
-        try:
-            df = pd.read_json(DB_PATH)
-            return df
-        except Exception as e:
-            st.error(f"Error al cargar la base de datos histórica: {e}")
-            return pd.DataFrame()
-    return pd.DataFrame()
-
-# --- Guardado de Datos ---
-# Guarda el DataFrame actual en el archivo JSON de la base de datos.
-def guardar_datos(df):
     try:
-        if 'Fecha' in df.columns:
-            # Asegura que la columna 'Fecha' esté en formato de fecha para la comparación de antigüedad
-            df['Fecha'] = pd.to_datetime(df['Fecha'], errors='coerce')
-        df.to_json(DB_PATH, orient='records', date_format='iso')
+        return obtener_cache_datos().obtener()
     except Exception as e:
-        st.error(f"Error al guardar la base de datos: {e}")
+        st.error(f"Error al cargar la base de datos histórica: {e}")
+        return pd.DataFrame()
 
-# --- Carga de Tokens FCM Persistentes ---
-# Carga el diccionario de tokens de FCM desde un archivo JSON.
-def cargar_fcm_tokens():
-    if os.path.exists(FCM_TOKENS_PATH):
-        try:
-            with open(FCM_TOKENS_PATH, "r") as f:
-                return json.load(f)
-        except Exception as e:
-            st.warning(f"Error al cargar tokens FCM desde '{FCM_TOKENS_PATH}': {e}. Se iniciará con tokens vacíos.")
-            return {}
-    return {}
-
-# --- Guardado de Tokens FCM Persistentes ---
-# Guarda el diccionario de tokens de FCM en un archivo JSON.
-def guardar_fcm_tokens(tokens_dict):
+# --- Versión de la Base de Datos ---
+# Identifica la versión actual de la base por la fecha de modificación del archivo.
+def version_base_datos():
+    try:
+        return os.stat(DB_PATH).st_mtime_ns
+    except OSError:
+        return None
+
+# --- Índice de Destinos (compartido entre sesiones) ---
+# Construye el índice de número de destino -> filas una sola vez por versión de la base y lo
+# comparte entre todas las sesiones del proceso. 'version' solo sirve como clave de caché.
+# Si el backend consulta en el motor (SQLite), el propio almacén resuelve las búsquedas por
+# destino con su índice y la base no se carga en memoria.
+@st.cache_resource(show_spinner=False, max_entries=1)
+def obtener_indice_destinos(version):
+    if ALMACEN_DB.consultas_en_motor:
+        return ALMACEN_DB
+    return IndiceDestinos(cargar_datos())
+
+# --- Endpoint JSON de Consulta (opcional) ---
+# Si se configura API_PUERTO en los secretos, se levanta una sola vez por proceso el endpoint
+# de solo lectura GET /destino/<número> (ver lemargo/api.py), que comparte la caché de la base
+# con la app. Permite que la PWA consulte un destino sin abrir una sesión de Streamlit.
+# Escucha solo en 127.0.0.1 (para un proxy inverso en la misma máquina) salvo que API_HOST
+# indique otra interfaz, p. ej. "0.0.0.0" para exponerlo directamente.
+API_PUERTO = st.secrets.get("API_PUERTO")
+API_HOST = st.secrets.get("API_HOST", HOST_POR_OMISION)
+
+@st.cache_resource(show_spinner=False)
+def obtener_servidor_api(puerto, host=HOST_POR_OMISION):
+    servidor = crear_servidor(ConsultaDestinos(ALMACEN_DB, obtener_cache_datos()), host=host, puerto=int(puerto))
+    iniciar_en_hilo(servidor)
+    return servidor
+
+# --- Agregados del Dashboard (compartidos entre sesiones) ---
+@st.cache_resource(show_spinner=False)
+def obtener_agregados():
+    return AgregadosDashboard(AGREGADOS_PATH)
+
+# Reconstruye los agregados desde la base completa si no están sincronizados con la versión actual.
+def sincronizar_agregados():
+    agregados = obtener_agregados()
+    version = version_base_datos()
+    if agregados.version() != str(version):
+        agregados.reconstruir(cargar_datos(), version)
+    return agregados
+
+# --- Suscripciones FCM Persistentes ---
+# Devuelve el almacén de suscripciones (destino <-> token) compartido por todo el proceso.
+# La primera vez importa el antiguo 'fcm_tokens.json' si existe.
+@st.cache_resource(show_spinner=False)
+def obtener_suscripciones():
+    suscripciones = AlmacenSuscripciones(SUSCRIPCIONES_PATH)
     try:
-        with open(FCM_TOKENS_PATH, "w") as f:
-            json.dump(tokens_dict, f, indent=4)
+        suscripciones.migrar_desde_json(FCM_TOKENS_PATH)
     except Exception as e:
-        st.error(f"Error al guardar tokens FCM en '{FCM_TOKENS_PATH}': {e}")
+        st.warning(f"Error al migrar tokens FCM desde '{FCM_TOKENS_PATH}': {e}")
+    return suscripciones
+
+# --- Eliminación de Tokens FCM Inválidos ---
+# Quita del almacén los tokens que FCM reporta como no registrados.
+def eliminar_tokens_fcm(tokens_invalidos):
+    obtener_suscripciones().eliminar_tokens(tokens_invalidos)
+
+# --- Despachador FCM ---
+# Lo crea el trabajador de la cola en su primer envío: ahí se importa e inicializa Firebase Admin.
+def crear_despachador_fcm():
+    inicializar_firebase(st.secrets.get("FIREBASE_SERVICE_ACCOUNT"))
+    return DespachadorNotificaciones(max_hilos=FCM_MAX_HILOS)
+
+# --- Cola de Notificaciones en Segundo Plano ---
+# Crea una sola vez por proceso la cola persistente y el hilo que la vacía, de modo que
+# el envío de notificaciones no bloquea la carga del Excel y sobrevive a las re-ejecuciones.
+# Solo la piden el panel de administración y las cargas: la página de consulta no arranca el
+# trabajador, que importaría Firebase Admin en cuanto haya avisos pendientes. Para enviar los
+# pendientes de una ejecución anterior sin entrar al panel: python -m lemargo trabajador.
+@st.cache_resource(show_spinner=False)
+def obtener_cola_notificaciones():
+    cola = ColaNotificaciones(COLA_NOTIFICACIONES_PATH)
+    trabajador = TrabajadorCola(
+        cola,
+        crear_despachador=crear_despachador_fcm,
+        al_invalidar_tokens=eliminar_tokens_fcm,
+    ).iniciar()
+    return cola, trabajador
+
+# --- Contexto de una Carga ---
+# Almacenes compartidos del proceso sobre los que opera ejecutar_carga (ver lemargo/pipeline.py).
+def contexto_carga():
+    cola, _ = obtener_cola_notificaciones()
+    return ContextoCarga(
+        almacen=ALMACEN_DB,
+        cache=obtener_cache_datos(),
+        agregados=obtener_agregados(),
+        suscripciones=obtener_suscripciones(),
+        cola=cola,
+        historial=obtener_historial(),
+        ruta_hash=HASH_PATH,
+        ruta_metricas=METRICAS_PATH,
+    )
 
 # --- Lógica de Inicio de Sesión de Administrador ---
 # Muestra un formulario de inicio de sesión para el administrador.
@@ -294,55 +272,43 @@ def login():
 # --- Dashboard de Administración ---
 # Muestra visualizaciones y análisis de los datos cargados, con filtros por producto, estado y fecha.
 def admin_dashboard():
-    df = cargar_datos()
-    if df.empty:
+    if not ALMACEN_DB.existe():
         st.info("Aún no hay base de datos cargada.")
         return
 
-    st.subheader("📊 Visualización y análisis de datos")
+    import altair as alt # Solo el dashboard usa gráficas: se importa aquí para no cargarlo en la consulta.
 
-    columnas_disponibles = df.columns.tolist()
+    st.subheader("📊 Visualización y análisis de datos")
 
-    if 'Fecha' in columnas_disponibles:
-        df['Fecha'] = pd.to_datetime(df['Fecha']).dt.date
-    else:
-        st.warning("La columna 'Fecha' no se encontró en la base de datos. No se podrá filtrar por fecha.")
+    # Las gráficas y los filtros se calculan sobre los agregados materializados, no sobre la base completa.
+    try:
+        agregados = sincronizar_agregados()
+    except KeyError as e:
+        st.warning(f"La base de datos no tiene las columnas necesarias para el dashboard: {e}")
         return
 
     st.markdown("#### Filtros")
     col1, col2, col3 = st.columns(3)
 
     with col1:
-        if 'Producto' in columnas_disponibles:
-            productos = df['Producto'].unique().tolist()
-            productos_seleccionados = st.multiselect("Filtrar por Producto", options=productos, default=productos)
-        else:
-            productos_seleccionados = []
-            st.warning("Columna 'Producto' no encontrada.")
+        productos = agregados.valores('producto')
+        productos_seleccionados = st.multiselect("Filtrar por Producto", options=productos, default=productos)
 
     with col2:
-        if 'Estado de atención' in columnas_disponibles:
-            estados = df['Estado de atención'].unique().tolist()
-            estados_seleccionados = st.multiselect("Filtrar por Estado", options=estados, default=estados)
-        else:
-            estados_seleccionados = []
-            st.warning("Columna 'Estado de atención' no encontrada.")
+        estados = agregados.valores('estado')
+        estados_seleccionados = st.multiselect("Filtrar por Estado", options=estados, default=estados)
 
     with col3:
-        fechas = sorted(df['Fecha'].unique().tolist(), reverse=True)
+        fechas = [datetime.date.fromisoformat(fecha) for fecha in agregados.fechas()]
         if fechas:
             fecha_seleccionada = st.selectbox("Selecciona una fecha", options=fechas, format_func=lambda x: x.strftime('%d/%m/%Y'))
         else:
             st.warning("No hay fechas disponibles para filtrar.")
             return
 
-    df_filtrado = df[df['Fecha'] == fecha_seleccionada]
-    if productos_seleccionados:
-        df_filtrado = df_filtrado[df_filtrado['Producto'].isin(productos_seleccionados)]
-    if estados_seleccionados:
-        df_filtrado = df_filtrado[df_filtrado['Estado de atención'].isin(estados_seleccionados)]
-
-    if df_filtrado.empty:
+    fecha_iso = fecha_seleccionada.isoformat()
+    conteo_estado = agregados.conteo_por('estado', fecha_iso, productos_seleccionados, estados_seleccionados)
+    if conteo_estado.empty:
         st.warning("No hay datos que coincidan con los filtros seleccionados.")
         return
 
@@ -350,26 +316,24 @@ def admin_dashboard():
     st.subheader(f"Análisis del día: {fecha_seleccionada.strftime('%d/%m/%Y')}")
 
     # Gráfica 1: ESTADO DE ATENCIÓN (del día filtrado)
-    if 'Estado de atención' in df_filtrado.columns:
-        st.markdown("#### Conteo por Estado de atención")
-        conteo_estado = df_filtrado['Estado de atención'].value_counts().reset_index()
-        conteo_estado.columns = ['Estado', 'Cantidad']
-
-        chart_estado = alt.Chart(conteo_estado).mark_bar(
-            cornerRadiusTopLeft=3,
-            cornerRadiusTopRight=3,
-            color='#4e79a7'
-        ).encode(
-            x=alt.X('Estado', sort='-y', title='Estado de atención'),
-            y=alt.Y('Cantidad', title='Número de registros'),
-            tooltip=['Estado', 'Cantidad'],
-        ).properties(title='Distribución por Estado')
-        st.altair_chart(chart_estado, use_container_width=True)
+    st.markdown("#### Conteo por Estado de atención")
+    conteo_estado.columns = ['Estado', 'Cantidad']
+
+    chart_estado = alt.Chart(conteo_estado).mark_bar(
+        cornerRadiusTopLeft=3,
+        cornerRadiusTopRight=3,
+        color='#4e79a7'
+    ).encode(
+        x=alt.X('Estado', sort='-y', title='Estado de atención'),
+        y=alt.Y('Cantidad', title='Número de registros'),
+        tooltip=['Estado', 'Cantidad'],
+    ).properties(title='Distribución por Estado')
+    st.altair_chart(chart_estado, use_container_width=True)
 
     # Gráfica 2: CONTEO POR DESTINO (del día filtrado)
-    if 'Destino' in df_filtrado.columns:
+    conteo_destino = agregados.conteo_por('destino', fecha_iso, productos_seleccionados, estados_seleccionados)
+    if not conteo_destino.empty:
         st.markdown("#### Conteo por Destino")
-        conteo_destino = df_filtrado['Destino'].value_counts().reset_index()
         conteo_destino.columns = ['Destino', 'Cantidad']
 
         chart_destino = alt.Chart(conteo_destino).mark_bar(
@@ -385,154 +349,169 @@ def admin_dashboard():
 
     st.markdown("---")
     st.markdown("#### 📝 Datos filtrados del día")
-    st.dataframe(df_filtrado)
+    # Solo el detalle del día necesita la base: se filtra por rango de fecha, sin convertir toda la columna.
+    # Con el backend SQLite la consulta usa el índice por fecha y no carga la base.
+    if ALMACEN_DB.consultas_en_motor:
+        df_filtrado = ALMACEN_DB.filas_del_dia(fecha_seleccionada, productos_seleccionados, estados_seleccionados)
+    else:
+        df = cargar_datos()
+        inicio_dia = pd.Timestamp(fecha_seleccionada)
+        df_filtrado = df[(df['Fecha'] >= inicio_dia) & (df['Fecha'] < inicio_dia + pd.Timedelta(days=1))]
+        if productos_seleccionados:
+            df_filtrado = df_filtrado[df_filtrado['Producto'].isin(productos_seleccionados)]
+        if estados_seleccionados:
+            df_filtrado = df_filtrado[df_filtrado['Estado de atención'].isin(estados_seleccionados)]
+    df_filtrado = df_filtrado.assign(Fecha=df_filtrado['Fecha'].dt.date)
+    # Oculta las columnas internas (p. ej. '_clave') que se guardan junto con la base.
+    st.dataframe(df_filtrado.loc[:, ~df_filtrado.columns.str.startswith('_')])
 
     # --- Análisis Histórico Acumulado (TOP 10) ---
     st.markdown("---")
     st.subheader("🏆 Análisis histórico - Top 10 Destinos")
     st.info("Estas gráficas se basan en **todos los datos del archivo histórico**.")
 
-    if 'Destino' in df.columns and 'Estado de atención' in df.columns:
-        # 1. TOP 10 FACTURADOS
-        df_historico_facturados = df[df['Estado de atención'].str.contains('FACTURADO', case=False, na=False)]
-        if not df_historico_facturados.empty:
-            top_10_facturados = df_historico_facturados['Destino'].value_counts().nlargest(10).reset_index()
-            top_10_facturados.columns = ['Destino', 'Cantidad']
-            st.markdown("#### Top 10 Destinos más facturados (Histórico)")
-            st.dataframe(top_10_facturados, use_container_width=True)
-
-            chart_top_facturados = alt.Chart(top_10_facturados).mark_bar(
-                color='#4caf50' # Verde
-            ).encode(
-                x=alt.X('Cantidad', title='Número de Facturaciones'),
-                y=alt.Y('Destino', sort='-x', title='Destino'),
-                tooltip=['Destino', 'Cantidad']
-            ).properties(
-                title='Top 10 Facturados Acumulado'
-            )
-            st.altair_chart(chart_top_facturados, use_container_width=True)
-
-        # 2. TOP 10 CANCELADOS
-        df_historico_cancelados = df[df['Estado de atención'].str.contains('CANCELADO', case=False, na=False)]
-        if not df_historico_cancelados.empty:
-            top_10_cancelados = df_historico_cancelados['Destino'].value_counts().nlargest(10).reset_index()
-            top_10_cancelados.columns = ['Destino', 'Cantidad']
-            st.markdown("#### Top 10 Destinos más cancelados (Histórico)")
-            st.dataframe(top_10_cancelados, use_container_width=True)
-
-            chart_top_cancelados = alt.Chart(top_10_cancelados).mark_bar(
-                color='#f44336' # Rojo
-            ).encode(
-                x=alt.X('Cantidad', title='Número de Cancelaciones'),
-                y=alt.Y('Destino', sort='-x', title='Destino'),
-                tooltip=['Destino', 'Cantidad']
-            ).properties(
-                title='Top 10 Cancelados Acumulado'
-            )
-            st.altair_chart(chart_top_cancelados, use_container_width=True)
-
-        # 3. TOP 10 CON DEMORA (no facturados y no cancelados)
-        df_historico_demorados = df[~df['Estado de atención'].str.contains('FACTURADO|CANCELADO', case=False, na=False)]
-        if not df_historico_demorados.empty:
-            top_10_demorados = df_historico_demorados['Destino'].value_counts().nlargest(10).reset_index()
-            top_10_demorados.columns = ['Destino', 'Cantidad']
-            st.markdown("#### Top 10 Destinos con más demora (Histórico)")
-            st.dataframe(top_10_demorados, use_container_width=True)
-
-            chart_top_demorados = alt.Chart(top_10_demorados).mark_bar(
-                color='#ff9800' # Naranja
-            ).encode(
-                x=alt.X('Cantidad', title='Número de Pendientes'),
-                y=alt.Y('Destino', sort='-x', title='Destino'),
-                tooltip=['Destino', 'Cantidad']
-            ).properties(
-                title='Top 10 Pendientes Acumulado'
-            )
-            st.altair_chart(chart_top_demorados, use_container_width=True)
-
-# --- Lógica de Detección de Cambios y Notificaciones ---
-# Compara el DataFrame antiguo con el nuevo para detectar cambios de estado
-# y envía notificaciones a los tokens de FCM guardados.
-def check_and_notify_on_change(old_df, new_df):
-    try:
-        st.session_state.messages.append({'type': 'warning', 'text': "⚠️ Iniciando detección de cambios..."})
-        
-        # Función auxiliar para limpiar y estandarizar DataFrames.
-        def clean_dataframe(df):
-            df_cleaned = df.copy()
-            for col in ['Destino', 'Folio pedido', 'Producto', 'Estado de atención']:
-                if col in df_cleaned.columns:
-                    df_cleaned[col] = df_cleaned[col].astype(str).str.strip().str.upper()
-            
-            if 'Fecha' in df_cleaned.columns:
-                df_cleaned['Fecha'] = pd.to_datetime(df['Fecha'], errors='coerce').dt.strftime('%Y-%m-%d')
-            
-            return df_cleaned
+    # 1. TOP 10 FACTURADOS
+    top_10_facturados = agregados.top_destinos(CLASE_FACTURADO, limite=10)
+    if not top_10_facturados.empty:
+        top_10_facturados.columns = ['Destino', 'Cantidad']
+        st.markdown("#### Top 10 Destinos más facturados (Histórico)")
+        st.dataframe(top_10_facturados, use_container_width=True)
 
-        old_df_clean = clean_dataframe(old_df)
-        new_df_clean = clean_dataframe(new_df)
-        
-        st.session_state.messages.append({'type': 'info', 'text': f"Diagnóstico - Filas en archivo antiguo: {len(old_df_clean)}"})
-        st.session_state.messages.append({'type': 'info', 'text': f"Diagnóstico - Filas en archivo nuevo: {len(new_df_clean)}"})
+        chart_top_facturados = alt.Chart(top_10_facturados).mark_bar(
+            color='#4caf50' # Verde
+        ).encode(
+            x=alt.X('Cantidad', title='Número de Facturaciones'),
+            y=alt.Y('Destino', sort='-x', title='Destino'),
+            tooltip=['Destino', 'Cantidad']
+        ).properties(
+            title='Top 10 Facturados Acumulado'
+        )
+        st.altair_chart(chart_top_facturados, use_container_width=True)
 
-        cambios_detectados = []
-        # Define las columnas que forman la clave única para identificar un registro.
-        comparison_key_columns = ['Destino', 'Folio pedido', 'Producto', 'Fecha']
-        old_df_indexed = old_df_clean.set_index(comparison_key_columns)
-        
-        for index, row in new_df_clean.iterrows():
-            try:
-                key = (row['Destino'], row['Folio pedido'], row['Producto'], row['Fecha'])
-                
-                if key in old_df_indexed.index:
-                    old_status = old_df_indexed.loc[key, 'Estado de atención']
-                    new_status = row['Estado de atención']
-                    
-                    if old_status != new_status:
-                        cambios_detectados.append({ 
-                            'Destino': row['Destino'],
-                            'Folio pedido': row['Folio pedido'],
-                            'Fecha': row['Fecha'],
-                            'Producto': row['Producto'],
-                            'Estado de atención_old': old_status,
-                            'Estado de atención_new': new_status
-                        })
-            except KeyError:
-                pass
-
-        cambios_df = pd.DataFrame(cambios_detectados)
-        
-        if not cambios_df.empty:
-            st.session_state.messages.append({'type': 'info', 'text': f"🔍 Se detectaron {len(cambios_df)} cambios de estatus."})
-            st.warning("🔔 Enviando notificaciones...")
-            
-            # Carga los tokens FCM persistentes para enviar notificaciones
-            fcm_tokens_persisted = cargar_fcm_tokens()
-            if not fcm_tokens_persisted:
-                st.warning("⚠️ No se encontraron tokens de FCM guardados para notificar.")
-                return
-
-            # Itera sobre los cambios detectados y envía una notificación por cada uno.
-            for _, row in cambios_df.iterrows():
-                destino = row['Destino']
-                destino_num = str(destino).split('-')[0].str.strip().upper()
-                
-                # Si existe un token para este destino, envía la notificación.
-                if destino_num in fcm_tokens_persisted: # Usa los tokens cargados desde el archivo
-                    token = fcm_tokens_persisted[destino_num]
-                    estado_anterior = row['Estado de atención_old']
-                    estado_nuevo = row['Estado de atención_new']
-                    
-                    titulo = f"Actualización en Destino: {destino}"
-                    mensaje = f"Estado cambió de '{estado_anterior}' a '{estado_nuevo}'"
-                    
-                    enviar_notificacion_por_token(token, titulo, mensaje)
-                else:
-                    st.warning(f"No se encontró un token para el destino {destino_num}. No se enviará notificación.")
+    # 2. TOP 10 CANCELADOS
+    top_10_cancelados = agregados.top_destinos(CLASE_CANCELADO, limite=10)
+    if not top_10_cancelados.empty:
+        top_10_cancelados.columns = ['Destino', 'Cantidad']
+        st.markdown("#### Top 10 Destinos más cancelados (Histórico)")
+        st.dataframe(top_10_cancelados, use_container_width=True)
+
+        chart_top_cancelados = alt.Chart(top_10_cancelados).mark_bar(
+            color='#f44336' # Rojo
+        ).encode(
+            x=alt.X('Cantidad', title='Número de Cancelaciones'),
+            y=alt.Y('Destino', sort='-x', title='Destino'),
+            tooltip=['Destino', 'Cantidad']
+        ).properties(
+            title='Top 10 Cancelados Acumulado'
+        )
+        st.altair_chart(chart_top_cancelados, use_container_width=True)
+
+    # 3. TOP 10 CON DEMORA (no facturados y no cancelados)
+    top_10_demorados = agregados.top_destinos(CLASE_DEMORA, limite=10)
+    if not top_10_demorados.empty:
+        top_10_demorados.columns = ['Destino', 'Cantidad']
+        st.markdown("#### Top 10 Destinos con más demora (Histórico)")
+        st.dataframe(top_10_demorados, use_container_width=True)
+
+        chart_top_demorados = alt.Chart(top_10_demorados).mark_bar(
+            color='#ff9800' # Naranja
+        ).encode(
+            x=alt.X('Cantidad', title='Número de Pendientes'),
+            y=alt.Y('Destino', sort='-x', title='Destino'),
+            tooltip=['Destino', 'Cantidad']
+        ).properties(
+            title='Top 10 Pendientes Acumulado'
+        )
+        st.altair_chart(chart_top_demorados, use_container_width=True)
+
+# --- Resultado de una Carga ---
+# Convierte el resultado de ejecutar_carga (ver lemargo/pipeline.py) en los mensajes del
+# historial de acciones y despierta al trabajador de la cola si se encolaron avisos.
+def mensajes_de_carga(resultado):
+    if resultado.identico:
+        return [{'type': 'info', 'text': "ℹ️ El archivo es idéntico al último cargado. No se realizaron cambios."}]
+
+    fusion = resultado.fusion
+    mensajes = [{'type': 'info', 'text': f"Registros insertados: {fusion.insertados}, actualizados: {fusion.actualizados}, sin cambios: {fusion.sin_cambios}, expirados por retención: {fusion.expirados}"}]
+    if not resultado.guardado:
+        mensajes.append({'type': 'success', 'text': "✅ Todas las filas coinciden con la base histórica. No fue necesario actualizarla."})
+        return mensajes + [{'type': 'warning', 'text': f"⚠️ {advertencia}"} for advertencia in resultado.advertencias]
+
+    if resultado.cambios is not None:
+        cambios = resultado.cambios
+        mensajes += [
+            {'type': 'warning', 'text': "⚠️ Detección de cambios:"},
+            {'type': 'info', 'text': f"Diagnóstico - Registros previos afectados: {len(fusion.anteriores)}"},
+            {'type': 'info', 'text': f"Diagnóstico - Registros vigentes del archivo nuevo: {len(fusion.nuevos_vigentes)}"},
+            {'type': 'info', 'text': f"Diagnóstico - Registros nuevos: {len(cambios.agregados)}, eliminados: {len(cambios.eliminados)}"},
+        ]
+        if not resultado.cambios_estado:
+            mensajes.append({'type': 'success', 'text': "✅ No se detectaron cambios en el estado de los destinos."})
         else:
-            st.session_state.messages.append({'type': 'success', 'text': "✅ No se detectaron cambios en el estado de los destinos."})
-    except Exception as e:
-        st.session_state.messages.append({'type': 'error', 'text': f"❌ Error en la lógica de notificación: {e}"})
+            mensajes.append({'type': 'info', 'text': f"🔍 Se detectaron {resultado.cambios_estado} cambios de estatus."})
+            if resultado.notificaciones_encoladas:
+                obtener_cola_notificaciones()[1].despertar()
+                mensajes.append({'type': 'success', 'text': f"🔔 {resultado.notificaciones_encoladas} notificaciones encoladas para envío en segundo plano."})
+            if resultado.destinos_sin_token and not resultado.notificaciones_encoladas:
+                mensajes.append({'type': 'warning', 'text': "⚠️ No hay tokens de FCM suscritos a los destinos con cambios."})
+            elif resultado.destinos_sin_token:
+                mensajes.append({'type': 'info', 'text': f"{len(resultado.destinos_sin_token)} destinos con cambios no tienen token de notificación."})
+
+    mensajes += [{'type': 'error', 'text': f"❌ {advertencia}"} for advertencia in resultado.advertencias]
+    mensajes.append({'type': 'success', 'text': "✅ Base de datos histórica actualizada. El archivo subido es la nueva base."})
+    return mensajes
+
+# --- Lectura de los Excel (con caché por contenido) ---
+# Lee, valida y normaliza todas las hojas de los libros subidos, en paralelo (ver leer_libros).
+# La clave de caché son los nombres y hashes SHA-256 de los archivos; '_archivos' (nombre, bytes)
+# no se usa como clave para que Streamlit no tenga que hashear los bytes en cada re-ejecución.
+@st.cache_data(show_spinner="Leyendo archivos Excel...", max_entries=3)
+def procesar_excel(claves, _archivos):
+    return leer_libros(_archivos)
+
+# --- Desglose de Tiempos de Carga ---
+# Muestra cuánto tardó cada etapa de una carga reciente y cómo evolucionan las etapas entre
+# cargas (junto al tamaño de la base), a partir de las mediciones guardadas en el historial.
+def mostrar_desglose_tiempos():
+    registros = [
+        {'fecha': registro['fecha'], 'filas_base': registro.get('filas_base'), **registro['detalle']}
+        for registro in obtener_historial().pagina(0, CARGAS_EN_DESGLOSE).to_dict('records')
+        if registro['detalle'].get('tramos')
+    ]
+    if not registros:
+        st.info("Aún no hay cargas con tiempos registrados.")
+        return
+
+    def etiqueta(i):
+        registro = registros[i]
+        try:
+            fecha = datetime.datetime.fromisoformat(registro['fecha']).strftime('%d/%m/%Y - %H:%M:%S')
+        except ValueError:
+            fecha = registro['fecha']
+        return f"{fecha} · {sum(registro['tramos'].values()):.2f} s"
+
+    elegido = registros[st.selectbox("Carga", range(len(registros)), format_func=etiqueta, key="desglose_carga")]
+    st.dataframe(
+        desglose(elegido['tramos']),
+        use_container_width=True,
+        column_config={
+            'segundos': st.column_config.NumberColumn("Segundos", format="%.3f"),
+            'porcentaje': st.column_config.ProgressColumn("% del total", min_value=0, max_value=100, format="%.0f%%"),
+        },
+    )
+    if elegido.get('contadores'):
+        st.caption(" · ".join(f"{nombre.replace('_', ' ')}: {valor}" for nombre, valor in elegido['contadores'].items()))
+
+    # Evolución por etapa, de la carga más antigua a la más reciente.
+    tendencia = tabla_tramos(registros[::-1]).rename(columns=ETIQUETAS_TRAMOS)
+    if len(tendencia) > 1:
+        st.line_chart(tendencia)
+        tendencia.insert(0, "Filas en la base", [registro['filas_base'] for registro in registros[::-1]])
+        st.dataframe(tendencia, use_container_width=True)
+
+    if os.path.exists(METRICAS_PATH):
+        with open(METRICAS_PATH, 'rb') as f:
+            st.download_button("⬇️ Descargar métricas (JSONL)", f.read(), file_name=METRICAS_PATH, mime="application/jsonl")
 
 # --- Panel de Administración ---
 # Permite al administrador subir archivos Excel para actualizar la base de datos
@@ -545,106 +524,47 @@ def admin_panel():
 
     col1, col2 = st.columns([3, 1])
 
-    # Carga el último DataFrame conocido para la comparación y como base para la fusión.
-    if 'last_df' not in st.session_state:
-        st.session_state.last_df = pd.DataFrame()
-        if os.path.exists(DB_PATH):
-            try:
-                st.session_state.last_df = cargar_datos()
-            except Exception as e:
-                st.session_state.messages.append({'type': 'error', 'text': f"Error al cargar la base de datos histórica: {e}"})
-                st.session_state.last_df = pd.DataFrame()
-                st.rerun()
-
     with col1:
-        uploaded_file = st.file_uploader("Selecciona archivo (.xlsx)", type=["xlsx"])
+        # Se pueden subir varios libros (p. ej. uno por turno o por planta): todas sus hojas se integran
+        # en una sola carga.
+        uploaded_files = st.file_uploader("Selecciona archivos (.xlsx)", type=["xlsx"], accept_multiple_files=True)
         
-        # Muestra el tamaño actual de la base de datos JSON.
-        if os.path.exists(DB_PATH):
-            file_size_bytes = os.path.getsize(DB_PATH)
+        # Muestra el tamaño actual de la base de datos.
+        if ALMACEN_DB.existe():
+            file_size_bytes = ALMACEN_DB.tamano_bytes()
             file_size_mb = file_size_bytes / (1024 * 1024)
             st.markdown(f"💾 **Tamaño actual de la base de datos:** {file_size_mb:.2f} MB")
             
-        if uploaded_file is not None:
+        if uploaded_files:
             try:
-                # Lee el nuevo archivo Excel cargado.
-                df_nuevo_excel = pd.read_excel(
-                    uploaded_file,
-                    engine='openpyxl',
-                    sheet_name=0,
-                    dtype={
-                        'Destino': str,
-                        'Fecha': 'datetime64[ns]',
-                        'Producto': str,
-                        'Folio pedido': str,
-                        'Estado de atención': str
-                    }
-                )
-
-                st.write("Vista previa del archivo cargado:")
-                st.dataframe(df_nuevo_excel.head())
+                # Lee los libros por bloques. El resultado queda en caché por el hash de su contenido,
+                # así que las re-ejecuciones de la página no vuelven a leerlos.
+                archivos = [(archivo.name, archivo.getvalue()) for archivo in uploaded_files]
+                ingesta = procesar_excel(tuple((nombre, hash_contenido(datos)) for nombre, datos in archivos), archivos)
+
+                st.write("Vista previa de los archivos cargados:")
+                st.dataframe(ingesta.vista_previa)
+                st.caption(f"{ingesta.filas} filas leídas de {len(ingesta.fuentes)} hojas en {ingesta.bloques} bloques ({ingesta.motor})."
+                           + (f" {ingesta.filas_descartadas} filas sin 'Destino' descartadas." if ingesta.filas_descartadas else ""))
+                if len(ingesta.fuentes) > 1:
+                    st.dataframe(pd.DataFrame(ingesta.fuentes), hide_index=True)
+                for omitida in ingesta.omitidas:
+                    st.caption(f"Hoja '{omitida['hoja']}' de {omitida['archivo']} omitida: {omitida['motivo']}")
 
                 if st.button("Cargar y actualizar base histórica"):
                     st.session_state.messages = [] # Limpiar mensajes anteriores para la nueva acción
-                    
-                    # Carga la base de datos actual para la comparación de cambios.
-                    df_golden_record_old = cargar_datos() 
-
-                    # --- Lógica de Fusión y Retención de Datos ---
-                    # Define las columnas clave para identificar registros únicos.
-                    id_cols = ['Destino', 'Folio pedido', 'Producto', 'Fecha']
-
-                    # Limpia el DataFrame del Excel para asegurar consistencia en las claves.
-                    df_nuevo_excel_clean = df_nuevo_excel.copy()
-                    for col in ['Destino', 'Folio pedido', 'Producto', 'Estado de atención']:
-                        if col in df_nuevo_excel_clean.columns:
-                            df_nuevo_excel_clean[col] = df_nuevo_excel_clean[col].astype(str).str.strip().str.upper()
-                    if 'Fecha' in df_nuevo_excel_clean.columns:
-                        df_nuevo_excel_clean['Fecha'] = pd.to_datetime(df_nuevo_excel_clean['Fecha'], errors='coerce')
-
-                    # Si hay una base de datos existente, fusionarla.
-                    if not df_golden_record_old.empty:
-                        # Asegura que las fechas en df_golden_record_old sean datetime para la comparación.
-                        if 'Fecha' in df_golden_record_old.columns:
-                            df_golden_record_old['Fecha'] = pd.to_datetime(df_golden_record_old['Fecha'], errors='coerce')
-
-                        # Elimina duplicados de la base de datos antigua que también están en el nuevo Excel,
-                        # dando prioridad a los datos del nuevo Excel.
-                        df_merged = pd.concat([df_golden_record_old, df_nuevo_excel_clean]).drop_duplicates(subset=id_cols, keep='last')
-                    else:
-                        df_merged = df_nuevo_excel_clean
-
-                    # --- Lógica de Eliminación por Retención ---
-                    # Identifica registros 'FACTURADO' o 'CANCELADO' que han excedido el período de retención.
-                    today = pd.to_datetime(datetime.datetime.now(tz=cdmx_tz).date())
-                    
-                    # Registros que NO están FACTURADOS/CANCELADOS O que están dentro del período de retención.
-                    df_final_golden_record = df_merged[
-                        (~df_merged['Estado de atención'].str.contains('FACTURADO|CANCELADO', case=False, na=False)) |
-                        ((today - df_merged['Fecha']).dt.days <= RETENTION_DAYS)
-                    ].copy() # Usar .copy() para evitar SettingWithCopyWarning
-                    
-                    # Asegura que las fechas se conviertan a string ISO antes de guardar en JSON
-                    if 'Fecha' in df_final_golden_record.columns:
-                        df_final_golden_record['Fecha'] = df_final_golden_record['Fecha'].dt.strftime('%Y-%m-%d')
-
-
-                    # --- Detección de Cambios y Notificación ---
-                    # Compara el estado anterior con el estado final después de la fusión y limpieza.
-                    if not df_golden_record_old.empty:
-                        check_and_notify_on_change(df_golden_record_old, df_final_golden_record)
-                    
-                    # Guarda la base de datos final procesada.
-                    guardar_datos(df_final_golden_record)
-                    st.session_state.last_df = df_final_golden_record.copy()
-
-                    # Registra la actualización en el historial.
-                    ahora = datetime.datetime.now(tz=cdmx_tz).isoformat()
-                    guardar_historial(ahora)
-
-                    st.session_state.messages.append({'type': 'success', 'text': "✅ Base de datos histórica actualizada. El archivo subido es la nueva base."})
-
-                    st.cache_data.clear() # Limpia la caché de Streamlit para recargar datos.
+
+                    # Toda la carga (fusionar, comparar, guardar y encolar avisos) ocurre en lemargo/pipeline.py con el
+                    # bloqueo de la base, así que dos administradores que suben a la vez (o una carga desde la línea de
+                    # comandos) se ejecutan uno tras otro y el segundo parte de la base ya actualizada. Los lectores no
+                    # toman el bloqueo: siempre ven un archivo completo. Un contenido idéntico al último no se procesa.
+                    resultado = ejecutar_carga(
+                        contexto_carga(), ingesta, dias_retencion=RETENTION_DAYS, espera_bloqueo=BLOQUEO_ESPERA_S,
+                        fecha=datetime.datetime.now(tz=cdmx_tz).isoformat(),
+                    )
+                    st.session_state.messages.extend(mensajes_de_carga(resultado))
+
+                    # No hace falta limpiar cachés: la base compartida ya se recargó al final de la carga.
                     st.rerun() # Fuerza un re-ejecución de la aplicación.
 
             except Exception as e:
@@ -653,14 +573,30 @@ def admin_panel():
                 
         with col2:
             with st.expander("📅 Historial de actualizaciones"):
-                historial = cargar_historial()
-                if historial:
-                    for i, fecha in enumerate(historial[::-1], 1):
+                historial = obtener_historial()
+                total_actualizaciones = historial.total()
+                if total_actualizaciones:
+                    # Solo se lee la página visible, de la más reciente a la más antigua.
+                    paginas = (total_actualizaciones - 1) // HISTORIAL_POR_PAGINA + 1
+                    pagina = st.number_input("Página", min_value=1, max_value=paginas, value=1, step=1) - 1 if paginas > 1 else 0
+                    registros = historial.pagina(pagina, HISTORIAL_POR_PAGINA)
+                    for i, registro in enumerate(registros.to_dict('records'), pagina * HISTORIAL_POR_PAGINA + 1):
                         try:
-                            fecha_dt = datetime.datetime.fromisoformat(fecha)
+                            fecha_dt = datetime.datetime.fromisoformat(registro['fecha'])
                             st.write(f"{i}. {fecha_dt.strftime('%d/%m/%Y - %H:%M:%S Hrs.')} CDMX")
                         except ValueError:
                             st.write(f"{i}. (fecha inválida)")
+                        if registro['detalle'].get('identico'):
+                            st.caption("Archivo idéntico al último cargado · sin cambios")
+                        elif pd.notna(registro.get('filas_archivo')):
+                            st.caption(
+                                f"{registro['filas_archivo']:.0f} filas leídas · {registro['insertados']:.0f} insertados · "
+                                f"{registro['actualizados']:.0f} actualizados · {registro['expirados']:.0f} expirados · "
+                                f"{registro['cambios_estado']:.0f} cambios de estado · "
+                                f"{registro['notificaciones_encoladas']:.0f} notificaciones · {registro['duracion_s']:.1f} s"
+                            )
+                    if paginas > 1:
+                        st.caption(f"Página {pagina + 1} de {paginas} ({total_actualizaciones} actualizaciones)")
                 else:
                     st.write("No hay actualizaciones aún.")
         
@@ -684,12 +620,14 @@ def admin_panel():
             st.info("No hay acciones recientes.")
         # --- Fin del Historial de Mensajes ---
 
+        with st.expander("⏱️ Desglose de tiempos de carga"):
+            mostrar_desglose_tiempos()
+
         # --- ELIMINADO: admin_dashboard() se ha movido a su propia opción en el menú principal ---
         # admin_dashboard() 
         
         if st.button("Cerrar sesión"):
             st.session_state.logged_in = False
-            st.session_state.last_df = pd.DataFrame()
             st.session_state.messages = []
             st.rerun()
                 
@@ -698,145 +636,109 @@ def admin_panel():
         
         # Sección para tokens FCM
         st.subheader("Tokens de FCM Guardados")
-        fcm_tokens_persisted = cargar_fcm_tokens()
-        if fcm_tokens_persisted:
-            st.json(fcm_tokens_persisted)
-            st.info(f"Total de tokens guardados: {len(fcm_tokens_persisted)}") # Mensaje de depuración
+        suscripciones = obtener_suscripciones()
+        total_suscripciones, total_destinos, total_tokens = suscripciones.conteos()
+        if total_suscripciones:
+            st.dataframe(suscripciones.como_dataframe(), use_container_width=True)
+            st.info(f"Total de suscripciones: {total_suscripciones} ({total_destinos} destinos, {total_tokens} dispositivos)")
         else:
             st.info("No hay tokens de FCM guardados.")
 
+        # Sección de la cola de notificaciones
+        st.subheader("Cola de notificaciones")
+        cola, trabajador = obtener_cola_notificaciones()
+        metricas_cola = cola.metricas()
+        col_cola1, col_cola2, col_cola3 = st.columns(3)
+        col_cola1.metric("Pendientes", metricas_cola['profundidad'])
+        col_cola2.metric("Pendiente más antiguo", f"{metricas_cola['antiguedad_max_s']:.0f} s")
+        col_cola3.metric("Latencia media (24 h)", f"{metricas_cola['latencia_media_s']:.1f} s")
+        st.caption(
+            f"Por estado: {metricas_cola['por_estado'] or 'sin registros'} · "
+            f"Trabajador {'activo' if trabajador.activo else 'detenido'} · "
+            f"Firebase Admin {'inicializado' if firebase_inicializado() else 'se inicializa con el primer envío'}"
+            + (f" · Último error: {trabajador.ultimo_error}" if trabajador.ultimo_error else "")
+        )
+
         if st.button("🔴 Reiniciar tokens FCM", help="Borra todos los tokens de suscripción FCM guardados."):
-            if os.path.exists(FCM_TOKENS_PATH):
-                os.remove(FCM_TOKENS_PATH)
-                st.session_state.messages.append({'type': 'success', 'text': "🗑️️ Archivo de tokens FCM eliminado."})
+            borradas = suscripciones.reiniciar()
+            if borradas:
+                st.session_state.messages.append({'type': 'success', 'text': f"🗑️️ Se eliminaron {borradas} suscripciones FCM."})
             else:
-                st.session_state.messages.append({'type': 'info', 'text': "Archivo de tokens FCM no encontrado."})
-            
-            # También limpia los tokens en la sesión actual
-            if 'fcm_tokens' in st.session_state:
-                st.session_state.fcm_tokens = {}
+                st.session_state.messages.append({'type': 'info', 'text': "No había suscripciones FCM guardadas."})
             
             st.session_state.messages.append({'type': 'warning', 'text': "¡Tokens FCM reiniciados!"})
-            st.cache_data.clear()
             st.rerun()
 
         if st.button("🔴 Reiniciar base de datos", help="Borra todos los archivos de historial para empezar de cero."):
             
-            archivos_a_borrar = [DB_PATH, HISTORIAL_PATH] 
-            
             borrados = 0
-            for archivo in archivos_a_borrar:
-                if os.path.exists(archivo):
-                    os.remove(archivo)
+            # Con el bloqueo de la base, el borrado no se intercala con una carga en curso. La base se
+            # borra con su backend, que también quita los archivos auxiliares (p. ej. el WAL de SQLite).
+            with ALMACEN_DB.bloqueo(espera=BLOQUEO_ESPERA_S):
+                eliminados = {DB_PATH: ALMACEN_DB.eliminar(), HASH_PATH: os.path.exists(HASH_PATH)}
+                if eliminados[HASH_PATH]:
+                    os.remove(HASH_PATH)
+            for archivo, eliminado in eliminados.items():
+                if eliminado:
                     borrados += 1
                     st.session_state.messages.append({'type': 'success', 'text': f"🗑️ Archivo '{archivo}' eliminado."})
                 else:
                     st.session_state.messages.append({'type': 'info', 'text': f"Archivo '{archivo}' no encontrado."})
             
+            obtener_agregados().reiniciar()
+            actualizaciones_borradas = obtener_historial().reiniciar()
+            st.session_state.messages.append({'type': 'success', 'text': f"🗑️ Historial de actualizaciones vaciado ({actualizaciones_borradas} registros)."})
             st.session_state.messages.append({'type': 'warning', 'text': f"¡Se han eliminado {borrados} archivos! La base de datos se ha reiniciado por completo."})
             st.session_state.messages.append({'type': 'info', 'text': "Ahora la aplicación está en un estado 'de fábrica'. Por favor, sube tu primer archivo Excel para comenzar un nuevo historial limpio."})
             
-            st.cache_data.clear()
+            obtener_cache_datos().invalidar()
             st.rerun()
 
 # --- Función para Mostrar Fichas Visuales ---
-# Genera y muestra tarjetas visuales para cada fila de datos de destino.
-def mostrar_fichas_visuales(df_resultado):
-    colores = {
-        "PROGRAMADO": (0, 123, 255),
-        "FACTURADO": (40, 167, 69),
-        "CANCELADO": (220, 53, 69),
-        "CARGANDO": (255, 193, 7)
-    }
-    iconos = {
-        "PROGRAMADO": "📅",
-        "FACTURADO": "✅",
-        "CANCELADO": "❌",
-        "CARGANDO": "⏳"
-    }
-
-    for _, fila in df_resultado.iterrows():
-        estado = str(fila.get("Estado de atención", "")).upper()
-        if "CANCELADO" in estado:
-            rgb = colores["CANCELADO"]
-            icono = iconos["CANCELADO"]
-        elif estado == "PROGRAMADO":
-            rgb = colores["PROGRAMADO"]
-            icono = iconos["PROGRAMADO"]
-        elif estado == "FACTURADO":
-            rgb = colores["FACTURADO"]
-            icono = iconos["FACTURADO"]
-        elif estado == "CARGANDO":
-            rgb = colores["CARGANDO"]
-            icono = iconos["CARGANDO"]
-        else:
-            rgb = (108, 117, 125)
-            icono = "ℹ️"
-
-        color_rgba = f"rgba({rgb[0]}, {rgb[1]}, {rgb[2]}, 0.65)"
+# Genera y muestra tarjetas visuales para cada fila de datos de destino. Todas las fichas visibles
+# se envían en un solo bloque HTML (ver lemargo/fichas.py); a partir de FICHAS_POR_PAGINA se
+# muestran por tandas con el botón "Mostrar más". 'clave' distingue cada lista en la sesión.
+def mostrar_fichas_visuales(df_resultado, clave="fichas"):
+    clave_limite = f"{clave}_limite"
+    limite = st.session_state.get(clave_limite, FICHAS_POR_PAGINA)
+
+    st.markdown(generar_html_fichas(df_resultado.head(limite)), unsafe_allow_html=True)
+
+    restantes = len(df_resultado) - limite
+    if restantes > 0:
+        def mostrar_mas():
+            st.session_state[clave_limite] = limite + FICHAS_POR_PAGINA
+        st.caption(f"Mostrando {limite} de {len(df_resultado)} registros.")
+        st.button(f"Mostrar {min(restantes, FICHAS_POR_PAGINA)} más", key=f"{clave}_mas", on_click=mostrar_mas)
+
+# --- Búsqueda de Destino ---
+# Devuelve las filas del destino 'pedido', o None (tras mostrar el error) si no se puede consultar.
+# La base y su índice se cargan solo cuando hay algo que buscar, para que la página se muestre de inmediato.
+def buscar_destino(pedido):
+    try:
+        indice = obtener_indice_destinos(version_base_datos())
+    except Exception as e:
+        st.error(f"Error al leer archivo: {e}")
+        return None
 
-        destino = fila.get('Destino', '')
-        fecha_general = fila.get('Fecha', None)
+    if 'Destino' not in indice.columnas:
+        st.error("❌ Falta la columna 'Destino'")
+        return None
+    if 'Fecha' not in indice.columnas:
+        st.error("❌ Falta la columna 'Fecha' para ordenar por día.")
+        return None
 
-        if pd.notnull(fecha_general):
-            try:
-                # Asegura que la fecha se muestre en el formato deseado
-                fecha_general = pd.to_datetime(fecha_general).strftime('%d/%m/%Y')
-            except (ValueError, TypeError):
-                fecha_general = str(fecha_general)
-
-        ficha_html = f"""
-        <div style="
-            background-color: {color_rgba};
-            border-radius: 8px;
-            padding: 12px;
-            margin-bottom: 10px;
-            color: white;
-            font-weight: 600;
-            box-shadow: 0 4px 12px rgba(0,0,0,0.15);
-            backdrop-filter: blur(6px);
-            -webkit-backdrop-filter: blur(6px);
-        ">
-            <div style="font-size: 18px;">{icono} <b>{destino}</b></div>
-            <div style="font-size: 14px; margin-top: 4px;">
-        """
-
-        if pd.notnull(fecha_general):
-            ficha_html += f"<b>Fecha:</b> {fecha_general}<br>"
-
-        ficha_html += f"""
-                <b>Producto:</b> {fila.get('Producto', 'N/A')}<br>
-                <b>Turno:</b> {fila.get('Turno', 'N/A')}<br>
-                <b>Capacidad (L):</b> {fila.get('Capacidad programada (Litros)', 'N/A')}<br>
-        """
-
-        fecha_estimada = fila.get('Fecha y hora estimada', None)
-        if pd.notnull(fecha_estimada):
-            ficha_html += f"<b>Fecha Estimada:</b> {fecha_estimada}<br>"
-
-        fecha_facturacion = fila.get('Fecha y hora de facturación', None)
-        if pd.notnull(fecha_facturacion):
-            ficha_html += f"<b>Fecha Facturación:</b> {fecha_facturacion}<br>"
-
-        ficha_html += f"""
-                <b>Estado:</b> {estado}<br>
-            </div>
-        </div>
-        """
-        st.markdown(ficha_html, unsafe_allow_html=True)
+    # Consulta el índice precalculado: solo se tocan las filas del destino solicitado.
+    return indice.buscar(pedido, COLUMNAS_FICHA)
 
 # --- Panel de Usuario ---
 # Permite a los usuarios consultar el estado de un destino específico y suscribirse a notificaciones.
 def user_panel():
     st.title("🔍 Consulta de Estatus")
 
-    # Inicializa st.session_state.fcm_tokens cargando desde el archivo persistente
-    if 'fcm_tokens' not in st.session_state:
-        st.session_state.fcm_tokens = cargar_fcm_tokens()
-
-    historial = cargar_historial()
-    if historial:
-        ultima_fecha_str = historial[-1]
+    ultima_actualizacion = obtener_historial().ultima()
+    if ultima_actualizacion:
+        ultima_fecha_str = ultima_actualizacion['fecha']
         try:
             ultima_fecha = datetime.datetime.fromisoformat(ultima_fecha_str)
             ultima_fecha_cdmx = ultima_fecha.astimezone(cdmx_tz)
@@ -846,118 +748,40 @@ def user_panel():
     else:
         st.info("📅 Última actualización: (sin datos)")
 
-    try:
-        df = cargar_datos()
-    except Exception as e:
-        st.error(f"Error al leer archivo: {e}")
-        return
-
-    if 'Destino' not in df.columns:
-        st.error("❌ Falta la columna 'Destino'")
-        return
-    if 'Fecha' not in df.columns:
-        st.error("❌ Falta la columna 'Fecha' para ordenar por día.")
-        return
-
     pedido = st.text_input("Ingresa tu número de destino")
-    if pedido:
-        columnas = ['Destino', 'Fecha', 'Producto', 'Turno', 'Capacidad programada (Litros)',
-                    'Fecha y hora estimada', 'Fecha y hora de facturación', 'Estado de atención']
-        columnas_validas = [col for col in columnas if col in df.columns]
-
-        df['Destino_num'] = df['Destino'].astype(str).str.split('-').str[0].str.strip()
-        df['Destino'] = df['Destino'].astype(str).str.strip().str.upper() 
-
-        resultado = df[df['Destino_num'] == pedido.strip()]
-        
-        if not resultado.empty:
-            destino_num_para_suscripcion = str(resultado['Destino_num'].iloc[0]).strip().upper()
-            
-            # --- Sección de Suscripción a Notificaciones de Firebase (con botón y proceso automático) ---
-            st.markdown(f"""
-                ---
-                ### Suscripción a notificaciones del Destino {destino_num_para_suscripcion}
-                
-                **Paso único:** Haz clic en el botón de abajo para permitir las notificaciones de este sitio en tu navegador. Tu suscripción se guardará automáticamente.
-            """)
-            
-            # Botón para activar la suscripción
-            if st.button(f"🔔 Suscribirme a notificaciones para Destino {destino_num_para_suscripcion}", key="subscribe_button"):
-                # Inyecta JavaScript para llamar a la función global que obtiene el token
-                # No hay setTimeout aquí, la llamada es directa
-                st.markdown(f"""
-                    <script>
-                        console.log("Button clicked: Attempting to call triggerFcmTokenAcquisition directly."); // Mensaje de depuración: Botón clicado, llamada directa
-                        if (window.triggerFcmTokenAcquisition) {{
-                            console.log("Calling triggerFcmTokenAcquisition..."); // Mensaje de depuración: Llamando a la función
-                            window.triggerFcmTokenAcquisition();
-                        }} else {{
-                            console.error('triggerFcmTokenAcquisition no está definida al momento de la llamada del botón.'); // Error de depuración: Función no definida
-                        }}
-                    </script>
-                """, unsafe_allow_html=True)
-                st.info("Solicitando permiso de notificación. Por favor, acepta la solicitud del navegador.")
-
-            # Campo oculto para recibir el token de FCM desde JavaScript
-            # Streamlit genera un elemento HTML <input> al que podemos acceder con JS
-            fcm_token_received = st.text_input(
-                "FCM Token (oculto)", 
-                value="", 
-                key="fcm_token_receiver", 
-                type="default", # Usamos default para que Streamlit genere un input normal
-                label_visibility="collapsed" # Ocultamos la etiqueta
-            )
-            
-            # CSS para ocultar el input visualmente
-            st.markdown("""
-                <style>
-                div[data-testid="stTextInput"] > div[data-baseweb="input"] {
-                    display: none;
-                }
-                </style>
-            """, unsafe_allow_html=True)
-
-            # Lógica para guardar el token una vez recibido
-            if fcm_token_received and fcm_token_received != "":
-                st.info(f"DEBUG: Token recibido desde JS: {fcm_token_received[:10]}...") # Mensaje de depuración
-                # Verifica si el token ya está guardado para este destino
-                if st.session_state.fcm_tokens.get(destino_num_para_suscripcion) != fcm_token_received:
-                    st.session_state.fcm_tokens[destino_num_para_suscripcion] = fcm_token_received
-                    guardar_fcm_tokens(st.session_state.fcm_tokens) # Guarda en el archivo persistente
-                    st.success(f"✅ ¡Suscripción exitosa! Ahora recibirás notificaciones para el destino **{destino_num_para_suscripcion}**.")
-                    st.info("DEBUG: Token guardado en sesión y archivo.") # Mensaje de depuración
-                else:
-                    st.info("DEBUG: Token ya existente para este destino, no se guarda de nuevo.") # Mensaje de depuración
-            
-            # --- Fin de la Sección de Suscripción ---
-            
-            if not resultado.empty:
-                mostrar_fichas_visuales(resultado)
-            else:
-                st.warning("No se encontró ningún destino con ese número.")
-                if 'last_df' in st.session_state and not st.session_state.last_df.empty:
-                    st.markdown("---")
-                    st.subheader("Búsqueda en base histórica")
-                    df_historico = st.session_state.last_df
-                    df_historico['Destino_num'] = df_historico['Destino'].astype(str).str.split('-').str[0].str.strip()
-                    resultado_historico = df_historico[df_historico['Destino_num'] == pedido.strip()]
-                    if not resultado_historico.empty:
-                        st.markdown("Hemos encontrado este destino en nuestra base de datos, pero no está activo en el archivo más reciente:")
-                        mostrar_fichas_visuales(resultado_historico)
-                    else:
-                        st.info("No se encontró este destino en la base de datos histórica.")
+    # Posición fija del componente de notificaciones: se dibuja en cada ejecución aunque no haya
+    # destino, para que el iframe no se desmonte y se vuelva a montar entre búsquedas.
+    zona_notificaciones = st.container()
+    resultado = buscar_destino(pedido) if pedido else None
+    destino_num_para_suscripcion = None
+    if resultado is not None and not resultado.empty:
+        destino_num_para_suscripcion = pedido.strip().upper()
+    with zona_notificaciones:
+        suscripcion_notificaciones(destino_num_para_suscripcion, resultado)
+
+    if destino_num_para_suscripcion:
+        mostrar_fichas_visuales(resultado, clave=f"fichas_{destino_num_para_suscripcion}")
 
 # --- Lógica Principal de la Aplicación ---
 # Controla el flujo de la aplicación, mostrando el panel de usuario o el panel de administración
 # dependiendo del estado de inicio de sesión.
 def main():
     pwa_setup()
-    # Pasa el ID del input oculto a la función fcm_pwa_setup para que JavaScript lo encuentre.
-    # Usamos components.html aquí para una inyección de script más robusta.
-    fcm_pwa_setup("fcm_token_receiver") 
 
     if "logged_in" not in st.session_state:
         st.session_state.logged_in = False
+
+    if API_PUERTO:
+        try:
+            obtener_servidor_api(API_PUERTO, API_HOST)
+        except (OSError, ValueError) as e:
+            st.warning(f"No se pudo iniciar el endpoint de consulta en el puerto {API_PUERTO}: {e}")
+
+    # Migra una sola vez la base JSON anterior al formato columnar configurado.
+    try:
+        migrar_desde_json(ALMACEN_DB, LEGACY_DB_PATH)
+    except Exception as e:
+        st.error(f"Error al migrar '{LEGACY_DB_PATH}' a '{DB_PATH}': {e}")
     
     # --- NUEVA LÓGICA DE CARGA INICIAL DE LA BASE DE DATOS ---
     # Si el archivo de la base de datos principal no existe, muestra un mensaje y fuerza el login de admin.
@@ -977,7 +801,6 @@ def main():
             admin_dashboard()
         elif opcion == "Cerrar sesión":
             st.session_state.logged_in = False
-            st.session_state.last_df = pd.DataFrame()
             st.session_state.messages = []
             st.rerun()
     else:
@@ -0,0 +1,3 @@
+# --- Benchmarks de Lemargo ---
+# Ejecutar desde la raíz del repositorio, por ejemplo:
+#   python -m benchmarks.bench_cambios
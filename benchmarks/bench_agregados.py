@@ -0,0 +1,81 @@
+# --- Benchmark de Agregados del Dashboard ---
+# Compara el costo de un cambio de filtro en el dashboard calculado sobre la base completa
+# (value_counts + str.contains, como hacía admin_dashboard) frente a las consultas sobre los
+# agregados materializados, y mide la reconstrucción completa y la actualización incremental.
+#
+# Uso: python -m benchmarks.bench_agregados [--tamanos 100000 500000 1000000]
+import argparse
+import os
+import tempfile
+import time
+
+import pandas as pd
+
+from lemargo.agregados import AgregadosDashboard
+from lemargo.esquema import CLASE_CANCELADO, CLASE_DEMORA, CLASE_FACTURADO, preparar_tipos
+from lemargo.fusion import aplicar_retencion, fusionar, preparar_indice
+from tests.datos_sinteticos import generar_actualizacion, generar_golden_record
+
+RETENCION = 7
+HOY = pd.Timestamp('2025-02-01')
+
+
+# Cálculo anterior de admin_dashboard para un cambio de filtro, conservado como referencia.
+def filtro_legado(df, fecha, productos, estados):
+    df = df.copy()
+    df['Fecha'] = df['Fecha'].dt.date
+    df_filtrado = df[df['Fecha'] == fecha]
+    df_filtrado = df_filtrado[df_filtrado['Producto'].isin(productos)]
+    df_filtrado = df_filtrado[df_filtrado['Estado de atención'].isin(estados)]
+    df_filtrado['Estado de atención'].value_counts()
+    df_filtrado['Destino'].value_counts()
+    for patron in ['FACTURADO', 'CANCELADO']:
+        df[df['Estado de atención'].str.contains(patron, case=False, na=False)]['Destino'].value_counts().nlargest(10)
+    df[~df['Estado de atención'].str.contains('FACTURADO|CANCELADO', case=False, na=False)]['Destino'].value_counts().nlargest(10)
+
+
+def filtro_agregados(agregados, fecha, productos, estados):
+    agregados.conteo_por('estado', fecha.isoformat(), productos, estados)
+    agregados.conteo_por('destino', fecha.isoformat(), productos, estados)
+    for clase in [CLASE_FACTURADO, CLASE_CANCELADO, CLASE_DEMORA]:
+        agregados.top_destinos(clase, limite=10)
+
+
+def cronometrar(funcion, *args):
+    inicio = time.perf_counter()
+    resultado = funcion(*args)
+    return time.perf_counter() - inicio, resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de agregados materializados del dashboard.")
+    parser.add_argument('--tamanos', type=int, nargs='+', default=[100_000, 500_000, 1_000_000])
+    parser.add_argument('--carga', type=int, default=10_000, help="Filas del archivo subido.")
+    args = parser.parse_args()
+
+    print(f"{'filas':>10} {'filtro legado (s)':>18} {'filtro agregados (s)':>21} {'reconstrucción (s)':>19} {'incremental (s)':>16}")
+    with tempfile.TemporaryDirectory() as directorio:
+        for filas in args.tamanos:
+            base = preparar_indice(generar_golden_record(filas, dias=90))
+            base = preparar_tipos(aplicar_retencion(base, HOY, RETENCION)[0])
+            agregados = AgregadosDashboard(os.path.join(directorio, f'agregados_{filas}.db'))
+
+            t_reconstruir, _ = cronometrar(agregados.reconstruir, base, 1)
+
+            fecha = base['Fecha'].max().date()
+            productos = base['Producto'].unique().tolist()
+            estados = base['Estado de atención'].unique().tolist()
+            t_legado, _ = cronometrar(filtro_legado, base, fecha, productos, estados)
+            t_agregados, _ = cronometrar(filtro_agregados, agregados, fecha, productos, estados)
+
+            nuevo = generar_actualizacion(base.tail(args.carga), frac_eliminados=0, frac_nuevos=0.1)
+            nuevo = nuevo.drop(columns=['_clave', '_hash_fila']).astype({col: str for col in ['Destino', 'Producto', 'Estado de atención']})
+            fusion = fusionar(base, nuevo, HOY, RETENCION)
+            eliminados = pd.concat([fusion.anteriores, fusion.retirados], ignore_index=True)
+            t_incremental, _ = cronometrar(agregados.actualizar, fusion.aplicados, eliminados, 1, 2)
+
+            print(f"{len(base):>10} {t_legado:>18.3f} {t_agregados:>21.4f} {t_reconstruir:>19.3f} {t_incremental:>16.3f}")
+
+
+if __name__ == '__main__':
+    main()
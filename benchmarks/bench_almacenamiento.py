@@ -0,0 +1,59 @@
+# --- Benchmark de Almacenamiento de la Base Histórica ---
+# Compara tiempos de guardado/carga y tamaño en disco del JSON original
+# (to_json orient='records' + read_json + pd.to_datetime) frente a Parquet y Feather.
+#
+# Uso: python -m benchmarks.bench_almacenamiento [--tamanos 10000 100000 1000000]
+import argparse
+import os
+import tempfile
+import time
+
+import pandas as pd
+
+from lemargo.almacenamiento import BACKENDS
+from tests.datos_sinteticos import generar_golden_record
+
+
+# Ruta JSON tal como la usaba app.py antes de los backends: sin tipos conservados.
+def guardar_json_legado(df, ruta):
+    df = df.copy()
+    df['Fecha'] = pd.to_datetime(df['Fecha'], errors='coerce')
+    df.to_json(ruta, orient='records', date_format='iso')
+
+
+def cargar_json_legado(ruta):
+    df = pd.read_json(ruta)
+    df['Fecha'] = pd.to_datetime(df['Fecha'], errors='coerce')
+    return df
+
+
+def cronometrar(funcion, *args):
+    inicio = time.perf_counter()
+    funcion(*args)
+    return time.perf_counter() - inicio
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de almacenamiento del golden record.")
+    parser.add_argument('--tamanos', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    args = parser.parse_args()
+
+    print(f"{'filas':>10} {'formato':>10} {'guardar (s)':>12} {'cargar (s)':>11} {'tamaño (MB)':>12}")
+    with tempfile.TemporaryDirectory() as directorio:
+        for filas in args.tamanos:
+            df = generar_golden_record(filas)
+
+            ruta = os.path.join(directorio, 'legado.json')
+            t_guardar = cronometrar(guardar_json_legado, df, ruta)
+            t_cargar = cronometrar(cargar_json_legado, ruta)
+            print(f"{filas:>10} {'json-app':>10} {t_guardar:>12.3f} {t_cargar:>11.3f} {os.path.getsize(ruta) / 2**20:>12.2f}")
+
+            for formato, clase in BACKENDS.items():
+                almacen = clase(os.path.join(directorio, 'golden_record' + clase.extension))
+                t_guardar = cronometrar(almacen.guardar, df)
+                t_cargar = cronometrar(almacen.cargar)
+                print(f"{filas:>10} {formato:>10} {t_guardar:>12.3f} {t_cargar:>11.3f} {almacen.tamano_bytes() / 2**20:>12.2f}")
+
+
+if __name__ == '__main__':
+    main()
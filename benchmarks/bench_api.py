@@ -0,0 +1,183 @@
+# --- Prueba de Carga del Endpoint de Consulta ---
+# Compara el costo de consultar un destino por el endpoint JSON (lemargo/api.py) con el camino
+# de Streamlit (re-ejecutar app.py tras escribir el número en la página de consulta).
+#
+# - Endpoint: el servidor corre en un proceso aparte (como en producción) y 'concurrencia'
+#   clientes con conexiones persistentes piden destinos al azar durante 'duracion' segundos,
+#   primero sin ETag (200 con el JSON) y luego revalidando con If-None-Match (304). Antes se
+#   pide cada destino una vez, así que los 200 salen de la caché de respuestas del servidor;
+#   el costo de la primera consulta de un destino tras una carga se mide aparte, en proceso.
+# - Streamlit: una sesión de AppTest consulta destinos al azar uno tras otro; cada consulta es
+#   una re-ejecución completa del script. No incluye el WebSocket ni el navegador, así que es
+#   una cota optimista del camino real.
+#
+# Uso: python -m benchmarks.bench_api [--filas 200000] [--duracion 5] [--concurrencia 1 8]
+import argparse
+import http.client
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from lemargo.almacenamiento import obtener_almacen
+from lemargo.api import ConsultaDestinos
+from lemargo.esquema import destinos_de
+from tests.datos_sinteticos import generar_golden_record
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SECRETOS = {'FIREBASE_VAPID_KEY': 'clave-vapid', 'FIREBASE_CONFIG': '{"apiKey": "x", "projectId": "x"}'}
+
+
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def esperar_servidor(puerto, limite=30):
+    fin = time.monotonic() + limite
+    while time.monotonic() < fin:
+        try:
+            socket.create_connection(('127.0.0.1', puerto), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise TimeoutError(f"El endpoint no respondió en el puerto {puerto}")
+
+
+# Un cliente: pide destinos al azar hasta 'fin' y acumula las latencias (s) en 'latencias'.
+def cliente(puerto, destinos, fin, etags, latencias, semilla):
+    rng = random.Random(semilla)
+    conexion = http.client.HTTPConnection('127.0.0.1', puerto)
+    while time.monotonic() < fin:
+        destino = rng.choice(destinos)
+        encabezados = {'If-None-Match': etags[destino]} if etags is not None else {}
+        inicio = time.perf_counter()
+        conexion.request('GET', f'/destino/{destino}', headers=encabezados)
+        respuesta = conexion.getresponse()
+        respuesta.read()
+        latencias.append(time.perf_counter() - inicio)
+        if respuesta.status not in (200, 304):
+            raise RuntimeError(f"Respuesta inesperada {respuesta.status} para el destino {destino}")
+    conexion.close()
+
+
+def carga(puerto, destinos, concurrencia, duracion, etags=None):
+    latencias = [[] for _ in range(concurrencia)]
+    fin = time.monotonic() + duracion
+    hilos = [
+        threading.Thread(target=cliente, args=(puerto, destinos, fin, etags, latencias[i], i))
+        for i in range(concurrencia)
+    ]
+    inicio = time.perf_counter()
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    total = time.perf_counter() - inicio
+    todas = np.concatenate([np.asarray(l) for l in latencias])
+    return len(todas) / total, np.percentile(todas, 50) * 1000, np.percentile(todas, 95) * 1000
+
+
+def obtener_etags(puerto, destinos):
+    conexion = http.client.HTTPConnection('127.0.0.1', puerto)
+    etags = {}
+    for destino in destinos:
+        conexion.request('GET', f'/destino/{destino}')
+        respuesta = conexion.getresponse()
+        respuesta.read()
+        etags[destino] = respuesta.getheader('ETag')
+    conexion.close()
+    return etags
+
+
+# Camino de Streamlit: cada consulta es una re-ejecución de app.py en la misma sesión.
+def consultas_streamlit(destinos, consultas):
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(os.path.join(RAIZ, 'app.py'), default_timeout=120)
+    for clave, valor in SECRETOS.items():
+        app.secrets[clave] = valor
+    app.run()
+    rng = random.Random(0)
+    app.text_input[0].input(rng.choice(destinos)).run()  # Calienta el índice de destinos
+
+    tiempos = []
+    for _ in range(consultas):
+        inicio = time.perf_counter()
+        app.text_input[0].input(rng.choice(destinos)).run()
+        tiempos.append(time.perf_counter() - inicio)
+    if app.exception:
+        raise RuntimeError(app.exception[0].value)
+    tiempos = np.asarray(tiempos)
+    return 1 / tiempos.mean(), np.percentile(tiempos, 50) * 1000, np.percentile(tiempos, 95) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga del endpoint GET /destino/<número>.")
+    parser.add_argument('--filas', type=int, default=200_000)
+    parser.add_argument('--formato', default='parquet')
+    parser.add_argument('--duracion', type=float, default=5.0, help="Segundos de carga por escenario.")
+    parser.add_argument('--concurrencia', type=int, nargs='+', default=[1, 8])
+    parser.add_argument('--consultas-streamlit', type=int, default=50)
+    args = parser.parse_args()
+
+    df = generar_golden_record(args.filas)
+    destinos = sorted(destinos_de(df).unique())
+
+    directorio_original = os.getcwd()
+    with tempfile.TemporaryDirectory() as directorio:
+        base = os.path.join(directorio, 'golden_record')
+        obtener_almacen(args.formato, ruta_base=base).guardar(df)
+
+        puerto = puerto_libre()
+        entorno = dict(os.environ, PYTHONPATH=RAIZ + os.pathsep + os.environ.get('PYTHONPATH', ''))
+        servidor = subprocess.Popen(
+            [sys.executable, '-m', 'lemargo.api', '--base', base, '--formato', args.formato,
+             '--host', '127.0.0.1', '--puerto', str(puerto)],
+            env=entorno, stdout=subprocess.DEVNULL,
+        )
+        try:
+            esperar_servidor(puerto)
+            etags = obtener_etags(puerto, destinos)  # También calienta la caché y el índice del servidor
+
+            print(f"Filas: {args.filas}, destinos: {len(destinos)}, formato: {args.formato}")
+            print(f"{'camino':>26} {'clientes':>9} {'peticiones/s':>13} {'p50 (ms)':>9} {'p95 (ms)':>9}")
+            for concurrencia in args.concurrencia:
+                rps, p50, p95 = carga(puerto, destinos, concurrencia, args.duracion)
+                print(f"{'endpoint (200)':>26} {concurrencia:>9} {rps:>13.1f} {p50:>9.2f} {p95:>9.2f}")
+                rps, p50, p95 = carga(puerto, destinos, concurrencia, args.duracion, etags)
+                print(f"{'endpoint (304, ETag)':>26} {concurrencia:>9} {rps:>13.1f} {p50:>9.2f} {p95:>9.2f}")
+        finally:
+            servidor.terminate()
+            servidor.wait()
+
+        # Primera consulta de cada destino (sin caché de respuestas), con el índice ya construido.
+        consulta = ConsultaDestinos(obtener_almacen(args.formato, ruta_base=base))
+        consulta.consultar(destinos[0])
+        tiempos = []
+        for destino in destinos[:200]:
+            inicio = time.perf_counter()
+            consulta.consultar(destino)
+            tiempos.append(time.perf_counter() - inicio)
+        tiempos = np.asarray(tiempos)
+        print(f"{'primera consulta (proceso)':>26} {1:>9} {1 / tiempos.mean():>13.1f} "
+              f"{np.percentile(tiempos, 50) * 1000:>9.2f} {np.percentile(tiempos, 95) * 1000:>9.2f}")
+
+        # app.py usa rutas relativas: se ejecuta desde el directorio de la base.
+        os.chdir(directorio)
+        try:
+            rps, p50, p95 = consultas_streamlit(destinos, args.consultas_streamlit)
+        finally:
+            os.chdir(directorio_original)
+        print(f"{'streamlit (re-ejecución)':>26} {1:>9} {rps:>13.1f} {p50:>9.2f} {p95:>9.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+# --- Perfil de Arranque de la Página de Consulta ---
+# Ejecuta app.py con streamlit.testing (AppTest) en un proceso nuevo, como lo haría un
+# conductor que abre la página de consulta, y mide:
+#   - proceso: tiempo total del proceso hijo (intérprete, importaciones y primera ejecución),
+#   - importaciones: costo de las importaciones de nivel superior de app.py en frío,
+#   - primera pintura: duración de la primera ejecución del script (lo que tarda en enviarse la página),
+#   - re-ejecución: duración de una segunda ejecución en el mismo proceso,
+#   - qué dependencias pesadas (altair, firebase_admin, openpyxl) quedaron importadas.
+# El modo 'ansioso' importa esas dependencias antes de ejecutar la app, como hacía la
+# versión anterior al importarlas al inicio del script.
+#
+# Uso: python -m benchmarks.bench_arranque [--filas 50000] [--repeticiones 3]
+import argparse
+import ast
+import importlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULOS_PESADOS = ['altair', 'firebase_admin', 'firebase_admin.messaging', 'openpyxl']
+SECRETOS = {'FIREBASE_VAPID_KEY': 'clave-vapid', 'FIREBASE_CONFIG': '{"apiKey": "x", "projectId": "x"}'}
+
+
+# Módulos importados al nivel superior de app.py (lo que paga cualquier página al arrancar).
+def importaciones_de_app():
+    with open(os.path.join(RAIZ, 'app.py'), encoding='utf-8') as f:
+        arbol = ast.parse(f.read())
+    modulos = []
+    for nodo in arbol.body:
+        if isinstance(nodo, ast.Import):
+            modulos += [alias.name for alias in nodo.names]
+        elif isinstance(nodo, ast.ImportFrom) and nodo.module:
+            modulos.append(nodo.module)
+    return modulos
+
+
+# Se ejecuta dentro del proceso hijo, con el directorio de trabajo que contiene la base.
+def ejecutar_hijo(ansioso):
+    inicio = time.perf_counter()
+    for modulo in importaciones_de_app() + (MODULOS_PESADOS if ansioso else []):
+        importlib.import_module(modulo)
+    importaciones = time.perf_counter() - inicio
+
+    from streamlit.testing.v1 import AppTest
+
+    # Un script vacío absorbe el costo de inicializar el propio AppTest (registro de componentes),
+    # que en un servidor real ocurre antes de atender la primera sesión.
+    AppTest.from_string("import streamlit as st").run()
+
+    app = AppTest.from_file(os.path.join(RAIZ, 'app.py'), default_timeout=120)
+    for clave, valor in SECRETOS.items():
+        app.secrets[clave] = valor
+
+    inicio = time.perf_counter()
+    app.run()
+    primera = time.perf_counter() - inicio
+    inicio = time.perf_counter()
+    app.run()
+    segunda = time.perf_counter() - inicio
+
+    print(json.dumps({
+        'importaciones_s': importaciones,
+        'primera_pintura_s': primera,
+        're_ejecucion_s': segunda,
+        'errores': [str(e.value) for e in app.error] + [str(e.value) for e in app.exception],
+        'importados': [modulo for modulo in MODULOS_PESADOS if modulo in sys.modules],
+    }))
+
+
+def medir(directorio, ansioso):
+    comando = [sys.executable, '-m', 'benchmarks.bench_arranque', '--hijo'] + (['--ansioso'] if ansioso else [])
+    entorno = dict(os.environ, PYTHONPATH=RAIZ + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    inicio = time.perf_counter()
+    salida = subprocess.run(comando, cwd=directorio, env=entorno, capture_output=True, text=True, check=True)
+    total = time.perf_counter() - inicio
+    resultado = json.loads(salida.stdout.strip().splitlines()[-1])
+    resultado['proceso_s'] = total
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Perfil de arranque de la página de consulta.")
+    parser.add_argument('--filas', type=int, default=50_000, help="Filas de la base sintética.")
+    parser.add_argument('--repeticiones', type=int, default=3)
+    parser.add_argument('--hijo', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--ansioso', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.hijo:
+        ejecutar_hijo(args.ansioso)
+        return
+
+    from lemargo.almacenamiento import obtener_almacen
+    from tests.datos_sinteticos import generar_golden_record
+
+    with tempfile.TemporaryDirectory() as directorio:
+        obtener_almacen('parquet', os.path.join(directorio, 'golden_record')).guardar(generar_golden_record(args.filas))
+
+        print(f"{'modo':>9} {'proceso (s)':>12} {'importaciones (s)':>18} {'primera pintura (s)':>20} {'re-ejecución (s)':>17}  importados")
+        for ansioso in (True, False):
+            mediciones = [medir(directorio, ansioso) for _ in range(args.repeticiones)]
+            mejor = min(mediciones, key=lambda m: m['proceso_s'])
+            if mejor['errores']:
+                print(f"  errores: {mejor['errores']}")
+            print(f"{'ansioso' if ansioso else 'perezoso':>9} {mejor['proceso_s']:>12.3f} {mejor['importaciones_s']:>18.3f} {mejor['primera_pintura_s']:>20.3f} "
+                  f"{mejor['re_ejecucion_s']:>17.3f}  {', '.join(mejor['importados']) or '-'}")
+
+
+if __name__ == '__main__':
+    main()
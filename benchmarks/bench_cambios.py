@@ -0,0 +1,66 @@
+# --- Benchmark del Motor de Detección de Cambios ---
+# Mide detectar_cambios a 10k, 100k y 1M filas y, para tamaños pequeños, lo compara
+# con el recorrido fila por fila (iterrows + .loc) que usaba check_and_notify_on_change.
+# La columna 'por clave' mide las mismas versiones con el esquema de la base y '_clave', como
+# las compara la carga (join por entero y estado por código de categoría).
+#
+# Uso: python -m benchmarks.bench_cambios [--tamanos 10000 100000 1000000] [--legado-max 10000]
+import argparse
+import time
+
+from lemargo.cambios import COLUMNAS_CLAVE, detectar_cambios, normalizar_claves
+from lemargo.esquema import preparar_tipos
+from lemargo.fusion import preparar_indice
+from tests.datos_sinteticos import generar_actualizacion, generar_golden_record
+
+
+# Implementación anterior, conservada solo como referencia de comparación.
+def detectar_cambios_legado(old_df, new_df):
+    old_df_clean = normalizar_claves(old_df)
+    new_df_clean = normalizar_claves(new_df)
+    old_df_indexed = old_df_clean.set_index(COLUMNAS_CLAVE)
+    cambios = 0
+    for _, row in new_df_clean.iterrows():
+        key = (row['Destino'], row['Folio pedido'], row['Producto'], row['Fecha'])
+        if key in old_df_indexed.index:
+            if old_df_indexed.loc[key, 'Estado de atención'] != row['Estado de atención']:
+                cambios += 1
+    return cambios
+
+
+def medir(funcion, *args):
+    inicio = time.perf_counter()
+    resultado = funcion(*args)
+    return time.perf_counter() - inicio, resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de detectar_cambios.")
+    parser.add_argument('--tamanos', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--legado-max', type=int, default=10_000,
+                        help="Tamaño máximo para ejecutar también la versión con iterrows.")
+    args = parser.parse_args()
+
+    print(f"{'filas':>10} {'join (s)':>10} {'filas/s':>12} {'cambios':>9} {'nuevos':>8} {'elim.':>8} "
+          f"{'por clave (s)':>14} {'iterrows (s)':>13}")
+    for filas in args.tamanos:
+        old_df = generar_golden_record(filas)
+        new_df = generar_actualizacion(old_df)
+
+        segundos, resultado = medir(detectar_cambios, old_df, new_df)
+        segundos_clave, _ = medir(
+            detectar_cambios, preparar_indice(preparar_tipos(old_df)), preparar_indice(preparar_tipos(new_df)))
+        legado = '-'
+        if filas <= args.legado_max:
+            segundos_legado, _ = medir(detectar_cambios_legado, old_df, new_df)
+            legado = f"{segundos_legado:.2f}"
+
+        print(
+            f"{filas:>10} {segundos:>10.3f} {filas / segundos:>12,.0f} "
+            f"{len(resultado.cambios_estado):>9} {len(resultado.agregados):>8} "
+            f"{len(resultado.eliminados):>8} {segundos_clave:>14.3f} {legado:>13}"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+# --- Benchmark de Fusión y Retención ---
+# Mide el costo de integrar una carga de tamaño fijo mientras la base histórica crece,
+# comparando el upsert por clave con el concat + drop_duplicates + str.contains anterior.
+#
+# Uso: python -m benchmarks.bench_fusion [--historia 100000 500000 1000000 2000000] [--carga 10000]
+import argparse
+import time
+
+import pandas as pd
+
+from lemargo.esquema import preparar_tipos
+from lemargo.fusion import aplicar_retencion, fusionar, preparar_indice
+from tests.datos_sinteticos import generar_actualizacion, generar_golden_record
+
+RETENCION = 7
+HOY = pd.Timestamp('2025-02-01')
+
+
+# Implementación anterior de admin_panel, conservada solo como referencia.
+def fusionar_legado(base, nuevo, hoy, dias_retencion):
+    id_cols = ['Destino', 'Folio pedido', 'Producto', 'Fecha']
+    combinado = pd.concat([base, nuevo]).drop_duplicates(subset=id_cols, keep='last')
+    return combinado[
+        (~combinado['Estado de atención'].str.contains('FACTURADO|CANCELADO', case=False, na=False)) |
+        ((hoy - combinado['Fecha']).dt.days <= dias_retencion)
+    ].copy()
+
+
+def cronometrar(funcion, *args):
+    inicio = time.perf_counter()
+    resultado = funcion(*args)
+    return time.perf_counter() - inicio, resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de fusión incremental y retención.")
+    parser.add_argument('--historia', type=int, nargs='+', default=[100_000, 500_000, 1_000_000, 2_000_000])
+    parser.add_argument('--carga', type=int, default=10_000, help="Filas del archivo subido.")
+    args = parser.parse_args()
+
+    print(f"{'base':>10} {'carga':>7} {'upsert (s)':>11} {'legado (s)':>11} {'filas finales':>14}")
+    for filas in args.historia:
+        # La base se guarda con '_clave', ordenada por fecha y ya depurada por retención,
+        # como la deja una carga previa.
+        base = preparar_indice(generar_golden_record(filas, dias=90))
+        base = preparar_tipos(aplicar_retencion(base, HOY, RETENCION)[0])
+        recientes = base.tail(args.carga)
+        nuevo = generar_actualizacion(recientes, frac_eliminados=0, frac_nuevos=0.1).drop(columns='_clave')
+        nuevo = nuevo.astype({col: str for col in ['Destino', 'Producto', 'Estado de atención']})
+
+        t_upsert, resultado = cronometrar(fusionar, base, nuevo, HOY, RETENCION)
+        t_legado, _ = cronometrar(fusionar_legado, base.drop(columns='_clave'), nuevo, HOY, RETENCION)
+        print(f"{len(base):>10} {len(nuevo):>7} {t_upsert:>11.3f} {t_legado:>11.3f} {len(resultado.df):>14}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+# --- Benchmark del Despacho de Notificaciones ---
+# Compara el envío secuencial de un mensaje por llamada (como hacía enviar_notificacion_por_token)
+# con el despacho en lotes concurrentes, usando el cliente FCM falso con latencia simulada.
+#
+# Uso: python -m benchmarks.bench_notificaciones [--mensajes 2000] [--latencia 0.05]
+import argparse
+import time
+
+from lemargo.notificaciones import DespachadorNotificaciones, Notificacion
+from tests.fcm_falso import ClienteFCMFalso
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del despacho de notificaciones FCM.")
+    parser.add_argument('--mensajes', type=int, default=2000)
+    parser.add_argument('--latencia', type=float, default=0.05, help="Latencia simulada por llamada (s).")
+    parser.add_argument('--hilos', type=int, default=4)
+    args = parser.parse_args()
+
+    notificaciones = [
+        Notificacion(token=f"token-{i}", titulo="Actualización", cuerpo="Estado cambió", destino=str(1000 + i))
+        for i in range(args.mensajes)
+    ]
+    invalidos = {f"token-{i}" for i in range(0, args.mensajes, 50)}
+
+    # Secuencial: una llamada de red por mensaje (se estima a partir de 50 envíos).
+    muestra = min(50, args.mensajes)
+    cliente = ClienteFCMFalso(latencia_lote=args.latencia, tokens_invalidos=invalidos)
+    secuencial = DespachadorNotificaciones(cliente=cliente, max_hilos=1, tamano_lote=1)
+    inicio = time.perf_counter()
+    secuencial.despachar(notificaciones[:muestra])
+    t_secuencial = (time.perf_counter() - inicio) * args.mensajes / muestra
+
+    cliente = ClienteFCMFalso(latencia_lote=args.latencia, tokens_invalidos=invalidos)
+    despachador = DespachadorNotificaciones(cliente=cliente, max_hilos=args.hilos)
+    inicio = time.perf_counter()
+    resumen = despachador.despachar(notificaciones)
+    t_lotes = time.perf_counter() - inicio
+
+    print(f"Mensajes: {args.mensajes}, latencia por llamada: {args.latencia}s")
+    print(f"Secuencial (estimado): {t_secuencial:.2f}s")
+    print(f"Lotes concurrentes:    {t_lotes:.2f}s en {cliente.lotes} lotes")
+    print(f"Éxitos: {len(resumen.exitosos)}, fallos: {len(resumen.fallidos)}, tokens inválidos: {len(resumen.tokens_invalidos)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+# --- Benchmark de la Carga Completa ---
+# Ejecuta sin Streamlit el flujo del botón "Cargar y actualizar base histórica" de admin_panel
+# (lemargo/pipeline.py: lectura del Excel, fusión y retención, detección de cambios, escritura de
+# la base, encolado de notificaciones, agregados y recarga de la caché) sobre datos sintéticos
+# con el juego de columnas real, a varias escalas de la base histórica.
+#
+# Por cada escala se genera una base (ya depurada por retención, como la deja una carga previa),
+# suscripciones para una parte de los destinos y un Excel con las filas más recientes de la base
+# con cambios de estado, bajas y registros nuevos. La preparación ocurre en este proceso; la
+# carga se mide en un proceso nuevo, que solo tiene en memoria lo que tendría la app.
+#
+# Reporta el tiempo de cada etapa (ver lemargo/metricas.py), el total, las filas por segundo y
+# el pico de memoria. Con --salida, cada escala se agrega como una línea JSON junto con el commit
+# actual, para comparar resultados entre versiones.
+#
+# Uso: python -m benchmarks.bench_pipeline [--filas 20000 100000 500000] [--frac-carga 0.05]
+#                                           [--formato parquet] [--salida bench_pipeline.jsonl]
+import argparse
+import datetime
+import io
+import multiprocessing
+import os
+import resource
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from lemargo.agregados import AgregadosDashboard
+from lemargo.almacenamiento import obtener_almacen
+from lemargo.esquema import destinos_de, preparar_tipos
+from lemargo.fusion import aplicar_retencion, preparar_indice
+from lemargo.ingesta import leer_excel
+from lemargo.metricas import ETIQUETAS_TRAMOS, exportar_medicion
+from lemargo.pipeline import AGREGADOS_PATH, RUTA_BASE, SUSCRIPCIONES_PATH, ContextoCarga, ejecutar_carga
+from lemargo.suscripciones import AlmacenSuscripciones
+from tests.datos_sinteticos import generar_actualizacion, generar_golden_record
+
+RETENCION = 7
+HOY = '2025-02-01'
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# --- Preparación ---
+# Deja en 'directorio' la base, los agregados sincronizados, las suscripciones y el Excel subido.
+# Devuelve (filas de la base, filas del Excel, bytes del Excel).
+def preparar_escala(directorio, filas, frac_carga, formato, frac_suscritos):
+    base = preparar_indice(generar_golden_record(filas, dias=30, fecha_fin=HOY))
+    base = preparar_tipos(aplicar_retencion(base, pd.Timestamp(HOY), RETENCION)[0])
+    almacen = obtener_almacen(formato, ruta_base=os.path.join(directorio, RUTA_BASE))
+    almacen.guardar(base)
+    AgregadosDashboard(os.path.join(directorio, AGREGADOS_PATH)).reconstruir(base, os.stat(almacen.ruta).st_mtime_ns)
+
+    destinos = destinos_de(base).unique()
+    suscritos = np.random.default_rng(2).choice(destinos, size=int(len(destinos) * frac_suscritos), replace=False)
+    suscripciones = AlmacenSuscripciones(os.path.join(directorio, SUSCRIPCIONES_PATH))
+    for destino in suscritos:
+        suscripciones.suscribir(destino, f"token-{destino}")
+
+    # El archivo del día trae las filas más recientes; las columnas internas no vienen en el Excel.
+    recientes = base.tail(max(1, int(len(base) * frac_carga)))
+    recientes = recientes.loc[:, ~recientes.columns.str.startswith('_')]
+    nuevo = generar_actualizacion(recientes.astype({col: str for col in ['Destino', 'Producto', 'Estado de atención']}))
+    buffer = io.BytesIO()
+    nuevo.to_excel(buffer, index=False)
+    datos = buffer.getvalue()
+    with open(os.path.join(directorio, 'carga.xlsx'), 'wb') as f:
+        f.write(datos)
+    return len(base), len(nuevo), len(datos)
+
+
+# --- Carga Medida (en el proceso hijo) ---
+# Ejecuta la carga con lemargo/pipeline.py, igual que la app y la línea de comandos. La caché de
+# la base ya está caliente, como en una app en ejecución.
+def medir_carga(directorio, formato):
+    contexto = ContextoCarga.desde_directorio(directorio, formato)
+    contexto.cache.obtener()
+    with open(os.path.join(directorio, 'carga.xlsx'), 'rb') as f:
+        datos = f.read()
+    reiniciar_pico_memoria()
+    rss_inicial_mb, _ = memoria_mb()
+
+    resultado = ejecutar_carga(contexto, leer_excel(datos), hoy=HOY, dias_retencion=RETENCION)
+    if resultado.advertencias:
+        raise RuntimeError("; ".join(resultado.advertencias))
+
+    _, rss_pico_mb = memoria_mb()
+    return resultado.medicion, rss_inicial_mb, rss_pico_mb
+
+
+# --- Memoria del Proceso ---
+# Lee VmRSS y VmHWM (pico) de /proc en MB. Escribir '5' en clear_refs reinicia el pico, de modo
+# que lo que se mide es solo la carga; sin /proc (otros sistemas) se usa el RSS máximo de
+# getrusage, que incluye la preparación del proceso.
+def memoria_mb():
+    try:
+        with open('/proc/self/status') as f:
+            campos = dict(linea.split(':', 1) for linea in f)
+        return int(campos['VmRSS'].split()[0]) / 1024, int(campos['VmHWM'].split()[0]) / 1024
+    except (OSError, KeyError, ValueError):
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        return pico, pico
+
+
+def reiniciar_pico_memoria():
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def commit_actual():
+    try:
+        salida = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=RAIZ, capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return salida.stdout.strip()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la carga completa del Excel, sin Streamlit.")
+    parser.add_argument('--filas', type=int, nargs='+', default=[20_000, 100_000, 500_000], help="Filas de la base histórica.")
+    parser.add_argument('--frac-carga', type=float, default=0.05, help="Fracción de la base que trae el Excel.")
+    parser.add_argument('--frac-suscritos', type=float, default=0.25, help="Fracción de destinos con token.")
+    parser.add_argument('--formato', default='parquet')
+    parser.add_argument('--salida', help="Archivo JSONL al que se agrega el resultado de cada escala.")
+    args = parser.parse_args()
+
+    commit = commit_actual()
+    print(f"Formato: {args.formato}, commit: {commit or 'desconocido'}")
+    for filas in args.filas:
+        with tempfile.TemporaryDirectory() as directorio:
+            filas_base, filas_excel, bytes_excel = preparar_escala(
+                directorio, filas, args.frac_carga, args.formato, args.frac_suscritos)
+            # Un proceso nuevo por escala: su memoria no arrastra la preparación ni otras escalas.
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as ejecutor:
+                inicio = time.perf_counter()
+                medicion, rss_inicial_mb, rss_pico_mb = ejecutor.submit(medir_carga, directorio, args.formato).result()
+                pared_s = time.perf_counter() - inicio
+
+        total_s = medicion.total_s
+        print(f"\nBase: {filas_base} filas ({filas} generadas, antes de la retención) · Excel: {filas_excel} filas ({bytes_excel / 1024 / 1024:.1f} MB)")
+        for nombre, etiqueta in ETIQUETAS_TRAMOS.items():
+            if nombre in medicion.tramos:
+                segundos = medicion.tramos[nombre]
+                print(f"  {etiqueta:>32} {segundos:>8.3f} s {segundos / total_s * 100:>5.1f}%")
+        print(f"  {'Total':>32} {total_s:>8.3f} s  (proceso hijo: {pared_s:.2f} s)")
+        print(f"  {'Filas del Excel por segundo':>32} {filas_excel / total_s:>10.0f}")
+        print(f"  {'Pico de memoria (RSS)':>32} {rss_pico_mb:>8.0f} MB (+{rss_pico_mb - rss_inicial_mb:.0f} MB durante la carga)")
+        print("  " + " · ".join(f"{nombre.replace('_', ' ')}: {valor}" for nombre, valor in medicion.contadores.items()))
+
+        if args.salida:
+            exportar_medicion(
+                args.salida, medicion,
+                fecha=datetime.datetime.now().isoformat(timespec='seconds'), commit=commit, formato=args.formato,
+                filas_base=filas_base, filas_excel=filas_excel, bytes_excel=bytes_excel,
+                filas_por_s=round(filas_excel / total_s, 1),
+                rss_inicial_mb=round(rss_inicial_mb, 1), rss_pico_mb=round(rss_pico_mb, 1),
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,3 @@
+# --- Núcleo de Lemargo App de Consulta ---
+# Lógica de datos independiente de Streamlit (detección de cambios, almacenamiento,
+# notificaciones, etc.) para que pueda reutilizarse y medirse fuera de la interfaz.
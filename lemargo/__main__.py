@@ -0,0 +1,146 @@
+# --- Línea de Comandos ---
+# Cargas por lotes fuera del proceso web, con el mismo flujo que la app (ver lemargo/pipeline.py)
+# y sobre los mismos archivos de datos, así que la app ve la nueva base en su siguiente consulta.
+#
+# Uso: python -m lemargo cargar archivo.xlsx [otro.xlsx ...] [--directorio .] [--formato parquet]
+#                              [--hoja NOMBRE ...] [--procesos 4] [--dias-retencion 7] [--forzar] [--json]
+# ('ingest' es un alias de 'cargar'.) Todos los libros y hojas se integran en una sola carga.
+# Los avisos quedan en la cola de notificaciones; los envía el trabajador de la app o, con
+# --cuenta-servicio, este mismo proceso al terminar la carga.
+#
+#      python -m lemargo trabajador --cuenta-servicio cuenta.json [--directorio .] [--intervalo 5]
+# Vacía la cola de forma continua, fuera del proceso web (el trabajador de la app solo arranca
+# con el panel de administración o una carga), hasta Ctrl+C.
+import argparse
+import json
+import os
+import sys
+import time
+
+from lemargo.ingesta import MAX_PROCESOS_INGESTA, leer_libros
+from lemargo.pipeline import (
+    COLA_NOTIFICACIONES_PATH, DIAS_RETENCION, FORMATO_BASE, SUSCRIPCIONES_PATH, ContextoCarga, ejecutar_carga,
+)
+
+
+def cargar(args):
+    contexto = ContextoCarga.desde_directorio(args.directorio, args.formato)
+    archivos = []
+    for ruta in args.archivos:
+        with open(ruta, 'rb') as f:
+            archivos.append((ruta, f.read()))
+    ingesta = leer_libros(archivos, hojas=args.hoja, max_procesos=args.procesos)
+    resultado = ejecutar_carga(
+        contexto, ingesta, hoy=args.hoy, dias_retencion=args.dias_retencion,
+        espera_bloqueo=args.espera, forzar=args.forzar,
+    )
+    if args.cuenta_servicio and resultado.notificaciones_encoladas:
+        enviar_pendientes(contexto.cola, contexto.suscripciones, args.cuenta_servicio)
+
+    if args.json:
+        print(json.dumps({
+            'fecha': resultado.fecha,
+            'archivos': args.archivos,
+            'fuentes': ingesta.fuentes,
+            'omitidas': ingesta.omitidas,
+            'identico': resultado.identico,
+            'guardado': resultado.guardado,
+            **resultado.resumen(),
+            **resultado.medicion.como_dict(),
+            'advertencias': resultado.advertencias,
+        }, ensure_ascii=False))
+    elif resultado.identico:
+        print("El archivo es idéntico al último cargado. No se realizaron cambios.")
+    else:
+        for fuente in ingesta.fuentes:
+            print(f"{fuente['archivo']} ({fuente['hoja']}): {fuente['filas']} filas")
+        for omitida in ingesta.omitidas:
+            print(f"{omitida['archivo']} ({omitida['hoja']}): omitida, {omitida['motivo']}")
+        print(f"{ingesta.filas} filas leídas ({ingesta.filas_descartadas} descartadas sin 'Destino').")
+        print(" · ".join(f"{nombre.replace('_', ' ')}: {valor}" for nombre, valor in resultado.resumen().items()))
+        print("Base actualizada." if resultado.guardado else "Todas las filas coinciden con la base. No fue necesario actualizarla.")
+        print(f"Duración: {resultado.medicion.total_s:.2f} s")
+    for advertencia in resultado.advertencias:
+        print(f"Advertencia: {advertencia}", file=sys.stderr)
+    return 0
+
+
+# Trabajador de la cola que envía con la cuenta de servicio de 'ruta_cuenta_servicio'.
+def crear_trabajador(cola, suscripciones, ruta_cuenta_servicio, **opciones):
+    from lemargo.cola import TrabajadorCola
+    from lemargo.notificaciones import DespachadorNotificaciones, inicializar_firebase
+
+    with open(ruta_cuenta_servicio, 'r', encoding='utf-8') as f:
+        cuenta_servicio = f.read()
+
+    def crear_despachador():
+        inicializar_firebase(cuenta_servicio)
+        return DespachadorNotificaciones()
+
+    return TrabajadorCola(cola, crear_despachador, al_invalidar_tokens=suscripciones.eliminar_tokens, **opciones)
+
+
+# Vacía la cola de notificaciones en este proceso (como lo haría el trabajador de la app).
+def enviar_pendientes(cola, suscripciones, ruta_cuenta_servicio):
+    trabajador = crear_trabajador(cola, suscripciones, ruta_cuenta_servicio)
+    while trabajador.procesar_pendientes():
+        pass
+
+
+def trabajar(args):
+    from lemargo.cola import ColaNotificaciones
+    from lemargo.suscripciones import AlmacenSuscripciones
+
+    cola = ColaNotificaciones(os.path.join(args.directorio, COLA_NOTIFICACIONES_PATH))
+    suscripciones = AlmacenSuscripciones(os.path.join(args.directorio, SUSCRIPCIONES_PATH))
+    trabajador = crear_trabajador(cola, suscripciones, args.cuenta_servicio, intervalo=args.intervalo).iniciar()
+    print(f"Enviando los avisos de la cola cada {args.intervalo:g} s (Ctrl+C para detener).", flush=True)
+    ultimo_error = None
+    try:
+        while trabajador.activo:
+            time.sleep(1)
+            if trabajador.ultimo_error and trabajador.ultimo_error != ultimo_error:
+                print(f"Advertencia: {trabajador.ultimo_error}", file=sys.stderr)
+            ultimo_error = trabajador.ultimo_error
+    except KeyboardInterrupt:
+        trabajador.detener(espera=30)
+    return 0
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(prog='python -m lemargo', description="Herramientas de Lemargo sin interfaz.")
+    subcomandos = parser.add_subparsers(dest='comando', required=True)
+
+    carga = subcomandos.add_parser('cargar', aliases=['ingest'], help="Integra uno o varios archivos Excel a la base histórica.")
+    carga.add_argument('archivos', nargs='+', help="Archivos .xlsx a cargar.")
+    carga.add_argument('--directorio', default='.', help="Directorio de datos de la app.")
+    carga.add_argument('--formato', default=FORMATO_BASE, help="Formato del almacén (parquet, feather, json o sqlite).")
+    carga.add_argument('--hoja', action='append', help="Hoja a leer (índice o nombre); se puede repetir. Por omisión, "
+                                                      "todas las hojas con las columnas requeridas.")
+    carga.add_argument('--procesos', type=int, default=MAX_PROCESOS_INGESTA, help="Procesos que leen hojas en paralelo.")
+    carga.add_argument('--dias-retencion', type=int, default=DIAS_RETENCION)
+    carga.add_argument('--hoy', help="Fecha de referencia de la retención (AAAA-MM-DD); por omisión, hoy.")
+    carga.add_argument('--espera', type=float, default=None, help="Segundos a esperar el bloqueo de la base.")
+    carga.add_argument('--forzar', action='store_true', help="Procesa el archivo aunque sea idéntico al último.")
+    carga.add_argument('--cuenta-servicio', help="JSON de la cuenta de servicio de Firebase para enviar los avisos.")
+    carga.add_argument('--json', action='store_true', help="Imprime el resultado como una línea JSON.")
+    carga.set_defaults(funcion=cargar)
+
+    envio = subcomandos.add_parser('trabajador', help="Envía de forma continua los avisos de la cola de notificaciones.")
+    envio.add_argument('--directorio', default='.', help="Directorio de datos de la app.")
+    envio.add_argument('--cuenta-servicio', required=True, help="JSON de la cuenta de servicio de Firebase.")
+    envio.add_argument('--intervalo', type=float, default=5.0, help="Segundos entre revisiones de la cola.")
+    envio.set_defaults(funcion=trabajar)
+
+    args = parser.parse_args(argumentos)
+    if getattr(args, 'hoja', None):
+        args.hoja = [int(hoja) if hoja.isdigit() else hoja for hoja in args.hoja]
+    try:
+        return args.funcion(args)
+    except (OSError, ValueError, KeyError) as e:  # TimeoutError es un OSError
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,195 @@
+# --- Agregados del Dashboard ---
+# Conteos materializados por (día, producto, estado, destino) en SQLite. Se actualizan de
+# forma incremental en cada guardado de la base: se suman los registros que entraron y se
+# restan los que salieron (reemplazados o expirados), sin volver a recorrer la historia.
+# El dashboard consulta solo esta tabla, cuyo tamaño depende del número de combinaciones
+# distintas y no del número de registros.
+#
+# La tabla guarda la versión de la base con la que está sincronizada; si no coincide con
+# la versión actual (primera ejecución, base reiniciada o modificada por fuera) o las tablas
+# son de una versión anterior de este módulo (VERSION_TABLAS), se reconstruye completa a
+# partir de la base.
+import json
+import sqlite3
+from contextlib import closing
+
+import pandas as pd
+
+from lemargo.esquema import clases_de
+
+COLUMNAS_AGREGADO = ['Fecha', 'Producto', 'Estado de atención', 'Destino']
+
+# Tablas materializadas: el detalle por día y dos resúmenes más pequeños derivados de él,
+# uno por día sin destino (filtros y gráfica de estados) y otro histórico por clase de
+# estado y destino (Top 10). Las tres se actualizan en la misma transacción.
+TABLAS = {
+    'agregados': ['fecha', 'producto', 'estado', 'destino'],
+    'agregados_dia': ['fecha', 'producto', 'estado'],
+    'agregados_clase_destino': ['clase', 'destino'],
+}
+# Columnas del conteo de un conjunto de registros (contar), del que se derivan las tablas.
+COLUMNAS_DETALLE = TABLAS['agregados'] + ['clase']
+# Cambia cuando cambian las tablas; las de otra versión se reconstruyen.
+VERSION_TABLAS = '2'
+
+_ESQUEMA = "\n".join(
+    f"""CREATE TABLE IF NOT EXISTS {tabla} (
+    {', '.join(f'{col} TEXT NOT NULL' for col in columnas)},
+    cantidad INTEGER NOT NULL,
+    PRIMARY KEY ({', '.join(columnas)})
+) WITHOUT ROWID;"""
+    for tabla, columnas in TABLAS.items()
+) + """
+DROP TABLE IF EXISTS agregados_estado_destino;
+CREATE TABLE IF NOT EXISTS metadatos (
+    clave TEXT PRIMARY KEY,
+    valor TEXT
+);
+"""
+
+# --- Conteo de un Conjunto de Registros ---
+# Devuelve un DataFrame (fecha, producto, estado, destino, clase, cantidad). Se agrupa sobre
+# los valores originales (categorías y fechas) y solo se convierten a texto las combinaciones
+# resultantes. Los valores vacíos quedan como '' para que formen parte de la clave y las
+# fechas como 'AAAA-MM-DD'. La clase es la guardada con cada registro ('_clase_estado').
+def contar(df, signo=1):
+    columnas = COLUMNAS_DETALLE
+    if df is None or df.empty:
+        return pd.DataFrame(columns=columnas + ['cantidad'])
+    faltantes = [col for col in COLUMNAS_AGREGADO if col not in df.columns]
+    if faltantes:
+        raise KeyError(f"Faltan columnas para los agregados: {faltantes}")
+
+    claves = pd.DataFrame({
+        'fecha': pd.to_datetime(df['Fecha'], errors='coerce').dt.normalize().to_numpy(),
+        'producto': df['Producto'].to_numpy(),
+        'estado': df['Estado de atención'].to_numpy(),
+        'destino': df['Destino'].to_numpy(),
+        'clase': clases_de(df).to_numpy(),
+    })
+    conteo = claves.groupby(columnas, sort=False, dropna=False).size().rename('cantidad').reset_index()
+    conteo['fecha'] = conteo['fecha'].dt.strftime('%Y-%m-%d').fillna('')
+    for col in columnas[1:]:
+        conteo[col] = conteo[col].astype(object).fillna('').astype(str)
+    conteo['cantidad'] *= signo
+    # Las combinaciones que solo difieren en valores vacíos (NaN/None) se vuelven a sumar.
+    return conteo.groupby(columnas, sort=False)['cantidad'].sum().reset_index()
+
+
+# Suma el detalle al nivel de cada tabla y lo devuelve ordenado por su clave (inserción más rápida).
+def _por_tabla(detalle):
+    for tabla, columnas in TABLAS.items():
+        nivel = detalle.groupby(columnas, sort=True)['cantidad'].sum().reset_index()
+        nivel = nivel[nivel['cantidad'] != 0]
+        yield tabla, columnas, [
+            (*claves, int(cantidad)) for *claves, cantidad in nivel.itertuples(index=False, name=None)
+        ]
+
+
+class AgregadosDashboard:
+    def __init__(self, ruta):
+        self.ruta = ruta
+        with closing(self._conectar()) as conexion:
+            conexion.execute("PRAGMA journal_mode=WAL")
+            conexion.executescript(_ESQUEMA)
+
+    def _conectar(self):
+        return sqlite3.connect(self.ruta, timeout=30)
+
+    # --- Versión Sincronizada ---
+    # None si las tablas no están sincronizadas o son de otra VERSION_TABLAS.
+    def version(self):
+        with closing(self._conectar()) as conexion:
+            return self._version(conexion)
+
+    @staticmethod
+    def _version(conexion):
+        valores = dict(conexion.execute("SELECT clave, valor FROM metadatos WHERE clave IN ('version', 'tablas')"))
+        return valores.get('version') if valores.get('tablas') == VERSION_TABLAS else None
+
+    @staticmethod
+    def _fijar_version(conexion, version):
+        conexion.executemany(
+            "INSERT OR REPLACE INTO metadatos (clave, valor) VALUES (?, ?)",
+            [('version', None if version is None else str(version)), ('tablas', VERSION_TABLAS)],
+        )
+
+    # --- Reconstrucción Completa ---
+    # Recalcula todos los conteos a partir de la base completa.
+    def reconstruir(self, df, version):
+        detalle = contar(df)
+        with closing(self._conectar()) as conexion, conexion:
+            for tabla, columnas, filas in _por_tabla(detalle):
+                conexion.execute(f"DELETE FROM {tabla}")
+                conexion.executemany(
+                    f"INSERT INTO {tabla} ({', '.join(columnas)}, cantidad) VALUES ({', '.join('?' * (len(columnas) + 1))})",
+                    filas,
+                )
+            self._fijar_version(conexion, version)
+
+    # --- Actualización Incremental ---
+    # Suma los registros 'agregados' y resta los 'eliminados'. Solo se aplica si las tablas están
+    # sincronizadas con 'version_anterior'; devuelve False si no lo están (hay que reconstruir).
+    def actualizar(self, agregados, eliminados, version_anterior, version):
+        delta = pd.concat([contar(agregados), contar(eliminados, signo=-1)], ignore_index=True)
+
+        with closing(self._conectar()) as conexion, conexion:
+            if self._version(conexion) != str(version_anterior):
+                return False
+            for tabla, columnas, filas in _por_tabla(delta):
+                conexion.executemany(
+                    f"""INSERT INTO {tabla} ({', '.join(columnas)}, cantidad) VALUES ({', '.join('?' * (len(columnas) + 1))})
+                        ON CONFLICT ({', '.join(columnas)}) DO UPDATE SET cantidad = cantidad + excluded.cantidad""",
+                    filas,
+                )
+                conexion.execute(f"DELETE FROM {tabla} WHERE cantidad <= 0")
+            self._fijar_version(conexion, version)
+        return True
+
+    def reiniciar(self):
+        with closing(self._conectar()) as conexion, conexion:
+            for tabla in TABLAS:
+                conexion.execute(f"DELETE FROM {tabla}")
+            conexion.execute("DELETE FROM metadatos")
+
+    # --- Consultas del Dashboard ---
+    def fechas(self):
+        with closing(self._conectar()) as conexion:
+            filas = conexion.execute("SELECT DISTINCT fecha FROM agregados_dia WHERE fecha != '' ORDER BY fecha DESC")
+            return [fecha for (fecha,) in filas]
+
+    # Valores distintos de 'producto' o 'estado'.
+    def valores(self, columna):
+        if columna not in ('producto', 'estado'):
+            raise ValueError(f"Columna no agregada: {columna}")
+        with closing(self._conectar()) as conexion:
+            return [valor for (valor,) in conexion.execute(f"SELECT DISTINCT {columna} FROM agregados_dia ORDER BY {columna}")]
+
+    # Conteo por 'columna' ('estado' o 'destino') de un día, filtrado por productos y estados.
+    # 'productos' o 'estados' vacíos o None no filtran.
+    def conteo_por(self, columna, fecha, productos=None, estados=None):
+        tablas = {'estado': 'agregados_dia', 'destino': 'agregados'}
+        if columna not in tablas:
+            raise ValueError(f"Columna no agregada: {columna}")
+        consulta = f"SELECT {columna}, SUM(cantidad) AS cantidad FROM {tablas[columna]} WHERE fecha = ? AND {columna} != ''"
+        parametros = [fecha]
+        if productos:
+            consulta += " AND producto IN (SELECT value FROM json_each(?))"
+            parametros.append(json.dumps(list(productos)))
+        if estados:
+            consulta += " AND estado IN (SELECT value FROM json_each(?))"
+            parametros.append(json.dumps(list(estados)))
+        consulta += f" GROUP BY {columna} ORDER BY cantidad DESC, {columna}"
+        with closing(self._conectar()) as conexion:
+            return pd.read_sql_query(consulta, conexion, params=parametros)
+
+    # Destinos con más registros de la clase de estado indicada (lemargo/esquema.py) en toda la historia.
+    def top_destinos(self, clase, limite=10):
+        with closing(self._conectar()) as conexion:
+            return pd.read_sql_query(
+                """SELECT destino, cantidad FROM agregados_clase_destino
+                   WHERE clase = ? AND destino != ''
+                   ORDER BY cantidad DESC, destino LIMIT ?""",
+                conexion,
+                params=(clase, limite),
+            )
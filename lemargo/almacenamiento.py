@@ -0,0 +1,246 @@
+# --- Almacenamiento de la Base Histórica (golden record) ---
+# Backends intercambiables para leer y escribir la base histórica. El formato columnar
+# (Parquet/Feather) conserva los tipos de datos, por lo que 'Fecha' vuelve como fecha
+# y las columnas de baja cardinalidad vuelven como categorías sin conversión adicional.
+# El backend SQLite además resuelve consultas (por destino o por día) con índices, sin
+# cargar la base completa en memoria.
+import json
+import os
+import sqlite3
+from contextlib import closing
+
+import numpy as np
+import pandas as pd
+
+from lemargo.escritura import BloqueoArchivo, escribir_atomico
+from lemargo.esquema import COLUMNA_DESTINO_NUM, agregar_derivadas, destinos_de, preparar_tipos
+from lemargo.normalizacion import estandarizar_texto
+
+
+# --- Backend Base ---
+# Define la interfaz común; cada backend solo implementa _leer y _escribir.
+class AlmacenBase:
+    extension = ''
+    # True si el backend puede filtrar en el motor (ver AlmacenSQLite).
+    consultas_en_motor = False
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+
+    def existe(self):
+        return os.path.exists(self.ruta)
+
+    def tamano_bytes(self):
+        return os.path.getsize(self.ruta) if self.existe() else 0
+
+    def eliminar(self):
+        if self.existe():
+            os.remove(self.ruta)
+            return True
+        return False
+
+    def cargar(self):
+        if not self.existe():
+            return pd.DataFrame()
+        return agregar_derivadas(preparar_tipos(self._leer()))
+
+    # Bloqueo exclusivo entre procesos para los escritores; los lectores no lo necesitan.
+    def bloqueo(self, espera=None):
+        return BloqueoArchivo(self.ruta, espera=espera)
+
+    # Escribe en un temporal y lo renombra sobre la ruta: los lectores nunca ven un archivo a medias.
+    def guardar(self, df):
+        df = agregar_derivadas(preparar_tipos(df)).reset_index(drop=True)
+        with self.bloqueo():
+            escribir_atomico(self.ruta, lambda temporal: self._escribir(df, temporal))
+
+    def _leer(self):
+        raise NotImplementedError
+
+    def _escribir(self, df, ruta):
+        raise NotImplementedError
+
+
+# Formato original: JSON orientado a registros con fechas ISO.
+class AlmacenJSON(AlmacenBase):
+    extension = '.json'
+
+    def _leer(self):
+        return pd.read_json(self.ruta)
+
+    def _escribir(self, df, ruta):
+        df.to_json(ruta, orient='records', date_format='iso')
+
+
+# Parquet: columnar y comprimido; formato recomendado para la base histórica.
+class AlmacenParquet(AlmacenBase):
+    extension = '.parquet'
+
+    def _leer(self):
+        return pd.read_parquet(self.ruta)
+
+    def _escribir(self, df, ruta):
+        df.to_parquet(ruta, index=False)
+
+
+# Feather (Arrow IPC): lectura más rápida a cambio de archivos algo más grandes.
+class AlmacenFeather(AlmacenBase):
+    extension = '.feather'
+
+    def _leer(self):
+        return pd.read_feather(self.ruta)
+
+    def _escribir(self, df, ruta):
+        df.to_feather(ruta)
+
+
+# SQLite: tabla con índices por número de destino, fecha y estado. Las consultas del panel
+# de usuario y el detalle del dashboard se resuelven en el motor, sin cargar toda la base.
+# Usa WAL, como la cola, las suscripciones y el historial: mientras se guarda, los lectores
+# siguen viendo la última versión confirmada en lugar de esperar el bloqueo. Con WAL el commit
+# no toca el archivo principal, así que tras cada guardado se actualiza su fecha de
+# modificación, que es la versión con la que se invalidan las cachés.
+class AlmacenSQLite(AlmacenBase):
+    extension = '.db'
+    consultas_en_motor = True
+    tabla = 'golden_record'
+    # Número de destino guardado con cada registro (ver lemargo/esquema.py), indexado.
+    columna_destino_num = COLUMNA_DESTINO_NUM
+    _indices = {'idx_golden_destino': COLUMNA_DESTINO_NUM, 'idx_golden_fecha': 'Fecha', 'idx_golden_estado': 'Estado de atención'}
+
+    def _conectar(self):
+        return sqlite3.connect(self.ruta, timeout=30)
+
+    # También borra el WAL y su índice compartido, que no deben quedar junto a una base nueva.
+    def eliminar(self):
+        for sufijo in ('-wal', '-shm'):
+            if os.path.exists(self.ruta + sufijo):
+                os.remove(self.ruta + sufijo)
+        return super().eliminar()
+
+    @staticmethod
+    def _id(nombre):
+        return '"' + str(nombre).replace('"', '""') + '"'
+
+    # SQLite solo tiene enteros con signo: las columnas uint64 (hashes) se guardan como int64
+    # y se anotan en 'metadatos' para restaurarlas al leer.
+    def _leer(self):
+        with closing(self._conectar()) as conexion:
+            df = pd.read_sql_query(f"SELECT * FROM {self.tabla}", conexion)
+            fila = conexion.execute("SELECT valor FROM metadatos WHERE clave = 'columnas_uint64'").fetchone()
+        return self._desde_sql(df, json.loads(fila[0]) if fila else [])
+
+    def _desde_sql(self, df, columnas_uint64):
+        for col in columnas_uint64:
+            if col in df.columns:
+                df[col] = df[col].to_numpy(dtype=np.int64).view(np.uint64)
+        return df
+
+    # El intercambio de tablas ya es transaccional: se escribe sobre el mismo archivo (las
+    # conexiones abiertas de otros procesos siguen siendo válidas), solo con el bloqueo.
+    def guardar(self, df):
+        df = agregar_derivadas(preparar_tipos(df)).reset_index(drop=True)
+        with self.bloqueo():
+            self._escribir(df, self.ruta)
+
+    def _escribir(self, df, ruta):
+        columnas_uint64 = [col for col in df.columns if df[col].dtype == np.uint64]
+        tabla = df.assign(**{col: df[col].to_numpy().view(np.int64) for col in columnas_uint64})
+        if 'Destino' in tabla.columns:
+            tabla[self.columna_destino_num] = destinos_de(tabla)
+        for col in tabla.columns:
+            if isinstance(tabla[col].dtype, pd.CategoricalDtype):
+                tabla[col] = tabla[col].astype(object)
+
+        # Se carga una tabla nueva y se intercambia en una sola transacción: los lectores ven
+        # la versión anterior completa o la nueva, nunca una tabla a medias.
+        nueva = f"{self.tabla}_nueva"
+        with closing(sqlite3.connect(ruta, timeout=30)) as conexion:
+            conexion.execute("PRAGMA journal_mode=WAL")
+            conexion.execute(f"DROP TABLE IF EXISTS {nueva}")
+            tabla.to_sql(nueva, conexion, index=False)
+            with conexion:
+                conexion.execute("CREATE TABLE IF NOT EXISTS metadatos (clave TEXT PRIMARY KEY, valor TEXT)")
+                conexion.execute(f"DROP TABLE IF EXISTS {self.tabla}")
+                conexion.execute(f"ALTER TABLE {nueva} RENAME TO {self.tabla}")
+                for indice, columna in self._indices.items():
+                    if columna in tabla.columns:
+                        conexion.execute(f"CREATE INDEX {indice} ON {self.tabla} ({self._id(columna)})")
+                conexion.execute(
+                    "INSERT OR REPLACE INTO metadatos (clave, valor) VALUES ('columnas_uint64', ?)",
+                    (json.dumps(columnas_uint64),),
+                )
+            # Pasa al archivo principal lo que ningún lector esté usando (sin esperar a nadie).
+            conexion.execute("PRAGMA wal_checkpoint(PASSIVE)")
+        os.utime(ruta)
+
+    # --- Consultas en el Motor ---
+    @property
+    def columnas(self):
+        if not self.existe():
+            return []
+        with closing(self._conectar()) as conexion:
+            filas = conexion.execute(f"PRAGMA table_info({self.tabla})").fetchall()
+        return [fila[1] for fila in filas]
+
+    def _consultar(self, columnas, condiciones, parametros):
+        disponibles = self.columnas
+        columnas = [col for col in (columnas or disponibles) if col in disponibles]
+        consulta = f"SELECT {', '.join(self._id(col) for col in columnas)} FROM {self.tabla}"
+        if condiciones:
+            consulta += " WHERE " + " AND ".join(condiciones)
+        with closing(self._conectar()) as conexion:
+            df = pd.read_sql_query(consulta, conexion, params=parametros)
+            fila = conexion.execute("SELECT valor FROM metadatos WHERE clave = 'columnas_uint64'").fetchone()
+        return preparar_tipos(self._desde_sql(df, json.loads(fila[0]) if fila else []))
+
+    # Misma interfaz que IndiceDestinos.buscar: filas del destino 'numero' con 'Destino' estandarizado.
+    def buscar(self, numero, columnas=None):
+        resultado = self._consultar(columnas, [f"{self.columna_destino_num} = ?"], [str(numero).strip()])
+        if 'Destino' in resultado.columns:
+            resultado['Destino'] = estandarizar_texto(resultado['Destino'])
+        return resultado
+
+    # Registros de un día, opcionalmente filtrados por productos y estados (vacíos no filtran).
+    def filas_del_dia(self, fecha, productos=None, estados=None, columnas=None):
+        inicio = pd.Timestamp(fecha).normalize()
+        condiciones = ['"Fecha" >= ?', '"Fecha" < ?']
+        parametros = [str(inicio), str(inicio + pd.Timedelta(days=1))]
+        if productos:
+            condiciones.append('"Producto" IN (SELECT value FROM json_each(?))')
+            parametros.append(json.dumps([str(p) for p in productos]))
+        if estados:
+            condiciones.append('"Estado de atención" IN (SELECT value FROM json_each(?))')
+            parametros.append(json.dumps([str(e) for e in estados]))
+        return self._consultar(columnas, condiciones, parametros)
+
+
+BACKENDS = {
+    'json': AlmacenJSON,
+    'parquet': AlmacenParquet,
+    'feather': AlmacenFeather,
+    'sqlite': AlmacenSQLite,
+}
+
+
+# --- Selección de Backend ---
+# Devuelve el backend para 'formato', guardando en '<ruta_base><extensión>'.
+def obtener_almacen(formato, ruta_base="golden_record"):
+    try:
+        clase = BACKENDS[formato]
+    except KeyError:
+        raise ValueError(f"Formato de almacenamiento no soportado: '{formato}'. Opciones: {sorted(BACKENDS)}")
+    return clase(ruta_base + clase.extension)
+
+
+# --- Migración Única desde JSON ---
+# Si el backend destino aún no tiene datos y existe el JSON anterior, copia los datos
+# al nuevo formato y renombra el JSON a '<ruta>.migrado' como respaldo.
+# Devuelve True si se realizó la migración.
+def migrar_desde_json(almacen, ruta_json):
+    if isinstance(almacen, AlmacenJSON) or almacen.existe() or not os.path.exists(ruta_json):
+        return False
+    df = AlmacenJSON(ruta_json).cargar()
+    almacen.guardar(df)
+    os.replace(ruta_json, ruta_json + '.migrado')
+    return True
@@ -0,0 +1,222 @@
+# --- Endpoint JSON de Consulta de Destinos ---
+# Servidor HTTP mínimo y de solo lectura (biblioteca estándar) que responde
+# GET /destino/<número> con el mismo resumen JSON que la PWA guarda como última consulta
+# (fichas.resumen_consulta), sin sesión de Streamlit, WebSocket ni re-ejecución del script.
+#
+# Lee del mismo almacén que la app: con un backend que consulta en el motor (SQLite) la
+# búsqueda va directo al índice de la tabla; con los demás se usa una CacheBase (la de la app
+# si corre en el mismo proceso) y un IndiceDestinos que se reconstruye solo cuando cambia la base.
+#
+# El ETag se deriva de la versión del archivo de la base y del destino, de modo que un
+# If-None-Match vigente se responde con 304 tras un os.stat, sin tocar los datos. Las respuestas
+# ya serializadas se guardan por destino mientras no cambie la versión de la base; si un
+# guardado termina mientras se arma una respuesta, esa respuesta no se guarda.
+#
+# Por omisión solo escucha en 127.0.0.1. Exponerlo en otras interfaces es una elección
+# explícita: --host 0.0.0.0 en la línea de comandos o API_HOST en los secretos de la app.
+#
+# Si el endpoint corre en otro puerto, un proxy inverso puede publicarlo como /destino/ en el
+# mismo origen de la app para que el Service Worker lo use al revalidar la última consulta.
+#
+# Uso: python -m lemargo.api [--base golden_record] [--formato parquet] [--host 127.0.0.1] [--puerto 8502]
+import argparse
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
+
+from lemargo.cache import CacheBase
+from lemargo.fichas import COLUMNAS_FICHA, resumen_consulta
+from lemargo.indice import IndiceDestinos
+
+PREFIJO_DESTINO = '/destino/'
+HOST_POR_OMISION = '127.0.0.1'
+
+# Respuestas serializadas que se conservan por versión de la base (las menos usadas salen primero).
+MAX_RESPUESTAS_EN_CACHE = 4096
+
+
+# --- Consultas sobre el Almacén ---
+class ConsultaDestinos:
+    def __init__(self, almacen, cache=None, max_respuestas=MAX_RESPUESTAS_EN_CACHE):
+        self.almacen = almacen
+        self.cache = cache if cache is not None else CacheBase(almacen)
+        self.max_respuestas = max_respuestas
+        self._candado = threading.Lock()
+        self._indice = None
+        self._generacion = None
+        self._respuestas = OrderedDict()  # destino -> cuerpo JSON (bytes) o None si no existe
+        self._version_respuestas = None
+
+    # Versión de la base según el archivo (mtime y tamaño), o None si todavía no existe.
+    def version(self):
+        try:
+            estado = os.stat(self.almacen.ruta)
+        except OSError:
+            return None
+        return f"{estado.st_mtime_ns}-{estado.st_size}"
+
+    def etag(self, version, numero):
+        return '"' + hashlib.sha1(f"{version}:{numero}".encode('utf-8')).hexdigest()[:20] + '"'
+
+    # Índice vigente: se reconstruye solo cuando la caché recargó la base (nueva generación).
+    def indice(self):
+        if self.almacen.consultas_en_motor:
+            return self.almacen
+        df = self.cache.obtener()
+        with self._candado:
+            if self._indice is None or self._generacion != self.cache.generacion:
+                self._indice = IndiceDestinos(df)
+                self._generacion = self.cache.generacion
+            return self._indice
+
+    # Resumen JSON de las fichas del destino 'numero', o None si no tiene registros.
+    def consultar(self, numero):
+        resultado = self.indice().buscar(numero, COLUMNAS_FICHA)
+        if resultado.empty:
+            return None
+        return resumen_consulta(numero.upper(), resultado)
+
+    # Cuerpo JSON (bytes) de la respuesta para 'numero' en la versión 'version', o None si el
+    # destino no tiene registros. Solo la primera petición de cada destino consulta la base. Si la
+    # base cambió durante la consulta, el cuerpo se devuelve pero no se guarda: podría venir de la
+    # versión nueva y quedaría bajo el ETag de la anterior.
+    def cuerpo(self, version, numero):
+        with self._candado:
+            if self._version_respuestas != version:
+                self._respuestas.clear()
+                self._version_respuestas = version
+            elif numero in self._respuestas:
+                self._respuestas.move_to_end(numero)
+                return self._respuestas[numero]
+
+        resumen = self.consultar(numero)
+        cuerpo = None if resumen is None else json.dumps(resumen, ensure_ascii=False).encode('utf-8')
+        if self.version() != version:
+            return cuerpo
+        with self._candado:
+            if self._version_respuestas == version:
+                self._respuestas[numero] = cuerpo
+                if len(self._respuestas) > self.max_respuestas:
+                    self._respuestas.popitem(last=False)
+        return cuerpo
+
+
+# --- Manejador HTTP ---
+class ManejadorDestinos(BaseHTTPRequestHandler):
+    server_version = 'LemargoAPI/1.0'
+    protocol_version = 'HTTP/1.1'  # Conexiones persistentes (keep-alive)
+    # Encabezados y cuerpo salen en escrituras separadas: sin esto, Nagle y el ACK diferido
+    # del cliente agregan ~40 ms a cada respuesta con cuerpo.
+    disable_nagle_algorithm = True
+
+    # 'cuerpo' es un objeto JSON o bytes ya serializados.
+    def _responder(self, estado, cuerpo=None, encabezados=None):
+        if cuerpo is None:
+            datos = b''
+        elif isinstance(cuerpo, bytes):
+            datos = cuerpo
+        else:
+            datos = json.dumps(cuerpo, ensure_ascii=False).encode('utf-8')
+        self.send_response(estado)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Expose-Headers', 'ETag')
+        if datos:
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(datos)))
+        for nombre, valor in (encabezados or {}).items():
+            self.send_header(nombre, valor)
+        self.end_headers()
+        if datos and self.command != 'HEAD':
+            self.wfile.write(datos)
+
+    def do_GET(self):
+        ruta = urlsplit(self.path).path
+        numero = unquote(ruta[len(PREFIJO_DESTINO):]).strip() if ruta.startswith(PREFIJO_DESTINO) else ''
+        if not numero or '/' in numero:
+            self._responder(HTTPStatus.NOT_FOUND, {'error': 'Ruta no encontrada. Use /destino/<número>.'})
+            return
+
+        consulta = self.server.consulta
+        version = consulta.version()
+        if version is None:
+            self._responder(HTTPStatus.SERVICE_UNAVAILABLE, {'error': 'La base de datos principal no ha sido cargada.'})
+            return
+
+        # 'no-cache': el cliente puede guardar la respuesta pero debe revalidarla (If-None-Match).
+        encabezados = {'ETag': consulta.etag(version, numero.upper()), 'Cache-Control': 'no-cache'}
+        candidatos = [valor.strip() for valor in self.headers.get('If-None-Match', '').split(',')]
+        if encabezados['ETag'] in candidatos or '*' in candidatos:
+            self._responder(HTTPStatus.NOT_MODIFIED, encabezados=encabezados)
+            return
+
+        try:
+            cuerpo = consulta.cuerpo(version, numero)
+        except Exception as e:
+            self._responder(HTTPStatus.INTERNAL_SERVER_ERROR, {'error': f"Error al consultar la base: {e}"})
+            return
+        if cuerpo is None:
+            self._responder(HTTPStatus.NOT_FOUND, {'error': f"No se encontró el destino {numero}."}, encabezados)
+            return
+        self._responder(HTTPStatus.OK, cuerpo, encabezados)
+
+    do_HEAD = do_GET
+
+    # Preflight de CORS: If-None-Match no es un encabezado "simple".
+    def do_OPTIONS(self):
+        self._responder(HTTPStatus.NO_CONTENT, encabezados={
+            'Access-Control-Allow-Methods': 'GET, HEAD, OPTIONS',
+            'Access-Control-Allow-Headers': 'If-None-Match',
+            'Access-Control-Max-Age': '86400',
+        })
+
+    def log_message(self, formato, *args):
+        if self.server.registrar_peticiones:
+            super().log_message(formato, *args)
+
+
+# --- Servidor ---
+def crear_servidor(consulta, host=HOST_POR_OMISION, puerto=8502, registrar_peticiones=False):
+    servidor = ThreadingHTTPServer((host, puerto), ManejadorDestinos)
+    servidor.daemon_threads = True
+    servidor.consulta = consulta
+    servidor.registrar_peticiones = registrar_peticiones
+    return servidor
+
+
+# Atiende peticiones en un hilo de fondo (p. ej. dentro del proceso de Streamlit).
+def iniciar_en_hilo(servidor):
+    hilo = threading.Thread(target=servidor.serve_forever, name='lemargo-api', daemon=True)
+    hilo.start()
+    return hilo
+
+
+def main(argumentos=None):
+    from lemargo.almacenamiento import obtener_almacen
+
+    parser = argparse.ArgumentParser(description="Endpoint JSON de solo lectura: GET /destino/<número>.")
+    parser.add_argument('--base', default='golden_record', help="Ruta de la base sin extensión.")
+    parser.add_argument('--formato', default='parquet', help="Formato del almacén (parquet, feather, json o sqlite).")
+    parser.add_argument('--host', default=HOST_POR_OMISION,
+                        help="Interfaz en la que escucha (0.0.0.0 para todas; por omisión solo local)."),
+    parser.add_argument('--puerto', type=int, default=8502)
+    parser.add_argument('--registrar', action='store_true', help="Muestra cada petición en la salida de errores.")
+    args = parser.parse_args(argumentos)
+
+    consulta = ConsultaDestinos(obtener_almacen(args.formato, ruta_base=args.base))
+    servidor = crear_servidor(consulta, args.host, args.puerto, registrar_peticiones=args.registrar)
+    print(f"Sirviendo GET {PREFIJO_DESTINO}<número> en http://{args.host}:{args.puerto}", flush=True)
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+# --- Caché Compartida de la Base Histórica ---
+# Mantiene una sola copia de la base en memoria para todo el proceso. Cada lectura compara
+# la firma del archivo (mtime, tamaño e inodo) con la de la copia en memoria y solo vuelve
+# a cargar cuando el archivo cambió; cada recarga incrementa la generación.
+#
+# A diferencia de st.cache_data, no se serializa ni se copia el DataFrame en cada llamada:
+# las sesiones reciben una vista superficial (sin copiar datos) de la misma copia. Las
+# asignaciones de columnas completas en la vista no afectan a la copia compartida, y con
+# Copy-on-Write tampoco las modificaciones in situ. Copy-on-Write es el único modo desde
+# pandas 3.0, que es la versión mínima de requirements.txt. En pandas 2.x estaba apagado, y
+# una sesión habría modificado la base de todas.
+import os
+import threading
+
+import pandas as pd
+
+
+class CacheBase:
+    def __init__(self, almacen):
+        self.almacen = almacen
+        self._candado = threading.Lock()
+        self._firma = None
+        self._df = pd.DataFrame()
+        self.generacion = 0
+
+    # Firma del archivo actual, o None si no existe.
+    def _firma_actual(self):
+        try:
+            estado = os.stat(self.almacen.ruta)
+        except OSError:
+            return None
+        return estado.st_mtime_ns, estado.st_size, estado.st_ino
+
+    @property
+    def firma(self):
+        return self._firma
+
+    # --- Lectura ---
+    # Devuelve una vista de la base vigente, recargándola solo si el archivo cambió.
+    def obtener(self):
+        firma = self._firma_actual()
+        if firma != self._firma:
+            with self._candado:
+                # Otra sesión pudo haber recargado mientras se esperaba el candado.
+                firma = self._firma_actual()
+                if firma != self._firma:
+                    self._df = self.almacen.cargar() if firma is not None else pd.DataFrame()
+                    self._firma = firma
+                    self.generacion += 1
+        return self._df.copy(deep=False)
+
+    # Descarta la copia en memoria; la siguiente lectura vuelve a cargar el archivo.
+    def invalidar(self):
+        with self._candado:
+            self._firma = None
+            self._df = pd.DataFrame()
+            self.generacion += 1
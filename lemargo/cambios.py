@@ -0,0 +1,147 @@
+# --- Motor de Detección de Cambios ---
+# Compara dos versiones de la base histórica con un único join por clave y devuelve
+# los registros agregados, eliminados y los que cambiaron de 'Estado de atención'.
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from lemargo.esquema import COLUMNA_DESTINO_NUM
+from lemargo.fusion import COLUMNA_CLAVE as COLUMNA_CLAVE_HASH
+from lemargo.normalizacion import estandarizar_columnas
+
+# Columnas que forman la clave única de un registro.
+COLUMNAS_CLAVE = ['Destino', 'Folio pedido', 'Producto', 'Fecha']
+COLUMNA_ESTADO = 'Estado de atención'
+
+
+# --- Resultado de la Comparación ---
+# Cada conjunto es un DataFrame con las columnas clave; 'cambios_estado' además incluye
+# 'Estado de atención_old' y 'Estado de atención_new'.
+@dataclass
+class ResultadoCambios:
+    agregados: pd.DataFrame
+    eliminados: pd.DataFrame
+    cambios_estado: pd.DataFrame
+
+    @property
+    def hay_cambios(self):
+        return not (self.agregados.empty and self.eliminados.empty and self.cambios_estado.empty)
+
+
+# --- Limpieza de Claves ---
+# Estandariza las columnas de texto y normaliza 'Fecha' a 'YYYY-MM-DD' para que las
+# claves de ambas versiones sean comparables.
+def normalizar_claves(df):
+    df_limpio = estandarizar_columnas(df, conservar_faltantes=False)
+
+    if 'Fecha' in df_limpio.columns:
+        df_limpio['Fecha'] = pd.to_datetime(df_limpio['Fecha'], errors='coerce').dt.strftime('%Y-%m-%d')
+
+    return df_limpio
+
+
+# Reduce un DataFrame a clave + estado, con una sola fila por clave.
+# Si una clave aparece varias veces se conserva la última, igual que en la fusión de datos.
+def _proyectar(df):
+    columnas = COLUMNAS_CLAVE + [COLUMNA_ESTADO]
+    faltantes = [col for col in columnas if col not in df.columns]
+    if faltantes:
+        raise KeyError(f"Faltan columnas para comparar: {faltantes}")
+    return normalizar_claves(df[columnas]).drop_duplicates(subset=COLUMNAS_CLAVE, keep='last')
+
+
+# --- Detección de Cambios ---
+# Realiza un solo merge externo sobre COLUMNAS_CLAVE; el costo crece de forma
+# prácticamente lineal con el número de filas. Si ambas versiones traen la clave entera de la
+# fusión ('_clave'), se compara por ella y por los códigos del estado (ver _detectar_por_clave).
+def detectar_cambios(old_df, new_df):
+    if COLUMNA_CLAVE_HASH in old_df.columns and COLUMNA_CLAVE_HASH in new_df.columns:
+        return _detectar_por_clave(old_df, new_df)
+
+    old_proj = _proyectar(old_df)
+    new_proj = _proyectar(new_df)
+
+    # Con un lado vacío no hace falta el merge (y pandas no puede unir claves de texto Arrow
+    # vacías en ambos lados).
+    if old_proj.empty or new_proj.empty:
+        sin_cambios = pd.DataFrame(columns=COLUMNAS_CLAVE + [f'{COLUMNA_ESTADO}_old', f'{COLUMNA_ESTADO}_new'])
+        return ResultadoCambios(
+            agregados=new_proj.reset_index(drop=True),
+            eliminados=old_proj.reset_index(drop=True),
+            cambios_estado=sin_cambios,
+        )
+
+    unidos = old_proj.merge(
+        new_proj,
+        on=COLUMNAS_CLAVE,
+        how='outer',
+        suffixes=('_old', '_new'),
+        indicator=True,
+        sort=False,
+    )
+    estado_old = f'{COLUMNA_ESTADO}_old'
+    estado_new = f'{COLUMNA_ESTADO}_new'
+
+    agregados = unidos.loc[unidos['_merge'] == 'right_only', COLUMNAS_CLAVE + [estado_new]]
+    agregados = agregados.rename(columns={estado_new: COLUMNA_ESTADO})
+
+    eliminados = unidos.loc[unidos['_merge'] == 'left_only', COLUMNAS_CLAVE + [estado_old]]
+    eliminados = eliminados.rename(columns={estado_old: COLUMNA_ESTADO})
+
+    ambos = unidos['_merge'] == 'both'
+    cambios_estado = unidos.loc[
+        ambos & (unidos[estado_old] != unidos[estado_new]),
+        COLUMNAS_CLAVE + [estado_old, estado_new],
+    ]
+
+    return ResultadoCambios(
+        agregados=agregados.reset_index(drop=True),
+        eliminados=eliminados.reset_index(drop=True),
+        cambios_estado=cambios_estado.reset_index(drop=True),
+    )
+
+
+# Con '_clave' (fusion.calcular_clave) los registros se emparejan por un entero, sin normalizar
+# ni unir las cuatro columnas de texto, y el estado se compara por código de categoría. Ambas
+# versiones vienen ya estandarizadas de la ingesta; solo las filas del resultado se normalizan.
+# Los resultados conservan el número de destino guardado ('_destino_num') para los avisos.
+def _detectar_por_clave(old_df, new_df):
+    viejo = old_df.drop_duplicates(subset=COLUMNA_CLAVE_HASH, keep='last')
+    nuevo = new_df.drop_duplicates(subset=COLUMNA_CLAVE_HASH, keep='last')
+    en_viejo = nuevo[COLUMNA_CLAVE_HASH].isin(viejo[COLUMNA_CLAVE_HASH]).to_numpy()
+    en_nuevo = viejo[COLUMNA_CLAVE_HASH].isin(nuevo[COLUMNA_CLAVE_HASH]).to_numpy()
+
+    # Registros presentes en ambas versiones, en el mismo orden.
+    ambos_nuevo = nuevo[en_viejo]
+    ambos_viejo = viejo[en_nuevo].set_index(COLUMNA_CLAVE_HASH).loc[ambos_nuevo[COLUMNA_CLAVE_HASH]]
+    codigos_old, codigos_new = _codigos_comunes(ambos_viejo[COLUMNA_ESTADO], ambos_nuevo[COLUMNA_ESTADO])
+    cambio = codigos_old != codigos_new
+
+    estado_old = f'{COLUMNA_ESTADO}_old'
+    estado_new = f'{COLUMNA_ESTADO}_new'
+    columnas = COLUMNAS_CLAVE + [COLUMNA_ESTADO]
+    if COLUMNA_DESTINO_NUM in viejo.columns and COLUMNA_DESTINO_NUM in nuevo.columns:
+        columnas.append(COLUMNA_DESTINO_NUM)
+    cambios_estado = normalizar_claves(ambos_nuevo.loc[cambio, columnas]).rename(columns={COLUMNA_ESTADO: estado_new})
+    cambios_estado.insert(
+        len(COLUMNAS_CLAVE), estado_old,
+        normalizar_claves(ambos_viejo.loc[cambio, [COLUMNA_ESTADO]])[COLUMNA_ESTADO].to_numpy(),
+    )
+
+    return ResultadoCambios(
+        agregados=normalizar_claves(nuevo.loc[~en_viejo, columnas]).reset_index(drop=True),
+        eliminados=normalizar_claves(viejo.loc[~en_nuevo, columnas]).reset_index(drop=True),
+        cambios_estado=cambios_estado.reset_index(drop=True),
+    )
+
+
+# Códigos de dos columnas sobre un mismo juego de categorías (los faltantes son -1 en ambas).
+def _codigos_comunes(serie_a, serie_b):
+    a = serie_a.astype('category')
+    b = serie_b.astype('category')
+    categorias = a.cat.categories.union(b.cat.categories)
+    return (
+        np.asarray(pd.Categorical(a, categories=categorias).codes),
+        np.asarray(pd.Categorical(b, categories=categorias).codes),
+    )
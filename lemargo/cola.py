@@ -0,0 +1,299 @@
+# --- Cola Persistente de Notificaciones (outbox) ---
+# Los cambios de estado se guardan en una base SQLite local y un hilo en segundo plano
+# los envía. Así la carga del Excel no espera a FCM y ningún aviso se pierde si el
+# script se vuelve a ejecutar o se interrumpe a la mitad.
+#
+# - Deduplicación: un mismo (destino, folio, producto, fecha, estado nuevo, token) no se encola
+#   dos veces mientras esté pendiente. Una vez enviado puede volver a encolarse, p. ej. si el
+#   pedido regresa más tarde al mismo estado.
+# - Reintentos: los envíos fallidos se reprograman con retroceso exponencial.
+# - Métricas: profundidad de la cola y latencia entre encolado y envío.
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+import pandas as pd
+
+from lemargo.esquema import destinos_de
+from lemargo.notificaciones import Notificacion, datos_notificacion, redactar_notificacion
+
+ESTADO_PENDIENTE = 'pendiente'
+ESTADO_ENVIADO = 'enviado'
+ESTADO_FALLIDO = 'fallido'        # Se agotaron los reintentos
+ESTADO_DESCARTADO = 'descartado'  # Token inválido: no tiene sentido reintentar
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS cola_notificaciones (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    destino TEXT NOT NULL,
+    etiqueta_destino TEXT,
+    folio TEXT NOT NULL,
+    producto TEXT,
+    fecha TEXT,
+    estado_anterior TEXT,
+    estado_nuevo TEXT NOT NULL,
+    token TEXT NOT NULL,
+    estado TEXT NOT NULL DEFAULT 'pendiente',
+    intentos INTEGER NOT NULL DEFAULT 0,
+    creado REAL NOT NULL,
+    proximo_intento REAL NOT NULL,
+    enviado REAL,
+    error TEXT
+);
+"""
+
+_INDICES = """
+CREATE INDEX IF NOT EXISTS idx_cola_pendientes ON cola_notificaciones (estado, proximo_intento);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_cola_unico_pendiente
+    ON cola_notificaciones (destino, folio, COALESCE(producto, ''), COALESCE(fecha, ''), estado_nuevo, token)
+    WHERE estado = 'pendiente';
+"""
+
+# Las colas creadas antes tenían UNIQUE (destino, folio, estado_nuevo, token) sobre toda la
+# tabla, que descartaba para siempre un aviso ya enviado. Se copian a la tabla nueva.
+_COLUMNAS = (
+    "id, destino, etiqueta_destino, folio, producto, fecha, estado_anterior, estado_nuevo, token, "
+    "estado, intentos, creado, proximo_intento, enviado, error"
+)
+
+
+def _migrar(conexion):
+    fila = conexion.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'cola_notificaciones'"
+    ).fetchone()
+    if fila is None or 'UNIQUE' not in fila[0]:
+        return
+    with conexion:
+        conexion.execute("ALTER TABLE cola_notificaciones RENAME TO cola_notificaciones_anterior")
+        conexion.execute("DROP INDEX IF EXISTS idx_cola_pendientes")
+        conexion.execute(_ESQUEMA)
+        conexion.execute(
+            f"INSERT INTO cola_notificaciones ({_COLUMNAS}) SELECT {_COLUMNAS} FROM cola_notificaciones_anterior"
+        )
+        conexion.execute("DROP TABLE cola_notificaciones_anterior")
+
+
+class ColaNotificaciones:
+    def __init__(self, ruta, max_intentos=6, retroceso_base=5.0, retroceso_max=900.0):
+        self.ruta = ruta
+        self.max_intentos = max_intentos
+        self.retroceso_base = retroceso_base
+        self.retroceso_max = retroceso_max
+        with closing(self._conectar()) as conexion:
+            conexion.execute("PRAGMA journal_mode=WAL")
+            _migrar(conexion)
+            conexion.executescript(_ESQUEMA + _INDICES)
+
+    # Cada operación abre su propia conexión, por lo que la cola puede usarse desde varios hilos.
+    def _conectar(self):
+        return sqlite3.connect(self.ruta, timeout=30)
+
+    # --- Encolado ---
+    # Inserta un registro por cada (cambio, token suscrito) del destino. Devuelve
+    # (número de registros nuevos, destinos sin token); los duplicados de un pendiente se ignoran.
+    def encolar_cambios(self, cambios_df, tokens_por_destino):
+        if cambios_df.empty:
+            return 0, []
+
+        ahora = time.time()
+        cambios = cambios_df.assign(_destino=destinos_de(cambios_df).to_numpy(dtype=object))
+        suscripciones = pd.DataFrame(
+            [
+                (destino_num, token)
+                for destino_num, tokens in tokens_por_destino.items()
+                for token in ([tokens] if isinstance(tokens, str) else tokens)
+                if token
+            ],
+            columns=['_destino', '_token'],
+        )
+        unidos = cambios.merge(suscripciones, on='_destino', how='left')
+        sin_token = unidos.loc[unidos['_token'].isna(), '_destino'].unique().tolist()
+        unidos = unidos.dropna(subset=['_token'])
+
+        filas = list(zip(
+            unidos['_destino'], unidos['Destino'].astype(str), unidos['Folio pedido'].astype(str),
+            unidos['Producto'].astype(str), unidos['Fecha'].astype(str),
+            unidos['Estado de atención_old'].astype(str), unidos['Estado de atención_new'].astype(str),
+            unidos['_token'], [ahora] * len(unidos), [ahora] * len(unidos),
+        ))
+
+        with closing(self._conectar()) as conexion, conexion:
+            antes = conexion.total_changes
+            conexion.executemany(
+                """INSERT OR IGNORE INTO cola_notificaciones
+                   (destino, etiqueta_destino, folio, producto, fecha, estado_anterior, estado_nuevo, token, creado, proximo_intento)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                filas,
+            )
+            encolados = conexion.total_changes - antes
+        return encolados, sorted(sin_token)
+
+    # --- Lectura de Pendientes ---
+    # Devuelve los registros cuyo próximo intento ya venció, como DataFrame.
+    def pendientes(self, limite=5000):
+        with closing(self._conectar()) as conexion:
+            return pd.read_sql_query(
+                """SELECT * FROM cola_notificaciones
+                   WHERE estado = ? AND proximo_intento <= ?
+                   ORDER BY id LIMIT ?""",
+                conexion,
+                params=(ESTADO_PENDIENTE, time.time(), limite),
+            )
+
+    def _retroceso(self, intentos):
+        return min(self.retroceso_base * (2 ** (intentos - 1)), self.retroceso_max)
+
+    # --- Registro de Resultados ---
+    # 'resultados' es una lista de (ids de la cola, ResultadoEnvio).
+    def registrar_resultados(self, resultados):
+        ahora = time.time()
+        with closing(self._conectar()) as conexion, conexion:
+            for ids, resultado in resultados:
+                marcadores = ','.join('?' * len(ids))
+                if resultado.exito:
+                    conexion.execute(
+                        f"UPDATE cola_notificaciones SET estado = ?, enviado = ?, error = NULL WHERE id IN ({marcadores})",
+                        (ESTADO_ENVIADO, ahora, *ids),
+                    )
+                elif resultado.token_invalido:
+                    conexion.execute(
+                        f"UPDATE cola_notificaciones SET estado = ?, error = ? WHERE id IN ({marcadores})",
+                        (ESTADO_DESCARTADO, resultado.error, *ids),
+                    )
+                else:
+                    filas = conexion.execute(
+                        f"SELECT id, intentos FROM cola_notificaciones WHERE id IN ({marcadores})", ids
+                    ).fetchall()
+                    for id_fila, intentos in filas:
+                        intentos += 1
+                        estado = ESTADO_FALLIDO if intentos >= self.max_intentos else ESTADO_PENDIENTE
+                        conexion.execute(
+                            """UPDATE cola_notificaciones
+                               SET estado = ?, intentos = ?, proximo_intento = ?, error = ?
+                               WHERE id = ?""",
+                            (estado, intentos, ahora + self._retroceso(intentos), resultado.error, id_fila),
+                        )
+
+    # --- Métricas ---
+    # Profundidad por estado, antigüedad del pendiente más viejo y latencia de envío (últimas 24 h).
+    def metricas(self):
+        ahora = time.time()
+        with closing(self._conectar()) as conexion:
+            por_estado = dict(conexion.execute(
+                "SELECT estado, COUNT(*) FROM cola_notificaciones GROUP BY estado"
+            ).fetchall())
+            mas_antiguo = conexion.execute(
+                "SELECT MIN(creado) FROM cola_notificaciones WHERE estado = ?", (ESTADO_PENDIENTE,)
+            ).fetchone()[0]
+            latencia_media, latencia_max = conexion.execute(
+                "SELECT AVG(enviado - creado), MAX(enviado - creado) FROM cola_notificaciones WHERE estado = ? AND enviado >= ?",
+                (ESTADO_ENVIADO, ahora - 86400),
+            ).fetchone()
+        return {
+            'profundidad': por_estado.get(ESTADO_PENDIENTE, 0),
+            'por_estado': por_estado,
+            'antiguedad_max_s': (ahora - mas_antiguo) if mas_antiguo else 0.0,
+            'latencia_media_s': latencia_media or 0.0,
+            'latencia_max_s': latencia_max or 0.0,
+        }
+
+    # Elimina registros ya terminados (enviados, fallidos o descartados) con más de 'dias' de antigüedad.
+    def purgar(self, dias=7):
+        limite = time.time() - dias * 86400
+        with closing(self._conectar()) as conexion, conexion:
+            cursor = conexion.execute(
+                "DELETE FROM cola_notificaciones WHERE estado != ? AND creado < ?", (ESTADO_PENDIENTE, limite)
+            )
+            return cursor.rowcount
+
+
+# --- Trabajador en Segundo Plano ---
+# Hilo daemon que vacía la cola: agrupa los pendientes por (token, destino) en una sola
+# notificación, los despacha y registra el resultado. 'al_invalidar_tokens' recibe la
+# lista de tokens que FCM reporta como no registrados. Cada hora purga los registros
+# terminados con más de 'dias_purga' días.
+class TrabajadorCola:
+    INTERVALO_PURGA = 3600.0
+
+    def __init__(self, cola, crear_despachador, intervalo=5.0, al_invalidar_tokens=None, dias_purga=7):
+        self.cola = cola
+        self.crear_despachador = crear_despachador
+        self.intervalo = intervalo
+        self.al_invalidar_tokens = al_invalidar_tokens
+        self.dias_purga = dias_purga
+        self._ultima_purga = 0.0
+        self._despertar = threading.Event()
+        self._detener = threading.Event()
+        self._hilo = None
+        self._despachador = None
+        self.ultimo_error = None
+
+    def iniciar(self):
+        if self._hilo is None or not self._hilo.is_alive():
+            self._detener.clear()
+            self._hilo = threading.Thread(target=self._ciclo, name='lemargo-cola-notificaciones', daemon=True)
+            self._hilo.start()
+        return self
+
+    def detener(self, espera=None):
+        self._detener.set()
+        self._despertar.set()
+        if self._hilo is not None:
+            self._hilo.join(espera)
+
+    @property
+    def activo(self):
+        return self._hilo is not None and self._hilo.is_alive()
+
+    # Pide al hilo que procese la cola de inmediato (p. ej. justo después de encolar).
+    def despertar(self):
+        self._despertar.set()
+
+    def _ciclo(self):
+        while not self._detener.is_set():
+            try:
+                while self.procesar_pendientes():
+                    pass
+                self._purgar_si_toca()
+                self.ultimo_error = None
+            except Exception as e:
+                self.ultimo_error = str(e)
+            self._despertar.wait(self.intervalo)
+            self._despertar.clear()
+
+    def _purgar_si_toca(self):
+        ahora = time.monotonic()
+        if self._ultima_purga and ahora - self._ultima_purga < self.INTERVALO_PURGA:
+            return
+        self.cola.purgar(self.dias_purga)
+        self._ultima_purga = ahora
+
+    # --- Procesamiento de un Lote ---
+    # Envía un lote de pendientes y devuelve cuántos registros de la cola se procesaron.
+    def procesar_pendientes(self, limite=5000):
+        pendientes = self.cola.pendientes(limite)
+        if pendientes.empty:
+            return 0
+        if self._despachador is None:
+            self._despachador = self.crear_despachador()
+
+        grupos = []
+        notificaciones = []
+        cambios = pendientes.rename(columns={
+            'etiqueta_destino': 'Destino', 'folio': 'Folio pedido', 'producto': 'Producto', 'fecha': 'Fecha',
+            'estado_anterior': 'Estado de atención_old', 'estado_nuevo': 'Estado de atención_new',
+        })
+        for (token, destino_num), grupo in cambios.groupby(['token', 'destino'], sort=False):
+            titulo, cuerpo = redactar_notificacion(grupo)
+            notificaciones.append(Notificacion(
+                token=token, titulo=titulo, cuerpo=cuerpo, destino=destino_num,
+                datos=datos_notificacion(destino_num, grupo),
+            ))
+            grupos.append(grupo['id'].tolist())
+
+        resumen = self._despachador.despachar(notificaciones)
+        self.cola.registrar_resultados(list(zip(grupos, resumen.resultados)))
+        if resumen.tokens_invalidos and self.al_invalidar_tokens is not None:
+            self.al_invalidar_tokens(resumen.tokens_invalidos)
+        return len(pendientes)
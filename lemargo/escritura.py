@@ -0,0 +1,131 @@
+# --- Escritura Atómica y Bloqueo entre Procesos ---
+# Los archivos se escriben primero en un temporal del mismo directorio, se sincronizan a
+# disco (fsync) y se renombran sobre el destino con os.replace, que es atómico. Un lector
+# abre la versión anterior completa o la nueva completa, nunca un archivo a medias, y no
+# necesita tomar ningún bloqueo.
+#
+# Los escritores sí se coordinan con un bloqueo exclusivo sobre '<ruta>.lock' (flock), que
+# funciona entre hilos y entre procesos de la misma máquina.
+import os
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin flock se usa la creación exclusiva del archivo de bloqueo
+    fcntl = None
+
+
+def _sincronizar_directorio(directorio):
+    try:
+        descriptor = os.open(directorio, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(descriptor)
+    except OSError:
+        pass
+    finally:
+        os.close(descriptor)
+
+
+# --- Escritura Atómica ---
+# 'escribir(ruta_temporal)' debe escribir el contenido completo en la ruta que recibe.
+def escribir_atomico(ruta, escribir):
+    directorio = os.path.dirname(os.path.abspath(ruta))
+    descriptor, temporal = tempfile.mkstemp(dir=directorio, prefix=os.path.basename(ruta) + '.', suffix='.tmp')
+    os.close(descriptor)
+    try:
+        escribir(temporal)
+        with open(temporal, 'rb+') as f:
+            os.fsync(f.fileno())
+        os.replace(temporal, ruta)
+    except BaseException:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+    _sincronizar_directorio(directorio)
+
+
+def escribir_texto_atomico(ruta, texto):
+    def escribir(temporal):
+        with open(temporal, 'w', encoding='utf-8') as f:
+            f.write(texto)
+    escribir_atomico(ruta, escribir)
+
+
+# --- Bloqueo entre Procesos ---
+# Uso: with BloqueoArchivo(ruta): ...  Lanza TimeoutError si no se obtiene en 'espera' segundos
+# (None espera indefinidamente). Es reentrante dentro del mismo hilo: si el hilo ya tiene el
+# bloqueo de esa ruta (p. ej. toda la carga del Excel), los guardados internos no lo vuelven a pedir.
+class BloqueoArchivo:
+    _retenidos = {}  # ruta -> ((proceso, hilo), profundidad)
+    _candado_retenidos = threading.Lock()
+
+    def __init__(self, ruta, espera=None, intervalo=0.05):
+        self.ruta = os.path.abspath(ruta) + '.lock'
+        self.espera = espera
+        self.intervalo = intervalo
+        self._descriptor = None
+        self._anidado = False
+
+    def _intentar(self):
+        if fcntl is not None:
+            descriptor = os.open(self.ruta, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(descriptor, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(descriptor)
+                return False
+            self._descriptor = descriptor
+            return True
+        try:
+            self._descriptor = os.open(self.ruta, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o644)
+        except FileExistsError:
+            return False
+        return True
+
+    def adquirir(self):
+        # Se incluye el pid: un proceso hijo (fork) hereda este diccionario pero no el bloqueo.
+        hilo = (os.getpid(), threading.get_ident())
+        with self._candado_retenidos:
+            retenido = self._retenidos.get(self.ruta)
+            if retenido and retenido[0] == hilo:
+                self._retenidos[self.ruta] = (hilo, retenido[1] + 1)
+                self._anidado = True
+                return self
+
+        limite = None if self.espera is None else time.monotonic() + self.espera
+        while not self._intentar():
+            if limite is not None and time.monotonic() >= limite:
+                raise TimeoutError(f"No se pudo obtener el bloqueo '{self.ruta}' en {self.espera} s")
+            time.sleep(self.intervalo)
+        with self._candado_retenidos:
+            self._retenidos[self.ruta] = (hilo, 1)
+        return self
+
+    def liberar(self):
+        if self._anidado:
+            with self._candado_retenidos:
+                hilo, profundidad = self._retenidos[self.ruta]
+                self._retenidos[self.ruta] = (hilo, profundidad - 1)
+            self._anidado = False
+            return
+        if self._descriptor is None:
+            return
+        with self._candado_retenidos:
+            self._retenidos.pop(self.ruta, None)
+        if fcntl is not None:
+            fcntl.flock(self._descriptor, fcntl.LOCK_UN)
+            os.close(self._descriptor)
+        else:
+            os.close(self._descriptor)
+            os.remove(self.ruta)
+        self._descriptor = None
+
+    def __enter__(self):
+        return self.adquirir()
+
+    def __exit__(self, *excepcion):
+        self.liberar()
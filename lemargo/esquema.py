@@ -0,0 +1,166 @@
+# --- Esquema Normalizado de la Base Histórica ---
+# Tipos únicos para la base y para cada carga, aplicados al leer el Excel, al leer la base y
+# al guardarla:
+#
+# - 'Fecha' como datetime.
+# - Las columnas de baja cardinalidad (y las etiquetas de 'Destino', que se repiten en cada
+#   pedido de la estación) como categorías: cada fila guarda un código entero y cada etiqueta
+#   se guarda una sola vez. La fusión alinea las categorías de la base y del archivo nuevo
+#   (fusion._alinear_categorias), así que toda la base comparte un solo juego por columna.
+# - 'Folio pedido' como entero cuando todos los folios son números sin ceros a la izquierda (su
+#   texto es idéntico), y los litros como número cuando todos los valores lo son. Si no, quedan
+#   como texto. Los enteros usan el tipo más chico en el que caben.
+#
+# Los litros pasan a float64 cuando falta algún valor, y un folio puede quedar como objetos
+# mezclados. Por eso los hashes de clave y de fila (fusion.py) no usan astype(str), que
+# escribiría 10000.0 como '10000.0'. Usan un texto canónico (fusion._texto_canonico) en el que
+# un float entero se escribe como el entero. Así el hash de una fila no cambia con el tipo
+# que recibe su columna en cada carga.
+#
+# Cada registro guarda además dos columnas derivadas, calculadas una sola vez al leer el Excel:
+# '_destino_num' (número de destino, '1234 - ESTACION' -> '1234') y '_clase_estado' (facturado,
+# cancelado o demora). Viajan con la fila en la fusión, así que siempre corresponden a su
+# 'Destino' y su 'Estado de atención'; las consultas, la retención, los avisos y los agregados
+# las leen en lugar de volver a procesar el texto.
+import numpy as np
+import pandas as pd
+
+from lemargo.normalizacion import a_texto, numero_destino
+
+COLUMNA_DESTINO_NUM = '_destino_num'
+COLUMNA_CLASE_ESTADO = '_clase_estado'
+COLUMNAS_CATEGORICAS = ['Destino', 'Producto', 'Estado de atención', 'Turno', COLUMNA_DESTINO_NUM, COLUMNA_CLASE_ESTADO]
+
+# Clases de 'Estado de atención'. Los pedidos facturados o cancelados están cerrados y pueden
+# expirar; el resto (sin estado incluido) cuenta como demora en el dashboard.
+CLASE_FACTURADO = 'facturado'
+CLASE_CANCELADO = 'cancelado'
+CLASE_DEMORA = 'demora'
+CLASES_ESTADO = [CLASE_FACTURADO, CLASE_CANCELADO, CLASE_DEMORA]
+CLASES_CERRADAS = [CLASE_FACTURADO, CLASE_CANCELADO]
+COLUMNA_FOLIO = 'Folio pedido'
+COLUMNA_LITROS = 'Capacidad programada (Litros)'
+# Enteros decimales sin ceros a la izquierda que caben en int64 (18 dígitos como máximo).
+PATRON_ENTERO = r'0|[1-9]\d{0,17}'
+
+
+# Entero más chico que admite los valores (sin signo si no hay negativos).
+def _reducir_entero(serie):
+    return pd.to_numeric(serie, downcast='unsigned' if (serie >= 0).all() else 'integer')
+
+
+# Entero si todos los valores lo permiten sin cambiar su texto; si no, texto.
+def codificar_entero(serie):
+    if pd.api.types.is_integer_dtype(serie):
+        return _reducir_entero(serie)
+    if serie.empty or serie.isna().any():
+        return _como_texto(serie)
+    texto = a_texto(serie) if serie.dtype == object else serie.astype(str)
+    if not texto.str.fullmatch(PATRON_ENTERO).all():
+        return _como_texto(serie)
+    return _reducir_entero(texto.astype('int64'))
+
+
+# Número si todos los valores presentes lo son (entero si además no faltan valores); si no, texto.
+def codificar_numero(serie):
+    if pd.api.types.is_bool_dtype(serie):
+        return serie
+    numeros = pd.to_numeric(serie, errors='coerce')
+    if (numeros.isna() & serie.notna()).any():
+        return _como_texto(serie)
+    if numeros.notna().all() and (numeros % 1 == 0).all():
+        return _reducir_entero(numeros.astype('int64'))
+    return numeros.astype('float64')
+
+
+# Columnas de objetos mezclados (p. ej. folios enteros de la base y de texto del archivo nuevo)
+# pasan a texto; los demás tipos se dejan como están.
+def _como_texto(serie):
+    return a_texto(serie) if serie.dtype == object else serie
+
+
+# --- Aplicación del Esquema ---
+# Devuelve una copia de 'df' con los tipos del esquema; las columnas ausentes se ignoran. Las
+# categorías que ya no usa ninguna fila (p. ej. tras la retención) se descartan.
+def preparar_tipos(df):
+    df = df.copy()
+    if 'Fecha' in df.columns and not pd.api.types.is_datetime64_any_dtype(df['Fecha']):
+        df['Fecha'] = pd.to_datetime(df['Fecha'], errors='coerce')
+    for col in COLUMNAS_CATEGORICAS:
+        if col not in df.columns:
+            continue
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].cat.remove_unused_categories()
+        elif col == COLUMNA_DESTINO_NUM:
+            # El JSON devuelve como enteros los números de destino, que se consultan como texto.
+            df[col] = a_texto(df[col]).astype('category')
+        else:
+            df[col] = df[col].astype('category')
+    if COLUMNA_FOLIO in df.columns:
+        df[COLUMNA_FOLIO] = codificar_entero(df[COLUMNA_FOLIO])
+    if COLUMNA_LITROS in df.columns:
+        df[COLUMNA_LITROS] = codificar_numero(df[COLUMNA_LITROS])
+    return df
+
+
+# --- Columnas Derivadas ---
+# Aplica 'funcion' a cada etiqueta distinta de 'serie' (y a un faltante) en lugar de a cada fila
+# y devuelve una columna categórica con 'categorias' (o con los valores obtenidos, en su orden).
+def _derivar(serie, funcion, categorias=None):
+    serie = serie.astype('category')
+    valores = funcion(pd.Series(serie.cat.categories.tolist() + [None], dtype=object))
+    if categorias is None:
+        codigos, categorias = pd.factorize(valores)
+    else:
+        codigos = pd.Index(categorias).get_indexer(valores)
+    # El último valor corresponde al faltante, que tiene el código -1 en 'serie'.
+    codigos = codigos[serie.cat.codes.to_numpy()]
+    return pd.Series(pd.Categorical.from_codes(codigos, categories=categorias), index=serie.index)
+
+
+def _numeros(destinos):
+    presentes = destinos.dropna()
+    return numero_destino(presentes).str.upper().reindex(destinos.index)
+
+
+def _clases(estados):
+    texto = estados.fillna('').astype(str).str.upper()
+    return pd.Series(np.select(
+        [texto.str.contains('FACTURADO', regex=False), texto.str.contains('CANCELADO', regex=False)],
+        [CLASE_FACTURADO, CLASE_CANCELADO],
+        default=CLASE_DEMORA,
+    ), index=estados.index)
+
+
+# Columna derivada -> (columna de origen, función por etiqueta, categorías fijas).
+_DERIVADAS = {
+    COLUMNA_DESTINO_NUM: ('Destino', _numeros, None),
+    COLUMNA_CLASE_ESTADO: ('Estado de atención', _clases, CLASES_ESTADO),
+}
+
+
+def _calcular(df, columna):
+    origen, funcion, categorias = _DERIVADAS[columna]
+    return _derivar(df[origen], funcion, categorias)
+
+
+# Número de destino de cada fila: la columna guardada o, si 'df' no la tiene, calculado de 'Destino'.
+def destinos_de(df):
+    return df[COLUMNA_DESTINO_NUM] if COLUMNA_DESTINO_NUM in df.columns else _calcular(df, COLUMNA_DESTINO_NUM)
+
+
+# Clase del estado de cada fila (CLASES_ESTADO), guardada o calculada de 'Estado de atención'.
+def clases_de(df):
+    return df[COLUMNA_CLASE_ESTADO] if COLUMNA_CLASE_ESTADO in df.columns else _calcular(df, COLUMNA_CLASE_ESTADO)
+
+
+# Agrega las columnas derivadas que falten (las bases guardadas antes de tenerlas las reciben al
+# cargarse); devuelve 'df' sin copiar si ya las tiene. Con 'recalcular' se vuelven a calcular
+# todas, para filas nuevas que pudieran traer valores de otra versión del registro.
+def agregar_derivadas(df, recalcular=False):
+    derivadas = {
+        columna: _calcular(df, columna)
+        for columna, (origen, _, _) in _DERIVADAS.items()
+        if origen in df.columns and (recalcular or columna not in df.columns)
+    }
+    return df.assign(**derivadas) if derivadas else df
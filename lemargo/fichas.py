@@ -0,0 +1,119 @@
+# --- Fichas Visuales de Destino ---
+# Construye el HTML de todas las fichas de un resultado en una sola pasada por columnas:
+# colores, iconos y fechas se calculan sobre la columna completa y el resultado es un solo
+# bloque HTML, en lugar de un elemento de Streamlit por fila. Todos los valores se escapan.
+import html
+
+import numpy as np
+import pandas as pd
+
+# Columnas que se consultan para mostrar las fichas de un destino (y su resumen JSON).
+COLUMNAS_FICHA = ['Destino', 'Folio pedido', 'Fecha', 'Producto', 'Turno', 'Capacidad programada (Litros)',
+                  'Fecha y hora estimada', 'Fecha y hora de facturación', 'Estado de atención']
+
+# (color RGB, icono) por estado; 'OTRO' se usa para los estados no reconocidos.
+ESTILOS_ESTADO = {
+    "PROGRAMADO": ((0, 123, 255), "📅"),
+    "FACTURADO": ((40, 167, 69), "✅"),
+    "CANCELADO": ((220, 53, 69), "❌"),
+    "CARGANDO": ((255, 193, 7), "⏳"),
+    "OTRO": ((108, 117, 125), "ℹ️"),
+}
+
+_ESTILO_FICHA = (
+    "background-color: {color}; border-radius: 8px; padding: 12px; margin-bottom: 10px; "
+    "color: white; font-weight: 600; box-shadow: 0 4px 12px rgba(0,0,0,0.15); "
+    "backdrop-filter: blur(6px); -webkit-backdrop-filter: blur(6px);"
+)
+
+
+# Texto escapado de una columna; si la columna no existe se usa 'faltante' en todas las filas.
+def _texto(df, columna, faltante=''):
+    if columna not in df.columns:
+        return pd.Series(html.escape(faltante), index=df.index, dtype=object)
+    return df[columna].astype(object).map(lambda valor: html.escape(str(valor)))
+
+
+# Línea opcional "<b>etiqueta:</b> valor<br>" solo en las filas donde la columna tiene valor.
+def _linea_opcional(df, columna, etiqueta, valores=None):
+    if columna not in df.columns:
+        return pd.Series('', index=df.index, dtype=object)
+    valores = _texto(df, columna) if valores is None else valores
+    return pd.Series(
+        np.where(df[columna].notna(), f"<b>{etiqueta}:</b> " + valores + "<br>", ''),
+        index=df.index, dtype=object,
+    )
+
+
+# Clave de ESTILOS_ESTADO para cada fila ("CANCELADO" basta con que aparezca en el texto).
+def clasificar_estados(estados):
+    return pd.Series(np.select(
+        [estados.str.contains("CANCELADO", regex=False), estados == "PROGRAMADO",
+         estados == "FACTURADO", estados == "CARGANDO"],
+        ["CANCELADO", "PROGRAMADO", "FACTURADO", "CARGANDO"],
+        default="OTRO",
+    ), index=estados.index)
+
+
+# Fechas como texto 'aaaa-mm-dd'; los valores que no son fecha se dejan como texto tal cual.
+def fechas_iso(valores):
+    valores = pd.Series(valores)
+    fechas = pd.to_datetime(valores, errors='coerce').dt.strftime('%Y-%m-%d')
+    return fechas.astype(object).where(fechas.notna(), valores.astype(object).where(valores.notna(), '').astype(str))
+
+
+# --- HTML de las Fichas ---
+def generar_html_fichas(df):
+    if df.empty:
+        return ''
+
+    if 'Estado de atención' in df.columns:
+        estados = df['Estado de atención'].astype(object).astype(str).str.upper()
+    else:
+        estados = pd.Series('', index=df.index, dtype=object)
+    clases = clasificar_estados(estados)
+    colores = clases.map({clave: f"rgba({r}, {g}, {b}, 0.65)" for clave, ((r, g, b), _) in ESTILOS_ESTADO.items()})
+    iconos = clases.map({clave: icono for clave, (_, icono) in ESTILOS_ESTADO.items()})
+
+    # 'Fecha' en formato dd/mm/aaaa; los valores que no son fecha se muestran tal cual.
+    fechas = None
+    if 'Fecha' in df.columns:
+        fechas = pd.to_datetime(df['Fecha'], errors='coerce').dt.strftime('%d/%m/%Y')
+        fechas = fechas.astype(object).where(fechas.notna(), _texto(df, 'Fecha'))
+
+    fichas = (
+        '<div style="' + colores.map(lambda color: _ESTILO_FICHA.format(color=color)) + '">'
+        + '<div style="font-size: 18px;">' + iconos + ' <b>' + _texto(df, 'Destino') + '</b></div>'
+        + '<div style="font-size: 14px; margin-top: 4px;">'
+        + _linea_opcional(df, 'Fecha', 'Fecha', fechas)
+        + '<b>Producto:</b> ' + _texto(df, 'Producto', 'N/A') + '<br>'
+        + '<b>Turno:</b> ' + _texto(df, 'Turno', 'N/A') + '<br>'
+        + '<b>Capacidad (L):</b> ' + _texto(df, 'Capacidad programada (Litros)', 'N/A') + '<br>'
+        + _linea_opcional(df, 'Fecha y hora estimada', 'Fecha Estimada')
+        + _linea_opcional(df, 'Fecha y hora de facturación', 'Fecha Facturación')
+        + '<b>Estado:</b> ' + estados.map(html.escape) + '<br>'
+        + '</div></div>'
+    )
+    return ''.join(fichas.tolist())
+
+
+# --- Resumen para la Caché del Navegador ---
+# Versión JSON de las fichas de un destino que el navegador guarda como su última consulta.
+# Cada fila usa las claves 'folio', 'producto', 'fecha' y 'estado' de los datos de las
+# notificaciones (ver notificaciones.datos_notificacion), para que el Service Worker pueda
+# actualizar el estado de cada pedido cuando llega un aviso.
+def resumen_consulta(destino, df):
+    def columna(nombre):
+        if nombre not in df.columns:
+            return pd.Series('', index=df.index, dtype=object)
+        return df[nombre].astype(object).where(df[nombre].notna(), '').astype(str)
+
+    filas = pd.DataFrame({
+        'folio': columna('Folio pedido'),
+        'producto': columna('Producto'),
+        'fecha': fechas_iso(df['Fecha']) if 'Fecha' in df.columns else columna('Fecha'),
+        'turno': columna('Turno'),
+        'capacidad': columna('Capacidad programada (Litros)'),
+        'estado': columna('Estado de atención'),
+    })
+    return {'destino': destino, 'filas': filas.to_dict('records')}
@@ -0,0 +1,224 @@
+# --- Fusión Incremental y Retención ---
+# Actualiza la base histórica con un upsert por clave y expira los registros cerrados
+# usando la base ordenada por 'Fecha' como índice por fecha:
+#
+# - Cada registro guarda en '_clave' un hash entero de (Destino, Folio pedido, Producto, Fecha),
+#   calculado una sola vez al insertarlo. El upsert solo normaliza y hashea las filas del
+#   archivo nuevo; sobre la historia basta una comparación de enteros.
+# - Cada registro guarda también en '_hash_fila' un hash de toda la fila normalizada. Las filas
+#   del archivo cuyo hash ya existe en la base no cambiaron y se omiten antes del upsert.
+# - Como la base se mantiene ordenada por 'Fecha', los registros que pueden haber vencido
+#   están al inicio: se localizan con una búsqueda binaria y solo en ellos se revisa si la
+#   clase de estado guardada ('_clase_estado', ver lemargo/esquema.py) es facturado o cancelado.
+import time
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from lemargo.esquema import CLASES_CERRADAS, agregar_derivadas, clases_de
+from lemargo.normalizacion import a_texto
+
+COLUMNA_CLAVE = '_clave'
+COLUMNA_HASH_FILA = '_hash_fila'
+
+
+@dataclass
+class ResultadoFusion:
+    df: pd.DataFrame              # Nueva base histórica (ordenada por 'Fecha')
+    anteriores: pd.DataFrame      # Versión previa de los registros que el archivo reemplazó
+    nuevos_vigentes: pd.DataFrame  # Registros del archivo que siguen en la base tras la retención
+    insertados: int
+    actualizados: int
+    expirados: int
+    sin_cambios: int = 0          # Filas del archivo idénticas a las ya guardadas (omitidas)
+    aplicados: pd.DataFrame = None  # Registros del archivo insertados o actualizados (antes de la retención)
+    retirados: pd.DataFrame = None  # Registros que la retención eliminó de la base combinada
+    duracion_fusion_s: float = 0.0     # Upsert (hashes, omisión de filas iguales y combinación)
+    duracion_retencion_s: float = 0.0  # Filtro de retención sobre la base combinada
+
+    @property
+    def hay_cambios(self):
+        return bool(self.insertados or self.actualizados or self.expirados)
+
+
+# --- Texto Canónico ---
+# Texto de cada valor para los hashes, igual sin importar el dtype de la columna: un faltante
+# convierte los litros enteros en float64, y 10000.0 debe hashearse como '10000', igual que el
+# entero 10000. Las columnas float y de objetos mezclados pasan por a_texto; en las demás
+# (enteros, texto, categóricas, booleanas) astype(str) ya da ese texto.
+def _texto_canonico(serie):
+    if pd.api.types.is_float_dtype(serie) or serie.dtype == object:
+        serie = a_texto(serie)
+    return serie.astype(str).to_numpy(dtype=object)
+
+
+# --- Clave de Registro ---
+# Hash uint64 de las columnas clave. Las columnas de texto se hashean como texto canónico (sin
+# importar si son categóricas) y 'Fecha' como nanosegundos, para que la clave no dependa del dtype.
+def calcular_clave(df):
+    partes = pd.DataFrame({
+        'Destino': _texto_canonico(df['Destino']),
+        'Folio pedido': _texto_canonico(df['Folio pedido']),
+        'Producto': _texto_canonico(df['Producto']),
+        'Fecha': pd.to_datetime(df['Fecha'], errors='coerce').astype('datetime64[ns]').to_numpy().view('int64'),
+    })
+    return pd.util.hash_pandas_object(partes, index=False).to_numpy()
+
+
+# --- Hash de Fila ---
+# Hash uint64 del contenido completo de cada fila (sin columnas internas '_'), con las columnas
+# en orden alfabético. Las fechas se hashean como nanosegundos y el resto como texto canónico.
+def calcular_hash_fila(df):
+    columnas = sorted(col for col in df.columns if not str(col).startswith('_'))
+    partes = {}
+    for col in columnas:
+        serie = df[col]
+        if pd.api.types.is_datetime64_any_dtype(serie):
+            partes[col] = serie.astype('datetime64[ns]').to_numpy().view('int64')
+        else:
+            partes[col] = _texto_canonico(serie)
+    return pd.util.hash_pandas_object(pd.DataFrame(partes), index=False).to_numpy()
+
+
+# Ordena por 'Fecha' (fechas vacías al final). 'stable' conserva el orden de llegada y, al
+# combinar dos tramos ya ordenados, timsort los une en tiempo lineal.
+def ordenar_por_fecha(df):
+    return df.sort_values('Fecha', kind='stable', na_position='last', ignore_index=True)
+
+
+def _esta_ordenada(df):
+    fechas = df['Fecha']
+    num_vacias = int(fechas.isna().sum())
+    if num_vacias and not fechas.iloc[len(fechas) - num_vacias:].isna().all():
+        return False
+    return fechas.iloc[:len(fechas) - num_vacias].is_monotonic_increasing
+
+
+# --- Preparación del Índice ---
+# Agrega '_clave', '_hash_fila' y las columnas derivadas y ordena por fecha si la base viene de
+# una versión anterior sin ellas.
+def preparar_indice(df):
+    if df.empty:
+        return df
+    df = agregar_derivadas(df)
+    if 'Fecha' in df.columns and not pd.api.types.is_datetime64_any_dtype(df['Fecha']):
+        df = df.assign(Fecha=pd.to_datetime(df['Fecha'], errors='coerce'))
+    if COLUMNA_CLAVE not in df.columns:
+        df = df.assign(**{COLUMNA_CLAVE: calcular_clave(df)})
+    if COLUMNA_HASH_FILA not in df.columns:
+        df = df.assign(**{COLUMNA_HASH_FILA: calcular_hash_fila(df)})
+    if not _esta_ordenada(df):
+        df = ordenar_por_fecha(df)
+    return df
+
+
+# --- Retención ---
+# Posiciones de los registros cerrados con más de 'dias_retencion' días de antigüedad (o sin fecha).
+# 'df' debe estar ordenado por 'Fecha'.
+def _posiciones_vencidas(df, hoy, dias_retencion):
+    if df.empty:
+        return np.array([], dtype=np.intp)
+
+    fechas = df['Fecha']
+    corte = np.datetime64(pd.Timestamp(hoy) - pd.Timedelta(days=dias_retencion), 'ns')
+    # Tramo de fechas anteriores al corte (búsqueda binaria) más el tramo final sin fecha.
+    fin_antiguos = int(np.searchsorted(fechas.to_numpy().astype('datetime64[ns]'), corte, side='left'))
+    inicio_vacias = len(df) - int(fechas.isna().sum())
+    candidatos = np.r_[0:min(fin_antiguos, inicio_vacias), inicio_vacias:len(df)]
+    if len(candidatos) == 0:
+        return candidatos
+
+    fechas_candidatos = fechas.iloc[candidatos]
+    cerrado = clases_de(df).iloc[candidatos].isin(CLASES_CERRADAS).to_numpy()
+    dias = (pd.Timestamp(hoy) - fechas_candidatos).dt.days
+    vencido = ~(dias <= dias_retencion).to_numpy()
+    return candidatos[cerrado & vencido]
+
+
+# Elimina los registros vencidos. Devuelve (base resultante, número de expirados).
+def aplicar_retencion(df, hoy, dias_retencion):
+    expirar = _posiciones_vencidas(df, hoy, dias_retencion)
+    if len(expirar) == 0:
+        return df, 0
+
+    conservar = np.ones(len(df), dtype=bool)
+    conservar[expirar] = False
+    return df[conservar].reset_index(drop=True), len(expirar)
+
+
+# Hace que las columnas categóricas de 'nuevo' compartan categorías con 'base'; así el concat
+# conserva el tipo 'category' en lugar de convertir toda la historia a texto.
+def _alinear_categorias(base, nuevo):
+    for col in base.columns:
+        if col not in nuevo.columns or not isinstance(base[col].dtype, pd.CategoricalDtype):
+            continue
+        categorias = base[col].cat.categories
+        extra = pd.Index(nuevo[col].dropna().unique()).difference(categorias)
+        if len(extra):
+            base = base.assign(**{col: base[col].cat.add_categories(extra)})
+        nuevo = nuevo.assign(**{col: pd.Categorical(nuevo[col], categories=base[col].cat.categories)})
+    return base, nuevo
+
+
+# --- Upsert por Clave ---
+# Integra 'nuevo' (ya normalizado) en 'base': las filas idénticas a las guardadas se omiten,
+# los registros con la misma clave se reemplazan por los del archivo nuevo y el resto se
+# conserva; después aplica la retención.
+def fusionar(base, nuevo, hoy, dias_retencion):
+    inicio = time.perf_counter()
+    nuevo = agregar_derivadas(nuevo, recalcular=True)
+    claves_nuevas = calcular_clave(nuevo)
+    unicos = ~pd.Series(claves_nuevas).duplicated(keep='last').to_numpy()
+    nuevo = nuevo[unicos]
+    nuevo = nuevo.assign(**{COLUMNA_CLAVE: claves_nuevas[unicos], COLUMNA_HASH_FILA: calcular_hash_fila(nuevo)})
+
+    base = preparar_indice(base)
+    sin_cambios = 0
+    if not base.empty:
+        # El hash de fila incluye la clave: si ya existe en la base, la fila no cambió.
+        repetidas = nuevo[COLUMNA_HASH_FILA].isin(base[COLUMNA_HASH_FILA]).to_numpy()
+        sin_cambios = int(repetidas.sum())
+        if sin_cambios:
+            nuevo = nuevo[~repetidas]
+    nuevo = ordenar_por_fecha(nuevo)
+
+    if nuevo.empty:
+        anteriores = nuevo
+        combinado = base
+    elif base.empty:
+        anteriores = nuevo.iloc[0:0]
+        combinado = nuevo
+    else:
+        reemplazar = base[COLUMNA_CLAVE].isin(nuevo[COLUMNA_CLAVE]).to_numpy()
+        anteriores = base[reemplazar]
+        conservados = base[~reemplazar] if reemplazar.any() else base
+        conservados, nuevo = _alinear_categorias(conservados, nuevo)
+        combinado = pd.concat([conservados, nuevo], ignore_index=True)
+        if not _esta_ordenada(combinado):
+            combinado = ordenar_por_fecha(combinado)
+
+    inicio_retencion = time.perf_counter()
+    vencidas = _posiciones_vencidas(combinado, hoy, dias_retencion)
+    retirados = combinado.iloc[vencidas].reset_index(drop=True)
+    final = combinado
+    if len(vencidas):
+        conservar = np.ones(len(combinado), dtype=bool)
+        conservar[vencidas] = False
+        final = combinado[conservar].reset_index(drop=True)
+    nuevos_vigentes, _ = aplicar_retencion(nuevo, hoy, dias_retencion)
+    fin_retencion = time.perf_counter()
+    actualizados = int(nuevo[COLUMNA_CLAVE].isin(anteriores[COLUMNA_CLAVE]).sum())
+    return ResultadoFusion(
+        df=final,
+        anteriores=anteriores.reset_index(drop=True),
+        nuevos_vigentes=nuevos_vigentes,
+        insertados=len(nuevo) - actualizados,
+        actualizados=actualizados,
+        expirados=len(vencidas),
+        sin_cambios=sin_cambios,
+        aplicados=nuevo,
+        retirados=retirados,
+        duracion_fusion_s=inicio_retencion - inicio + time.perf_counter() - fin_retencion,
+        duracion_retencion_s=fin_retencion - inicio_retencion,
+    )
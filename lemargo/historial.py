@@ -0,0 +1,100 @@
+# --- Historial de Actualizaciones ---
+# Registro de solo inserción en SQLite: cada carga agrega una fila con su fecha y sus
+# métricas (filas leídas, resultado de la fusión, cambios de estado, notificaciones y
+# duraciones), sin leer ni reescribir las anteriores. La última actualización y cada
+# página del historial se leen por la clave primaria, sin recorrer todo el registro.
+import json
+import os
+import sqlite3
+from contextlib import closing
+
+import pandas as pd
+
+# Métricas numéricas que se guardan en columnas propias; el resto va en 'detalle' (JSON).
+COLUMNAS_METRICAS = [
+    'filas_archivo', 'filas_base', 'insertados', 'actualizados', 'sin_cambios', 'expirados',
+    'cambios_estado', 'notificaciones_encoladas', 'destinos_sin_token', 'duracion_s',
+]
+
+_ESQUEMA = f"""
+CREATE TABLE IF NOT EXISTS actualizaciones (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    fecha TEXT NOT NULL,
+    hash_archivo TEXT,
+    {', '.join(f'{col} REAL' if col == 'duracion_s' else f'{col} INTEGER' for col in COLUMNAS_METRICAS)},
+    detalle TEXT
+);
+"""
+
+
+class HistorialActualizaciones:
+    def __init__(self, ruta):
+        self.ruta = ruta
+        with closing(self._conectar()) as conexion:
+            conexion.execute("PRAGMA journal_mode=WAL")
+            conexion.executescript(_ESQUEMA)
+
+    def _conectar(self):
+        conexion = sqlite3.connect(self.ruta, timeout=30)
+        conexion.row_factory = sqlite3.Row
+        return conexion
+
+    @staticmethod
+    def _como_dict(fila):
+        if fila is None:
+            return None
+        registro = dict(fila)
+        detalle = registro.pop('detalle', None)
+        registro['detalle'] = json.loads(detalle) if detalle else {}
+        return registro
+
+    # --- Registro ---
+    # Agrega una actualización. 'metricas' acepta las columnas de COLUMNAS_METRICAS; las demás
+    # claves (p. ej. duraciones por etapa) se guardan en 'detalle'. Devuelve el id asignado.
+    def registrar(self, fecha, hash_archivo=None, **metricas):
+        columnas = {col: metricas.pop(col) for col in COLUMNAS_METRICAS if col in metricas}
+        nombres = ['fecha', 'hash_archivo', *columnas, 'detalle']
+        valores = [fecha, hash_archivo, *columnas.values(), json.dumps(metricas, default=str) if metricas else None]
+        with closing(self._conectar()) as conexion, conexion:
+            cursor = conexion.execute(
+                f"INSERT INTO actualizaciones ({', '.join(nombres)}) VALUES ({', '.join('?' * len(nombres))})",
+                valores,
+            )
+            return cursor.lastrowid
+
+    # --- Consultas ---
+    def ultima(self):
+        with closing(self._conectar()) as conexion:
+            return self._como_dict(conexion.execute("SELECT * FROM actualizaciones ORDER BY id DESC LIMIT 1").fetchone())
+
+    def total(self):
+        with closing(self._conectar()) as conexion:
+            return conexion.execute("SELECT COUNT(*) FROM actualizaciones").fetchone()[0]
+
+    # Página 'pagina' (desde 0) de 'tamano' registros, del más reciente al más antiguo.
+    def pagina(self, pagina=0, tamano=20):
+        with closing(self._conectar()) as conexion:
+            filas = conexion.execute(
+                "SELECT * FROM actualizaciones ORDER BY id DESC LIMIT ? OFFSET ?", (tamano, pagina * tamano)
+            ).fetchall()
+        return pd.DataFrame([self._como_dict(fila) for fila in filas])
+
+    def reiniciar(self):
+        with closing(self._conectar()) as conexion, conexion:
+            return conexion.execute("DELETE FROM actualizaciones").rowcount
+
+    # --- Migración Única desde el JSON Anterior ---
+    # Importa la lista de fechas ISO de 'historial_actualizaciones.json' y renombra el archivo a
+    # '<ruta>.migrado'. Devuelve el número de registros importados.
+    def migrar_desde_json(self, ruta_json):
+        if not os.path.exists(ruta_json):
+            return 0
+        with open(ruta_json, "r") as f:
+            try:
+                fechas = json.load(f)
+            except ValueError:
+                fechas = []
+        with closing(self._conectar()) as conexion, conexion:
+            conexion.executemany("INSERT INTO actualizaciones (fecha) VALUES (?)", [(fecha,) for fecha in fechas if fecha])
+        os.replace(ruta_json, ruta_json + '.migrado')
+        return len(fechas)
@@ -0,0 +1,45 @@
+# --- Índice de Destinos ---
+# Índice precalculado de número de destino -> posiciones de fila en la base histórica.
+# Se construye una vez por versión de la base, de modo que cada consulta cuesta
+# O(coincidencias) en lugar de recorrer todas las filas. Se agrupa por los códigos de la
+# columna guardada '_destino_num' (ver lemargo/esquema.py), sin procesar las etiquetas.
+import numpy as np
+import pandas as pd
+
+from lemargo.esquema import destinos_de
+from lemargo.normalizacion import estandarizar_texto
+
+
+class IndiceDestinos:
+    # El DataFrame se trata como de solo lectura: las consultas devuelven copias.
+    def __init__(self, df):
+        self._df = df
+        if df.empty or 'Destino' not in df.columns:
+            self._posiciones = {}
+            return
+        destinos = destinos_de(df).astype('category')
+        por_codigo = pd.Series(np.arange(len(df))).groupby(destinos.cat.codes.to_numpy(), sort=False).indices
+        numeros = destinos.cat.categories
+        self._posiciones = {numeros[codigo]: posiciones for codigo, posiciones in por_codigo.items() if codigo >= 0}
+
+    @property
+    def columnas(self):
+        return self._df.columns.tolist()
+
+    def __len__(self):
+        return len(self._posiciones)
+
+    def __contains__(self, numero):
+        return str(numero).strip() in self._posiciones
+
+    # --- Consulta ---
+    # Devuelve las filas del destino 'numero' (con 'Destino' estandarizado) o un DataFrame vacío.
+    def buscar(self, numero, columnas=None):
+        posiciones = self._posiciones.get(str(numero).strip())
+        columnas = [col for col in (columnas or self._df.columns) if col in self._df.columns]
+        if posiciones is None:
+            return self._df.iloc[0:0][columnas]
+        resultado = self._df.iloc[posiciones][columnas].copy()
+        if 'Destino' in resultado.columns:
+            resultado['Destino'] = estandarizar_texto(resultado['Destino'])
+        return resultado
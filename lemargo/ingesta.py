@@ -0,0 +1,252 @@
+# --- Ingesta de Archivos Excel ---
+# Lee el Excel por bloques con openpyxl en modo de solo lectura (o con python-calamine si
+# está instalado, que es bastante más rápido), valida y normaliza cada bloque y conserva
+# el primer bloque como vista previa. El resultado se identifica por el hash SHA-256 del
+# contenido, para no volver a procesar el mismo archivo.
+#
+# Varios libros y hojas (leer_libros) se leen en paralelo en un pool de procesos, una tarea por
+# hoja, y se unen en un solo resultado que se integra a la base de una vez.
+import hashlib
+import importlib.util
+import io
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+import pandas as pd
+
+from lemargo.esquema import agregar_derivadas, preparar_tipos
+from lemargo.normalizacion import estandarizar_columnas
+
+# Columnas mínimas para poder fusionar el archivo con la base histórica.
+COLUMNAS_REQUERIDAS = ['Destino', 'Folio pedido', 'Producto', 'Fecha', 'Estado de atención']
+
+TAMANO_BLOQUE = 20000
+FILAS_VISTA_PREVIA = 5
+# Procesos que leen hojas en paralelo (sin pasar del número de CPUs ni del de hojas).
+MAX_PROCESOS_INGESTA = 4
+
+# python-calamine (lector en Rust) es opcional; si no está se usa openpyxl en modo streaming.
+CALAMINE_DISPONIBLE = importlib.util.find_spec('python_calamine') is not None
+
+
+@dataclass
+class ResultadoIngesta:
+    df: pd.DataFrame
+    vista_previa: pd.DataFrame
+    hash_contenido: str
+    filas: int
+    bloques: int
+    filas_descartadas: int
+    motor: str
+    duracion_s: float = 0.0
+    # Desglose de duracion_s: lectura del archivo y validación/normalización de los bloques.
+    duracion_lectura_s: float = 0.0
+    duracion_normalizacion_s: float = 0.0
+    # Con varios libros u hojas: {'archivo', 'hoja', 'filas', 'filas_descartadas'} por hoja leída
+    # y {'archivo', 'hoja', 'motivo'} por hoja omitida (sin las columnas requeridas o sin datos).
+    fuentes: list = field(default_factory=list)
+    omitidas: list = field(default_factory=list)
+
+
+# --- Hash de Contenido ---
+def hash_contenido(datos):
+    return hashlib.sha256(datos).hexdigest()
+
+
+# --- Validación y Normalización de un Bloque ---
+# Descarta filas sin clave, estandariza las columnas de texto y convierte 'Fecha' a datetime.
+# Devuelve (bloque normalizado, filas descartadas).
+def normalizar_bloque(df):
+    df = df.dropna(how='all', subset=[col for col in COLUMNAS_REQUERIDAS if col in df.columns])
+    descartadas = 0
+    if 'Destino' in df.columns:
+        sin_destino = df['Destino'].isna()
+        descartadas = int(sin_destino.sum())
+        df = df[~sin_destino]
+
+    df = estandarizar_columnas(df)
+    if 'Fecha' in df.columns:
+        df['Fecha'] = pd.to_datetime(df['Fecha'], errors='coerce')
+    return df, descartadas
+
+
+def validar_columnas(columnas):
+    faltantes = [col for col in COLUMNAS_REQUERIDAS if col not in columnas]
+    if faltantes:
+        raise ValueError(f"El archivo no contiene las columnas requeridas: {', '.join(faltantes)}")
+
+
+# --- Lectura por Bloques ---
+# Genera DataFrames de hasta 'tamano_bloque' filas. 'archivo' puede ser una ruta, bytes
+# o un objeto tipo archivo; 'hoja' es el índice o el nombre de la hoja.
+def leer_bloques(archivo, hoja=0, tamano_bloque=TAMANO_BLOQUE, motor=None):
+    if isinstance(archivo, (bytes, bytearray)):
+        archivo = io.BytesIO(archivo)
+    motor = motor or ('calamine' if CALAMINE_DISPONIBLE else 'openpyxl')
+
+    if motor == 'calamine':
+        df = pd.read_excel(archivo, engine='calamine', sheet_name=hoja, dtype=object)
+        for inicio in range(0, len(df), tamano_bloque):
+            yield df.iloc[inicio:inicio + tamano_bloque]
+        return
+
+    from openpyxl import load_workbook
+
+    libro = load_workbook(archivo, read_only=True, data_only=True)
+    try:
+        hoja_excel = libro.worksheets[hoja] if isinstance(hoja, int) else libro[hoja]
+        filas = hoja_excel.iter_rows(values_only=True)
+        encabezado = next(filas, None)
+        if encabezado is None:
+            return
+        columnas = [str(col).strip() if col is not None else f"Sin nombre {i}" for i, col in enumerate(encabezado)]
+
+        bloque = []
+        for fila in filas:
+            bloque.append(fila)
+            if len(bloque) >= tamano_bloque:
+                yield pd.DataFrame(bloque, columns=columnas, dtype=object)
+                bloque = []
+        if bloque:
+            yield pd.DataFrame(bloque, columns=columnas, dtype=object)
+    finally:
+        libro.close()
+
+
+# --- Ingesta Completa ---
+# Lee, valida y normaliza todo el archivo, le aplica el esquema de la base y calcula las columnas
+# derivadas (lemargo/esquema.py).
+# 'al_avanzar(filas_leidas)' se llama tras cada bloque.
+def leer_excel(datos, hoja=0, tamano_bloque=TAMANO_BLOQUE, motor=None, al_avanzar=None):
+    inicio = time.perf_counter()
+    motor = motor or ('calamine' if CALAMINE_DISPONIBLE else 'openpyxl')
+    bloques = []
+    vista_previa = None
+    descartadas = 0
+    filas = 0
+    normalizacion = 0.0
+    for bloque in leer_bloques(datos, hoja=hoja, tamano_bloque=tamano_bloque, motor=motor):
+        inicio_bloque = time.perf_counter()
+        if vista_previa is None:
+            validar_columnas(bloque.columns)
+        bloque, descartadas_bloque = normalizar_bloque(bloque)
+        normalizacion += time.perf_counter() - inicio_bloque
+        if vista_previa is None:
+            vista_previa = bloque.head(FILAS_VISTA_PREVIA)
+        bloques.append(bloque)
+        descartadas += descartadas_bloque
+        filas += len(bloque)
+        if al_avanzar is not None:
+            al_avanzar(filas)
+
+    if not bloques:
+        raise ValueError("El archivo no contiene datos.")
+
+    inicio_union = time.perf_counter()
+    df = pd.concat(bloques, ignore_index=True) if len(bloques) > 1 else bloques[0].reset_index(drop=True)
+    df = agregar_derivadas(preparar_tipos(df.infer_objects()))
+    normalizacion += time.perf_counter() - inicio_union
+    duracion = time.perf_counter() - inicio
+    return ResultadoIngesta(
+        df=df,
+        vista_previa=vista_previa,
+        hash_contenido=hash_contenido(datos) if isinstance(datos, (bytes, bytearray)) else None,
+        filas=filas,
+        bloques=len(bloques),
+        filas_descartadas=descartadas,
+        motor=motor,
+        duracion_s=duracion,
+        duracion_lectura_s=duracion - normalizacion,
+        duracion_normalizacion_s=normalizacion,
+    )
+
+
+# --- Varios Libros y Hojas ---
+# Nombres de las hojas del libro, en orden.
+def hojas_del_libro(datos, motor=None):
+    motor = motor or ('calamine' if CALAMINE_DISPONIBLE else 'openpyxl')
+    with pd.ExcelFile(io.BytesIO(datos), engine=motor) as libro:
+        return libro.sheet_names
+
+
+# Hash del conjunto: con un solo libro completo es el de su contenido, como en leer_excel.
+def hash_libros(archivos, hojas=None):
+    if len(archivos) == 1 and hojas is None:
+        return hash_contenido(archivos[0][1])
+    partes = [hash_contenido(datos) for _, datos in archivos] + [repr(hojas)]
+    return hash_contenido('\n'.join(partes).encode('utf-8'))
+
+
+# Tarea del pool: lee una hoja, o devuelve el motivo si no se puede integrar.
+def _leer_hoja(datos, hoja, tamano_bloque, motor):
+    try:
+        return leer_excel(datos, hoja=hoja, tamano_bloque=tamano_bloque, motor=motor)
+    except (ValueError, KeyError, IndexError) as e:  # Sin columnas requeridas, sin datos o sin esa hoja
+        return str(e).strip("'")
+
+
+def _leer_hojas(tareas, tamano_bloque, motor, max_procesos):
+    procesos = min(len(tareas), max_procesos, os.cpu_count() or 1)
+    if procesos <= 1:
+        return [_leer_hoja(datos, hoja, tamano_bloque, motor) for _, hoja, datos in tareas]
+    # forkserver evita hacer fork del proceso de Streamlit, que tiene hilos en ejecución.
+    metodo = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    with ProcessPoolExecutor(max_workers=procesos, mp_context=multiprocessing.get_context(metodo)) as ejecutor:
+        futuros = [ejecutor.submit(_leer_hoja, datos, hoja, tamano_bloque, motor) for _, hoja, datos in tareas]
+        return [futuro.result() for futuro in futuros]
+
+
+# Lee varios libros ('archivos': lista de (nombre, bytes)) y une sus hojas en un solo resultado.
+# 'hojas' (índices o nombres) se aplica a todos los libros; None lee todas las hojas y omite
+# las que no tienen las columnas requeridas o no tienen datos. Las filas se unen en el orden
+# de los libros y de sus hojas: si una clave se repite, la fusión conserva la última.
+# En paralelo, la normalización de cada hoja ocurre en su proceso y cuenta como lectura.
+def leer_libros(archivos, hojas=None, tamano_bloque=TAMANO_BLOQUE, motor=None, max_procesos=MAX_PROCESOS_INGESTA):
+    inicio = time.perf_counter()
+    motor = motor or ('calamine' if CALAMINE_DISPONIBLE else 'openpyxl')
+    tareas = [
+        (nombre, hoja, datos)
+        for nombre, datos in archivos
+        for hoja in (hojas if hojas is not None else hojas_del_libro(datos, motor))
+    ]
+    leidas = []
+    omitidas = []
+    for (nombre, hoja, _), resultado in zip(tareas, _leer_hojas(tareas, tamano_bloque, motor, max_procesos)):
+        if isinstance(resultado, str):
+            if hojas is not None:
+                raise ValueError(f"{nombre} (hoja {hoja}): {resultado}")
+            omitidas.append({'archivo': nombre, 'hoja': hoja, 'motivo': resultado})
+        else:
+            leidas.append((nombre, hoja, resultado))
+    if not leidas:
+        raise ValueError("Ninguna hoja contiene datos con las columnas requeridas: "
+                         + "; ".join(f"{o['archivo']} ({o['hoja']}): {o['motivo']}" for o in omitidas))
+
+    inicio_union = time.perf_counter()
+    if len(leidas) > 1:
+        # Las categorías de cada hoja difieren: el concat las deja como texto y el esquema las
+        # vuelve a codificar con un solo juego para todo el resultado.
+        df = preparar_tipos(pd.concat([resultado.df for _, _, resultado in leidas], ignore_index=True).infer_objects())
+    else:
+        df = leidas[0][2].df
+    fin = time.perf_counter()
+    return ResultadoIngesta(
+        df=df,
+        vista_previa=df.head(FILAS_VISTA_PREVIA),
+        hash_contenido=hash_libros(archivos, hojas),
+        filas=sum(resultado.filas for _, _, resultado in leidas),
+        bloques=sum(resultado.bloques for _, _, resultado in leidas),
+        filas_descartadas=sum(resultado.filas_descartadas for _, _, resultado in leidas),
+        motor=motor,
+        duracion_s=fin - inicio,
+        duracion_lectura_s=inicio_union - inicio,
+        duracion_normalizacion_s=fin - inicio_union,
+        fuentes=[
+            {'archivo': nombre, 'hoja': hoja, 'filas': resultado.filas, 'filas_descartadas': resultado.filas_descartadas}
+            for nombre, hoja, resultado in leidas
+        ],
+        omitidas=omitidas,
+    )
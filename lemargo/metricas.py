@@ -0,0 +1,92 @@
+# --- Métricas de Ejecución ---
+# Tramos con nombre (duración en segundos) y contadores de una ejecución, como una carga del
+# Excel. Cada carga guarda su medición en el historial y la agrega como una línea JSON a un
+# archivo local, para poder seguir qué etapa crece a medida que crecen los datos.
+import json
+import os
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+# Etapas de una carga en el orden en que ocurren, con su nombre para mostrar.
+ETIQUETAS_TRAMOS = {
+    'lectura_excel': "Lectura del Excel",
+    'normalizacion': "Validación y normalización",
+    'carga_base': "Carga de la base",
+    'fusion': "Fusión (upsert)",
+    'retencion': "Filtro de retención",
+    'deteccion_cambios': "Detección de cambios",
+    'guardado_base': "Escritura de la base",
+    'notificacion': "Encolado de notificaciones",
+    'agregados': "Agregados del dashboard",
+    'recarga_cache': "Recarga de la caché compartida",
+}
+
+
+class Medicion:
+    def __init__(self):
+        self.tramos = {}
+        self.contadores = {}
+
+    # Uso: with medicion.tramo('fusion'): ...  Los tramos con el mismo nombre se acumulan.
+    @contextmanager
+    def tramo(self, nombre):
+        inicio = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.agregar_tramo(nombre, time.perf_counter() - inicio)
+
+    # Para etapas medidas en otra parte (p. ej. la lectura del Excel, que queda en caché).
+    def agregar_tramo(self, nombre, segundos):
+        self.tramos[nombre] = self.tramos.get(nombre, 0.0) + segundos
+
+    def contar(self, **contadores):
+        for nombre, valor in contadores.items():
+            self.contadores[nombre] = self.contadores.get(nombre, 0) + int(valor)
+
+    @property
+    def total_s(self):
+        return sum(self.tramos.values())
+
+    def como_dict(self):
+        return {
+            'total_s': round(self.total_s, 4),
+            'tramos': {nombre: round(segundos, 4) for nombre, segundos in self.tramos.items()},
+            'contadores': dict(self.contadores),
+        }
+
+
+# --- Exportación ---
+# Agrega la medición de una ejecución como una línea JSON a 'ruta'; 'extra' se guarda junto
+# (p. ej. la fecha y el hash del archivo).
+def exportar_medicion(ruta, medicion, **extra):
+    linea = json.dumps({**extra, **medicion.como_dict()}, ensure_ascii=False, default=str)
+    with open(ruta, 'a', encoding='utf-8') as f:
+        f.write(linea + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+
+# --- Desglose para Mostrar ---
+# Tabla de una fila por ejecución y una columna por tramo (segundos), en el orden de
+# ETIQUETAS_TRAMOS. 'registros' son diccionarios con 'fecha' y 'tramos' (p. ej. las líneas del
+# archivo exportado o el 'detalle' del historial); los que no tienen tramos se omiten.
+def tabla_tramos(registros):
+    filas = [{'fecha': registro.get('fecha'), **registro['tramos']} for registro in registros if registro.get('tramos')]
+    if not filas:
+        return pd.DataFrame()
+    tabla = pd.DataFrame(filas).set_index('fecha')
+    orden = [nombre for nombre in ETIQUETAS_TRAMOS if nombre in tabla.columns]
+    return tabla[orden + [col for col in tabla.columns if col not in orden]].fillna(0.0)
+
+
+# Desglose de una ejecución: etapa, segundos y porcentaje del total, en orden de ejecución.
+def desglose(tramos):
+    tabla = pd.DataFrame({'segundos': pd.Series(tramos, dtype=float)})
+    total = tabla['segundos'].sum()
+    tabla['porcentaje'] = tabla['segundos'] / total * 100 if total else 0.0
+    tabla.index = [ETIQUETAS_TRAMOS.get(nombre, nombre) for nombre in tabla.index]
+    tabla.index.name = 'etapa'
+    return tabla
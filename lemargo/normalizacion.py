@@ -0,0 +1,50 @@
+# --- Normalización de Texto ---
+# Regla única para estandarizar los valores de texto del Excel y de la base (sin espacios
+# alrededor y en mayúsculas), compartida por la ingesta, la detección de cambios y las
+# consultas por destino.
+import numpy as np
+import pandas as pd
+
+# Columnas de texto que forman parte de la clave o del estado de un registro.
+COLUMNAS_TEXTO = ['Destino', 'Folio pedido', 'Producto', 'Estado de atención']
+
+
+# Convierte valores a texto sin el sufijo '.0' que agrega Excel a los números enteros.
+# Los valores faltantes se conservan.
+def a_texto(serie):
+    def convertir(valor):
+        if isinstance(valor, float) and valor.is_integer():
+            return str(int(valor))
+        return str(valor)
+    return serie.map(convertir, na_action='ignore')
+
+
+# Texto sin espacios alrededor y en mayúsculas. Con columnas categóricas se procesa cada
+# categoría una sola vez; el resultado tiene el mismo tipo de texto que con columnas comunes, para
+# que las claves se puedan unir entre sí. Si 'conservar_faltantes' es False, los faltantes quedan
+# como 'NAN' (así se comparaban las claves antes de tener esta función).
+def estandarizar_texto(serie, conservar_faltantes=True):
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        categorias = estandarizar_texto(pd.Series(serie.cat.categories), conservar_faltantes).to_numpy(dtype=object)
+        categorias = np.append(categorias, None if conservar_faltantes else 'NAN')  # Código -1 (faltante)
+        return pd.Series(categorias[serie.cat.codes.to_numpy()], index=serie.index, dtype=str)
+    texto = a_texto(serie) if conservar_faltantes else serie.astype(str)
+    return texto.str.strip().str.upper()
+
+
+# Aplica estandarizar_texto a las 'columnas' presentes en 'df'. Devuelve una copia.
+def estandarizar_columnas(df, columnas=COLUMNAS_TEXTO, conservar_faltantes=True):
+    return df.assign(**{
+        col: estandarizar_texto(df[col], conservar_faltantes) for col in columnas if col in df.columns
+    })
+
+
+# --- Número de Destino ---
+# Extrae el número de destino de etiquetas como '1234 - ESTACION CENTRO' -> '1234'.
+def numero_destino(serie):
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        # Con columnas categóricas basta con procesar cada etiqueta distinta una sola vez.
+        numeros = numero_destino(pd.Series(serie.cat.categories)).to_numpy(dtype=object)
+        numeros = np.append(numeros, 'nan')  # Código -1 (valor faltante)
+        return pd.Series(numeros[serie.cat.codes.to_numpy()], index=serie.index)
+    return serie.astype(str).str.split('-').str[0].str.strip()
@@ -0,0 +1,199 @@
+# --- Despacho de Notificaciones Push (FCM) ---
+# Agrupa los cambios de estado por token de destino y los envía en lotes de hasta 500
+# mensajes con 'send_each', ejecutando los lotes en un grupo acotado de hilos.
+# El cliente de mensajería es inyectable: por defecto es 'firebase_admin.messaging',
+# pero cualquier objeto con 'Message', 'Notification' y 'send_each' sirve (p. ej. un falso local).
+import json
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from lemargo.esquema import destinos_de
+from lemargo.fichas import fechas_iso
+
+# Límite de mensajes por llamada a send_each impuesto por FCM.
+TAMANO_LOTE_MAXIMO = 500
+
+# Errores de FCM que indican que el token ya no es válido y debe eliminarse.
+ERRORES_TOKEN_INVALIDO = {'UnregisteredError', 'SenderIdMismatchError'}
+
+# Cantidad máxima de cambios que se detallan en el cuerpo de una notificación agrupada.
+MAX_CAMBIOS_EN_MENSAJE = 3
+
+# Cantidad máxima de cambios que viajan en los datos del mensaje (FCM limita los datos a 4 KB).
+MAX_CAMBIOS_EN_DATOS = 20
+
+
+@dataclass
+class Notificacion:
+    token: str
+    titulo: str
+    cuerpo: str
+    destino: str = ''
+    datos: dict = field(default_factory=dict)
+
+
+@dataclass
+class ResultadoEnvio:
+    notificacion: Notificacion
+    exito: bool
+    id_mensaje: str = None
+    error: str = None
+    token_invalido: bool = False
+
+
+@dataclass
+class ResumenDespacho:
+    resultados: list = field(default_factory=list)
+
+    @property
+    def exitosos(self):
+        return [r for r in self.resultados if r.exito]
+
+    @property
+    def fallidos(self):
+        return [r for r in self.resultados if not r.exito]
+
+    @property
+    def tokens_invalidos(self):
+        return sorted({r.notificacion.token for r in self.resultados if r.token_invalido})
+
+
+# --- Redacción de Mensajes ---
+# Devuelve (título, cuerpo) para los cambios de un mismo destino. 'grupo' tiene las columnas
+# 'Destino', 'Producto', 'Fecha', 'Estado de atención_old' y 'Estado de atención_new'.
+def redactar_notificacion(grupo):
+    destino = grupo['Destino'].iloc[0]
+    titulo = f"Actualización en Destino: {destino}"
+    if len(grupo) == 1:
+        fila = grupo.iloc[0]
+        return titulo, f"Estado cambió de '{fila['Estado de atención_old']}' a '{fila['Estado de atención_new']}'"
+
+    lineas = [
+        f"{fila['Producto']} {fila['Fecha']}: {fila['Estado de atención_new']}"
+        for _, fila in grupo.head(MAX_CAMBIOS_EN_MENSAJE).iterrows()
+    ]
+    if len(grupo) > MAX_CAMBIOS_EN_MENSAJE:
+        lineas.append(f"y {len(grupo) - MAX_CAMBIOS_EN_MENSAJE} cambios más")
+    return titulo, f"{len(grupo)} pedidos cambiaron de estado. " + "; ".join(lineas)
+
+
+# --- Datos del Mensaje ---
+# Datos (todos de texto, como exige FCM) que acompañan a la notificación de un destino. El
+# Service Worker los usa para actualizar la última consulta guardada en el navegador; las
+# claves de cada cambio son las mismas que las de fichas.resumen_consulta.
+def datos_notificacion(destino_num, grupo):
+    grupo = grupo.head(MAX_CAMBIOS_EN_DATOS)
+    folios = grupo['Folio pedido'].astype(str) if 'Folio pedido' in grupo.columns else [''] * len(grupo)
+    cambios = [
+        {'folio': folio, 'producto': str(producto), 'fecha': fecha, 'estado': str(estado)}
+        for folio, producto, fecha, estado in zip(
+            folios, grupo['Producto'], fechas_iso(grupo['Fecha']), grupo['Estado de atención_new'],
+        )
+    ]
+    return {'destino': destino_num, 'cambios': json.dumps(cambios, ensure_ascii=False)}
+
+
+# --- Construcción de Mensajes ---
+# Genera una notificación por cada par (destino, token) suscrito, agrupando todos los
+# cambios de ese destino. 'tokens_por_destino' mapea número de destino -> token o lista de tokens.
+def construir_notificaciones(cambios_df, tokens_por_destino):
+    if cambios_df.empty or not tokens_por_destino:
+        return [], []
+
+    cambios = cambios_df.assign(_destino_num=destinos_de(cambios_df).to_numpy(dtype=object))
+    notificaciones = []
+    sin_token = []
+    for destino_num, grupo in cambios.groupby('_destino_num', sort=False):
+        tokens = tokens_por_destino.get(destino_num)
+        if not tokens:
+            sin_token.append(destino_num)
+            continue
+        if isinstance(tokens, str):
+            tokens = [tokens]
+
+        titulo, cuerpo = redactar_notificacion(grupo)
+        for token in tokens:
+            notificaciones.append(Notificacion(
+                token=token,
+                titulo=titulo,
+                cuerpo=cuerpo,
+                destino=destino_num,
+                datos=datos_notificacion(destino_num, grupo),
+            ))
+    return notificaciones, sin_token
+
+
+# --- Inicialización Diferida de Firebase Admin ---
+# Importa firebase_admin e inicializa la app por defecto una sola vez por proceso, la primera
+# vez que hace falta enviar. 'cuenta_servicio' es el JSON de la cuenta de servicio (texto o dict).
+_candado_firebase = threading.Lock()
+
+
+def inicializar_firebase(cuenta_servicio):
+    import firebase_admin
+    from firebase_admin import credentials
+
+    with _candado_firebase:
+        if not firebase_admin._apps:
+            if isinstance(cuenta_servicio, str):
+                cuenta_servicio = json.loads(cuenta_servicio)
+            firebase_admin.initialize_app(credentials.Certificate(cuenta_servicio))
+        return firebase_admin.get_app()
+
+
+# Indica si la app de Firebase ya se inicializó, sin importar firebase_admin para averiguarlo.
+def firebase_inicializado():
+    firebase_admin = sys.modules.get('firebase_admin')
+    return bool(firebase_admin and firebase_admin._apps)
+
+
+# --- Despachador ---
+class DespachadorNotificaciones:
+    def __init__(self, cliente=None, max_hilos=4, tamano_lote=TAMANO_LOTE_MAXIMO):
+        if cliente is None:
+            from firebase_admin import messaging as cliente
+        self.cliente = cliente
+        self.max_hilos = max_hilos
+        self.tamano_lote = min(tamano_lote, TAMANO_LOTE_MAXIMO)
+
+    def _mensaje(self, notificacion):
+        return self.cliente.Message(
+            notification=self.cliente.Notification(title=notificacion.titulo, body=notificacion.cuerpo),
+            data=notificacion.datos or None,
+            token=notificacion.token,
+        )
+
+    # Envía un lote con send_each y traduce cada respuesta a un ResultadoEnvio.
+    def _enviar_lote(self, lote):
+        try:
+            respuesta = self.cliente.send_each([self._mensaje(n) for n in lote])
+        except Exception as e:
+            return [ResultadoEnvio(notificacion=n, exito=False, error=str(e)) for n in lote]
+
+        resultados = []
+        for notificacion, envio in zip(lote, respuesta.responses):
+            if envio.success:
+                resultados.append(ResultadoEnvio(notificacion=notificacion, exito=True, id_mensaje=envio.message_id))
+            else:
+                excepcion = envio.exception
+                resultados.append(ResultadoEnvio(
+                    notificacion=notificacion,
+                    exito=False,
+                    error=str(excepcion),
+                    token_invalido=type(excepcion).__name__ in ERRORES_TOKEN_INVALIDO,
+                ))
+        return resultados
+
+    # --- Envío Concurrente ---
+    # Divide las notificaciones en lotes y los envía en paralelo; el resumen conserva el orden original.
+    def despachar(self, notificaciones):
+        lotes = [notificaciones[i:i + self.tamano_lote] for i in range(0, len(notificaciones), self.tamano_lote)]
+        resumen = ResumenDespacho()
+        if not lotes:
+            return resumen
+        with ThreadPoolExecutor(max_workers=min(self.max_hilos, len(lotes))) as ejecutor:
+            for resultados in ejecutor.map(self._enviar_lote, lotes):
+                resumen.resultados.extend(resultados)
+        return resumen
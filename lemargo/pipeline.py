@@ -0,0 +1,281 @@
+# --- Carga del Excel sin Interfaz ---
+# Flujo completo de una carga sobre los almacenes de lemargo, sin Streamlit ni st.session_state:
+# lo usan el botón "Cargar y actualizar base histórica" de la app, la línea de comandos
+# (python -m lemargo cargar archivo.xlsx, ver lemargo/__main__.py) y los benchmarks.
+#
+# Etapas, cada una medida en la Medicion del resultado (ver lemargo/metricas.py):
+#   leer_excel (ingesta.py) -> fusionar y retención (fusion.py) -> detectar_cambios (cambios.py)
+#   -> guardar la base -> encolar_notificaciones -> agregados -> recargar la caché compartida
+#   -> historial y archivo de métricas.
+#
+# Toda la carga ocurre con el bloqueo de la base: dos cargas simultáneas (de la app o de la
+# línea de comandos) se ejecutan una tras otra y la segunda parte de la base ya actualizada.
+import datetime
+import os
+import zoneinfo
+from dataclasses import dataclass, field
+
+import pandas as pd
+
+from lemargo.agregados import AgregadosDashboard
+from lemargo.almacenamiento import AlmacenBase, obtener_almacen
+from lemargo.cache import CacheBase
+from lemargo.cambios import ResultadoCambios, detectar_cambios
+from lemargo.cola import ColaNotificaciones
+from lemargo.escritura import escribir_texto_atomico
+from lemargo.esquema import destinos_de
+from lemargo.fusion import ResultadoFusion, fusionar
+from lemargo.historial import HistorialActualizaciones
+from lemargo.ingesta import ResultadoIngesta
+from lemargo.metricas import Medicion, exportar_medicion
+from lemargo.suscripciones import AlmacenSuscripciones
+
+# --- Archivos de Datos ---
+# Nombres de los archivos de la app dentro de su directorio de trabajo.
+FORMATO_BASE = "parquet"
+RUTA_BASE = "golden_record"  # Sin extensión: la agrega el backend del formato
+HISTORIAL_PATH = "historial_actualizaciones.db"
+SUSCRIPCIONES_PATH = "suscripciones_fcm.db"
+HASH_PATH = "hash_actual.txt"
+COLA_NOTIFICACIONES_PATH = "cola_notificaciones.db"
+AGREGADOS_PATH = "agregados_dashboard.db"
+METRICAS_PATH = "metricas_carga.jsonl"
+
+# Días que se conservan los registros 'FACTURADO' o 'CANCELADO'.
+DIAS_RETENCION = 7
+ZONA_HORARIA = zoneinfo.ZoneInfo("America/Mexico_City")
+
+
+# --- Entradas ---
+# Almacenes sobre los que opera una carga. Solo 'almacen' es obligatorio: sin caché la base se
+# lee del archivo, sin suscripciones o cola no se encolan avisos, sin agregados, historial,
+# hash o métricas esas etapas se omiten.
+@dataclass
+class ContextoCarga:
+    almacen: AlmacenBase
+    cache: CacheBase = None
+    agregados: AgregadosDashboard = None
+    suscripciones: AlmacenSuscripciones = None
+    cola: ColaNotificaciones = None
+    historial: HistorialActualizaciones = None
+    ruta_hash: str = None     # Hash SHA-256 del último Excel integrado
+    ruta_metricas: str = None  # Archivo JSONL con la medición de cada carga
+
+    # Contexto con los archivos que usa la app en 'directorio'.
+    @classmethod
+    def desde_directorio(cls, directorio='.', formato=FORMATO_BASE):
+        def ruta(nombre):
+            return os.path.join(directorio, nombre)
+        almacen = obtener_almacen(formato, ruta_base=ruta(RUTA_BASE))
+        return cls(
+            almacen=almacen,
+            cache=CacheBase(almacen),
+            agregados=AgregadosDashboard(ruta(AGREGADOS_PATH)),
+            suscripciones=AlmacenSuscripciones(ruta(SUSCRIPCIONES_PATH)),
+            cola=ColaNotificaciones(ruta(COLA_NOTIFICACIONES_PATH)),
+            historial=HistorialActualizaciones(ruta(HISTORIAL_PATH)),
+            ruta_hash=ruta(HASH_PATH),
+            ruta_metricas=ruta(METRICAS_PATH),
+        )
+
+    # Base vigente (una vista de la caché si la hay), o un DataFrame vacío si aún no existe.
+    def cargar_base(self):
+        if self.cache is not None:
+            return self.cache.obtener()
+        return self.almacen.cargar() if self.almacen.existe() else pd.DataFrame()
+
+    # Versión de la base según la fecha de modificación del archivo, o None si no existe.
+    def version_base(self):
+        try:
+            return os.stat(self.almacen.ruta).st_mtime_ns
+        except OSError:
+            return None
+
+    def hash_guardado(self):
+        if self.ruta_hash is None:
+            return None
+        try:
+            with open(self.ruta_hash, 'r') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def guardar_hash(self, hash_valor):
+        if self.ruta_hash is not None and hash_valor:
+            escribir_texto_atomico(self.ruta_hash, hash_valor)
+
+
+# --- Salidas ---
+@dataclass
+class ResultadoCarga:
+    ingesta: ResultadoIngesta
+    fecha: str
+    medicion: Medicion = field(default_factory=Medicion)
+    identico: bool = False             # Mismo contenido que el último archivo integrado: no se hizo nada
+    fusion: ResultadoFusion = None
+    cambios: ResultadoCambios = None   # None si no había base previa con la que comparar
+    notificaciones_encoladas: int = 0
+    destinos_sin_token: list = field(default_factory=list)
+    advertencias: list = field(default_factory=list)  # Etapas secundarias que fallaron sin detener la carga
+
+    # Indica si se escribió una nueva versión de la base.
+    @property
+    def guardado(self):
+        return self.fusion is not None and self.fusion.hay_cambios
+
+    @property
+    def cambios_estado(self):
+        return 0 if self.cambios is None else len(self.cambios.cambios_estado)
+
+    # Métricas de la carga con los nombres de las columnas del historial.
+    def resumen(self):
+        if self.fusion is None:
+            return {'filas_archivo': self.ingesta.filas}
+        return {
+            'filas_archivo': self.ingesta.filas,
+            'filas_base': len(self.fusion.df),
+            'insertados': self.fusion.insertados,
+            'actualizados': self.fusion.actualizados,
+            'sin_cambios': self.fusion.sin_cambios,
+            'expirados': self.fusion.expirados,
+            'cambios_estado': self.cambios_estado,
+            'notificaciones_encoladas': self.notificaciones_encoladas,
+            'destinos_sin_token': len(self.destinos_sin_token),
+        }
+
+
+# --- Etapas ---
+# Encola un aviso por cada (cambio de estado, token suscrito al destino). Devuelve
+# (registros encolados, destinos sin token).
+def encolar_notificaciones(cambios_estado, suscripciones, cola):
+    if cambios_estado.empty:
+        return 0, []
+    destinos = destinos_de(cambios_estado).dropna().unique().tolist()
+    tokens = suscripciones.tokens_por_destinos(destinos)
+    if not tokens:
+        return 0, sorted(destinos)
+    return cola.encolar_cambios(cambios_estado, tokens)
+
+
+# Suma a los agregados los registros que entraron y resta los que salieron; si no estaban
+# sincronizados con 'version_anterior', los reconstruye desde la base completa.
+def actualizar_agregados(agregados, fusion, version_anterior, version):
+    eliminados = pd.concat([fusion.anteriores, fusion.retirados], ignore_index=True)
+    if not agregados.actualizar(fusion.aplicados, eliminados, version_anterior, version):
+        agregados.reconstruir(fusion.df, version)
+
+
+# --- Carga Completa ---
+# Integra lo ya leído ('ingesta': uno o varios libros, ver leer_excel y leer_libros) en la base
+# de 'contexto', con un solo diff, una sola tanda de avisos y una sola escritura. 'hoy' es la
+# fecha de referencia de la retención (por omisión, la fecha actual en ZONA_HORARIA) y 'fecha'
+# la marca de tiempo del historial. Con 'forzar', un contenido idéntico al último se procesa igual.
+# Toda carga confirmada queda en el historial (su fecha es la "Última actualización" del panel
+# de consulta), también las idénticas o sin cambios, marcadas en su detalle.
+# Lanza TimeoutError si no obtiene el bloqueo de la base en 'espera_bloqueo' segundos, y
+# cualquier error al leer o escribir la base; los errores de las etapas secundarias
+# (notificaciones, agregados, historial y métricas) quedan en 'advertencias'.
+def ejecutar_carga(contexto, ingesta, hoy=None, dias_retencion=DIAS_RETENCION, espera_bloqueo=None,
+                   fecha=None, forzar=False):
+    ahora = datetime.datetime.now(tz=ZONA_HORARIA)
+    hoy = pd.Timestamp(hoy if hoy is not None else ahora.date())
+    resultado = ResultadoCarga(ingesta=ingesta, fecha=fecha or ahora.isoformat())
+    medicion = resultado.medicion
+
+    with contexto.almacen.bloqueo(espera=espera_bloqueo):
+        if not forzar and ingesta.hash_contenido and ingesta.hash_contenido == contexto.hash_guardado():
+            resultado.identico = True
+            _registrar_historial(contexto, resultado, filas_archivo=ingesta.filas, identico=True)
+            return resultado
+
+        # La lectura del Excel ya ocurrió (la app la guarda en caché) y se toma de su resultado.
+        medicion.agregar_tramo('lectura_excel', ingesta.duracion_lectura_s)
+        medicion.agregar_tramo('normalizacion', ingesta.duracion_normalizacion_s)
+        medicion.contar(filas_archivo=ingesta.filas, filas_descartadas=ingesta.filas_descartadas)
+        if ingesta.fuentes:
+            medicion.contar(hojas_leidas=len(ingesta.fuentes), hojas_omitidas=len(ingesta.omitidas))
+
+        with medicion.tramo('carga_base'):
+            base = contexto.cargar_base()
+
+        # Upsert por clave y retención (ver lemargo/fusion.py).
+        fusion = fusionar(base, ingesta.df, hoy, dias_retencion)
+        medicion.agregar_tramo('fusion', fusion.duracion_fusion_s)
+        medicion.agregar_tramo('retencion', fusion.duracion_retencion_s)
+        resultado.fusion = fusion
+
+        if not fusion.hay_cambios:
+            contexto.guardar_hash(ingesta.hash_contenido)
+            medicion.contar(filas_base=len(fusion.df), sin_cambios=fusion.sin_cambios)
+            _registrar_historial(contexto, resultado, **_metricas_historial(resultado), sin_cambios_en_base=True)
+            _exportar_metricas(contexto, resultado, sin_cambios_en_base=True)
+            return resultado
+
+        # Compara la versión previa de los registros reemplazados con los del archivo.
+        if not base.empty:
+            with medicion.tramo('deteccion_cambios'):
+                resultado.cambios = detectar_cambios(fusion.anteriores, fusion.nuevos_vigentes)
+            medicion.contar(registros_nuevos=len(resultado.cambios.agregados),
+                            registros_eliminados=len(resultado.cambios.eliminados))
+
+        version_anterior = contexto.version_base()
+        with medicion.tramo('guardado_base'):
+            contexto.almacen.guardar(fusion.df)
+
+        # Los avisos de los cambios de estado se encolan solo con la base ya guardada: si el
+        # guardado falla no sale ningún aviso, y al reintentar la carga se detectan otra vez.
+        # El envío lo hace el trabajador de la cola.
+        if resultado.cambios_estado and contexto.suscripciones is not None and contexto.cola is not None:
+            try:
+                with medicion.tramo('notificacion'):
+                    resultado.notificaciones_encoladas, resultado.destinos_sin_token = encolar_notificaciones(
+                        resultado.cambios.cambios_estado, contexto.suscripciones, contexto.cola)
+            except Exception as e:
+                resultado.advertencias.append(f"Error al encolar las notificaciones: {e}")
+        if contexto.agregados is not None:
+            try:
+                with medicion.tramo('agregados'):
+                    actualizar_agregados(contexto.agregados, fusion, version_anterior, contexto.version_base())
+            except Exception as e:
+                resultado.advertencias.append(f"Error al actualizar los agregados del dashboard: {e}")
+        contexto.guardar_hash(ingesta.hash_contenido)
+
+        # Recarga ya la copia compartida de la base, para que la primera consulta tras la carga
+        # no pague ese costo.
+        if contexto.cache is not None and not contexto.almacen.consultas_en_motor:
+            with medicion.tramo('recarga_cache'):
+                contexto.cache.obtener()
+
+        medicion.contar(**{nombre: valor for nombre, valor in resultado.resumen().items() if nombre != 'filas_archivo'})
+        _registrar_historial(contexto, resultado, **_metricas_historial(resultado))
+        _exportar_metricas(contexto, resultado)
+    return resultado
+
+
+# Resumen, duración por etapa y contadores de una carga procesada, para el historial.
+def _metricas_historial(resultado):
+    medicion = resultado.medicion
+    fuentes = resultado.ingesta.fuentes
+    return {
+        **resultado.resumen(), 'duracion_s': medicion.total_s, 'tramos': medicion.como_dict()['tramos'],
+        'contadores': medicion.contadores, **({'fuentes': fuentes} if fuentes else {}),
+    }
+
+
+def _registrar_historial(contexto, resultado, **metricas):
+    if contexto.historial is None:
+        return
+    try:
+        contexto.historial.registrar(resultado.fecha, hash_archivo=resultado.ingesta.hash_contenido, **metricas)
+    except Exception as e:
+        resultado.advertencias.append(f"Error al guardar el historial: {e}")
+
+
+def _exportar_metricas(contexto, resultado, **extra):
+    if contexto.ruta_metricas is None:
+        return
+    try:
+        exportar_medicion(contexto.ruta_metricas, resultado.medicion, fecha=resultado.fecha,
+                          hash_archivo=resultado.ingesta.hash_contenido, **extra)
+    except OSError as e:
+        resultado.advertencias.append(f"No se pudo exportar las métricas a '{contexto.ruta_metricas}': {e}")
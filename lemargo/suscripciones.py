@@ -0,0 +1,126 @@
+# --- Almacén de Suscripciones FCM ---
+# Relación muchos a muchos destino <-> token en SQLite: un destino puede tener varios
+# dispositivos suscritos y un dispositivo puede seguir varios destinos. Cada alta o baja
+# es una escritura transaccional e incremental, segura entre sesiones y procesos, y el
+# índice por destino permite resolver los tokens de todo un conjunto de cambios en una
+# sola consulta.
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+import pandas as pd
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS suscripciones (
+    destino TEXT NOT NULL,
+    token TEXT NOT NULL,
+    creado REAL NOT NULL,
+    PRIMARY KEY (destino, token)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_suscripciones_token ON suscripciones (token);
+"""
+
+
+class AlmacenSuscripciones:
+    def __init__(self, ruta):
+        self.ruta = ruta
+        with closing(self._conectar()) as conexion:
+            conexion.execute("PRAGMA journal_mode=WAL")
+            conexion.executescript(_ESQUEMA)
+
+    # Cada operación abre su propia conexión; SQLite serializa las escrituras concurrentes.
+    def _conectar(self):
+        return sqlite3.connect(self.ruta, timeout=30)
+
+    @staticmethod
+    def _destino(destino):
+        return str(destino).strip().upper()
+
+    # --- Alta y Baja ---
+    # Devuelve True si la suscripción es nueva.
+    def suscribir(self, destino, token):
+        with closing(self._conectar()) as conexion, conexion:
+            cursor = conexion.execute(
+                "INSERT OR IGNORE INTO suscripciones (destino, token, creado) VALUES (?, ?, ?)",
+                (self._destino(destino), token, time.time()),
+            )
+            return cursor.rowcount == 1
+
+    def desuscribir(self, destino, token):
+        with closing(self._conectar()) as conexion, conexion:
+            cursor = conexion.execute(
+                "DELETE FROM suscripciones WHERE destino = ? AND token = ?", (self._destino(destino), token)
+            )
+            return cursor.rowcount == 1
+
+    # Elimina todas las suscripciones de los tokens indicados (p. ej. tokens no registrados en FCM).
+    def eliminar_tokens(self, tokens):
+        with closing(self._conectar()) as conexion, conexion:
+            cursor = conexion.execute(
+                "DELETE FROM suscripciones WHERE token IN (SELECT value FROM json_each(?))", (json.dumps(list(tokens)),)
+            )
+            return cursor.rowcount
+
+    def reiniciar(self):
+        with closing(self._conectar()) as conexion, conexion:
+            return conexion.execute("DELETE FROM suscripciones").rowcount
+
+    # --- Consultas ---
+    def tokens_de(self, destino):
+        with closing(self._conectar()) as conexion:
+            filas = conexion.execute("SELECT token FROM suscripciones WHERE destino = ?", (self._destino(destino),))
+            return [token for (token,) in filas]
+
+    def esta_suscrito(self, destino, token):
+        with closing(self._conectar()) as conexion:
+            return conexion.execute(
+                "SELECT 1 FROM suscripciones WHERE destino = ? AND token = ?", (self._destino(destino), token)
+            ).fetchone() is not None
+
+    # Resuelve en una sola consulta los tokens de todos los destinos indicados: {destino: [tokens]}.
+    def tokens_por_destinos(self, destinos):
+        destinos = sorted({self._destino(d) for d in destinos})
+        if not destinos:
+            return {}
+        resultado = {}
+        with closing(self._conectar()) as conexion:
+            filas = conexion.execute(
+                "SELECT destino, token FROM suscripciones WHERE destino IN (SELECT value FROM json_each(?))",
+                (json.dumps(destinos),),
+            )
+            for destino, token in filas:
+                resultado.setdefault(destino, []).append(token)
+        return resultado
+
+    def como_dataframe(self):
+        with closing(self._conectar()) as conexion:
+            df = pd.read_sql_query("SELECT destino, token, creado FROM suscripciones ORDER BY destino", conexion)
+        df['creado'] = pd.to_datetime(df['creado'], unit='s', utc=True)
+        return df
+
+    # Devuelve (suscripciones, destinos distintos, tokens distintos).
+    def conteos(self):
+        with closing(self._conectar()) as conexion:
+            return conexion.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT destino), COUNT(DISTINCT token) FROM suscripciones"
+            ).fetchone()
+
+    # --- Migración Única desde fcm_tokens.json ---
+    # Importa el diccionario {destino: token} anterior y renombra el archivo a '<ruta>.migrado'.
+    # Devuelve el número de suscripciones importadas.
+    def migrar_desde_json(self, ruta_json):
+        if not os.path.exists(ruta_json):
+            return 0
+        with open(ruta_json, "r") as f:
+            tokens = json.load(f)
+        ahora = time.time()
+        with closing(self._conectar()) as conexion, conexion:
+            cursor = conexion.executemany(
+                "INSERT OR IGNORE INTO suscripciones (destino, token, creado) VALUES (?, ?, ?)",
+                [(self._destino(destino), token, ahora) for destino, token in tokens.items() if token],
+            )
+            importadas = cursor.rowcount
+        os.replace(ruta_json, ruta_json + '.migrado')
+        return importadas
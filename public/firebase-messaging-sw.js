@@ -16,6 +16,111 @@ const firebaseConfig = {
   "appId": "1:120054139227:web:531983ede51253e35ef27e"
 };
 
+// --- Cachés ---
+// CACHE_SHELL guarda los archivos estáticos de la PWA; se versiona para descartar la copia
+// anterior al publicar cambios. CACHE_CONSULTAS guarda la última consulta de destino del
+// usuario bajo '/destino/<número>'; la escribe el componente componentes/fcm_setup, así que
+// su nombre debe coincidir en ambos archivos.
+const CACHE_SHELL = 'lemargo-shell-v1';
+const CACHE_CONSULTAS = 'lemargo-consultas-v1';
+const PREFIJO_CONSULTA = '/destino/';
+const PAGINA_CONSULTA = '/public/ultima-consulta.html';
+const ARCHIVOS_SHELL = [
+  '/public/index.html',
+  PAGINA_CONSULTA,
+  '/public/manifest.json',
+  '/public/icons/icon-192.png',
+  '/public/icons/icon-512.png',
+];
+
+// Precarga los archivos estáticos al instalar y activa la nueva versión sin esperar.
+self.addEventListener('install', (event) => {
+  event.waitUntil(
+    caches.open(CACHE_SHELL)
+      .then((cache) => cache.addAll(ARCHIVOS_SHELL))
+      .then(() => self.skipWaiting())
+  );
+});
+
+// Elimina las versiones anteriores del shell y toma el control de las páginas abiertas.
+self.addEventListener('activate', (event) => {
+  event.waitUntil(
+    caches.keys()
+      .then((nombres) => Promise.all(
+        nombres
+          .filter((nombre) => nombre.startsWith('lemargo-shell-') && nombre !== CACHE_SHELL)
+          .map((nombre) => caches.delete(nombre))
+      ))
+      .then(() => self.clients.claim())
+  );
+});
+
+// --- Stale-While-Revalidate ---
+// Responde de inmediato con la copia guardada (si existe) y la actualiza desde la red en
+// segundo plano. Sin copia guardada, espera a la red. 'esValida' decide qué respuestas se guardan.
+async function staleWhileRevalidate(event, nombreCache, esValida) {
+  const cache = await caches.open(nombreCache);
+  const guardada = await cache.match(event.request, { ignoreSearch: nombreCache === CACHE_SHELL });
+  const red = fetch(event.request).then((respuesta) => {
+    if (esValida(respuesta)) {
+      cache.put(event.request, respuesta.clone());
+    }
+    return respuesta;
+  });
+  if (guardada) {
+    event.waitUntil(red.catch(() => undefined));
+    return guardada;
+  }
+  return red;
+}
+
+function esJson(respuesta) {
+  return respuesta.ok && (respuesta.headers.get('Content-Type') || '').includes('application/json');
+}
+
+self.addEventListener('fetch', (event) => {
+  const url = new URL(event.request.url);
+  if (event.request.method !== 'GET' || url.origin !== self.location.origin) {
+    return;
+  }
+  if (ARCHIVOS_SHELL.includes(url.pathname)) {
+    event.respondWith(staleWhileRevalidate(event, CACHE_SHELL, (respuesta) => respuesta.ok));
+  } else if (url.pathname.startsWith(PREFIJO_CONSULTA)) {
+    // Solo se guardan respuestas JSON: una página de error no debe reemplazar la consulta guardada.
+    event.respondWith(staleWhileRevalidate(event, CACHE_CONSULTAS, esJson));
+  }
+});
+
+// --- Actualización de la Última Consulta con los Avisos ---
+// 'datos' son los datos del mensaje FCM: 'destino' y 'cambios' (JSON con folio, producto,
+// fecha y estado). Solo se actualiza la consulta si es la que el usuario tiene guardada.
+async function actualizarConsulta(datos) {
+  if (!datos || !datos.destino || !datos.cambios) {
+    return;
+  }
+  const cache = await caches.open(CACHE_CONSULTAS);
+  const clave = PREFIJO_CONSULTA + encodeURIComponent(datos.destino);
+  const guardada = await cache.match(clave);
+  if (!guardada) {
+    return;
+  }
+
+  const consulta = await guardada.json();
+  for (const cambio of JSON.parse(datos.cambios)) {
+    const fila = consulta.filas.find((f) =>
+      f.folio === cambio.folio && f.producto === cambio.producto && f.fecha === cambio.fecha);
+    if (fila) {
+      fila.estado = cambio.estado;
+    } else {
+      consulta.filas.push(cambio);
+    }
+  }
+  consulta.actualizado = new Date().toISOString();
+  await cache.put(clave, new Response(JSON.stringify(consulta), {
+    headers: { 'Content-Type': 'application/json' },
+  }));
+}
+
 // Inicializa la aplicación Firebase en el Service Worker
 firebase.initializeApp(firebaseConfig);
 
@@ -25,15 +130,35 @@ const messaging = firebase.messaging();
 // Maneja los mensajes recibidos cuando la aplicación está en segundo plano (cerrada o en otra pestaña)
 messaging.onBackgroundMessage((payload) => {
   console.log('[firebase-messaging-sw.js] Mensaje recibido en segundo plano: ', payload);
+  const datos = payload.data || {};
 
   // Extrae el título y el cuerpo de la notificación
   const notificationTitle = payload.notification.title || 'Nueva Notificación';
   const notificationOptions = {
     body: payload.notification.body,
-    icon: '/public/icons/icon-192.png' // Asegúrate de que esta ruta a tu icono sea correcta
-    // Puedes añadir más opciones aquí, como imagen, acciones, etc.
+    icon: '/public/icons/icon-192.png', // Asegúrate de que esta ruta a tu icono sea correcta
+    // Al abrir la notificación se muestra la consulta guardada, ya actualizada con este aviso.
+    data: { url: datos.destino ? PAGINA_CONSULTA + '?destino=' + encodeURIComponent(datos.destino) : '/' },
   };
-  
-  // Muestra la notificación al usuario
-  self.registration.showNotification(notificationTitle, notificationOptions);
+
+  // Actualiza la consulta guardada antes de mostrar la notificación al usuario
+  return actualizarConsulta(datos)
+    .catch((err) => console.error('[firebase-messaging-sw.js] No se pudo actualizar la consulta guardada: ', err))
+    .then(() => self.registration.showNotification(notificationTitle, notificationOptions));
+});
+
+// Abre (o enfoca, si ya está abierta) la página de la consulta del destino notificado.
+self.addEventListener('notificationclick', (event) => {
+  const destino = event.notification.data && event.notification.data.url;
+  if (!destino) {
+    return;
+  }
+  event.notification.close();
+  const url = new URL(destino, self.location.origin).href;
+  event.waitUntil(
+    self.clients.matchAll({ type: 'window', includeUncontrolled: true }).then((ventanas) => {
+      const abierta = ventanas.find((ventana) => ventana.url === url);
+      return abierta ? abierta.focus() : self.clients.openWindow(url);
+    })
+  );
 });
@@ -0,0 +1,54 @@
+# --- Generador de Datos Sintéticos ---
+# Produce DataFrames con el mismo juego de columnas que los Excel reales, de forma
+# reproducible (semilla fija), para probar y medir el rendimiento sin datos de producción
+# (tests/ y benchmarks/).
+import numpy as np
+import pandas as pd
+
+PRODUCTOS = ['MAGNA', 'PREMIUM', 'DIESEL']
+ESTADOS = ['PROGRAMADO', 'CARGANDO', 'FACTURADO', 'CANCELADO', 'CANCELADO POR CLIENTE']
+TURNOS = ['MATUTINO', 'VESPERTINO', 'NOCTURNO']
+CAPACIDADES = [10000, 15000, 20000, 31000]
+
+
+# --- Base Histórica Sintética ---
+# Genera 'filas' registros repartidos entre 'destinos' estaciones y 'dias' días
+# hacia atrás desde 'fecha_fin'.
+def generar_golden_record(filas, destinos=2000, dias=30, fecha_fin='2025-01-31', semilla=0):
+    rng = np.random.default_rng(semilla)
+    num_destino = rng.integers(1000, 1000 + destinos, size=filas)
+    fechas = pd.Timestamp(fecha_fin) - pd.to_timedelta(rng.integers(0, dias, size=filas), unit='D')
+    estimada = fechas + pd.to_timedelta(rng.integers(6 * 60, 22 * 60, size=filas), unit='min')
+
+    df = pd.DataFrame({
+        'Destino': pd.Series(num_destino).astype(str) + ' - ESTACION ' + pd.Series(num_destino % 97).astype(str),
+        'Folio pedido': pd.Series(np.arange(filas) + 500000).astype(str),
+        'Producto': np.asarray(PRODUCTOS, dtype=object)[rng.integers(0, len(PRODUCTOS), size=filas)],
+        'Fecha': fechas.normalize(),
+        'Turno': np.asarray(TURNOS, dtype=object)[rng.integers(0, len(TURNOS), size=filas)],
+        'Capacidad programada (Litros)': np.asarray(CAPACIDADES)[rng.integers(0, len(CAPACIDADES), size=filas)],
+        'Fecha y hora estimada': estimada.strftime('%d/%m/%Y %H:%M'),
+        'Estado de atención': np.asarray(ESTADOS, dtype=object)[rng.integers(0, len(ESTADOS), size=filas)],
+    })
+    facturado = df['Estado de atención'] == 'FACTURADO'
+    df['Fecha y hora de facturación'] = estimada.strftime('%d/%m/%Y %H:%M').where(facturado, None)
+    return df
+
+
+# --- Nueva Versión de la Base ---
+# A partir de una base existente, cambia el estado de una fracción de filas,
+# elimina otra fracción y agrega registros nuevos, como haría una carga real.
+def generar_actualizacion(df, frac_cambios=0.05, frac_eliminados=0.01, frac_nuevos=0.02, semilla=1):
+    rng = np.random.default_rng(semilla)
+    nuevo = df.copy()
+
+    cambiar = rng.random(len(nuevo)) < frac_cambios
+    nuevo.loc[cambiar, 'Estado de atención'] = np.asarray(ESTADOS, dtype=object)[
+        rng.integers(0, len(ESTADOS), size=int(cambiar.sum()))
+    ]
+
+    nuevo = nuevo[rng.random(len(nuevo)) >= frac_eliminados]
+
+    agregados = generar_golden_record(int(len(df) * frac_nuevos), semilla=semilla + 100)
+    agregados['Folio pedido'] = (pd.Series(np.arange(len(agregados)) + 900000000)).astype(str).values
+    return pd.concat([nuevo, agregados], ignore_index=True)
@@ -0,0 +1,78 @@
+# --- Cliente FCM Falso ---
+# Imita la interfaz de 'firebase_admin.messaging' usada por DespachadorNotificaciones
+# (Message, Notification, send_each) sin red, con latencia simulada por lote, tokens marcados
+# como no registrados o de otro remitente y lotes que fallan por completo, para medir y probar
+# el despacho localmente (benchmarks/bench_notificaciones.py y tests/test_notificaciones.py).
+import itertools
+import threading
+import time
+from dataclasses import dataclass
+
+
+class UnregisteredError(Exception):
+    pass
+
+
+class SenderIdMismatchError(Exception):
+    pass
+
+
+@dataclass
+class Notification:
+    title: str = None
+    body: str = None
+
+
+@dataclass
+class Message:
+    notification: Notification = None
+    data: dict = None
+    token: str = None
+
+
+@dataclass
+class SendResponse:
+    success: bool
+    message_id: str = None
+    exception: Exception = None
+
+
+@dataclass
+class BatchResponse:
+    responses: list
+
+
+class ClienteFCMFalso:
+    Message = Message
+    Notification = Notification
+
+    # 'latencia_lote' son segundos por lote o una función de los mensajes del lote que los devuelve.
+    # Un lote que contiene algún token de 'tokens_error_lote' falla completo con ConnectionError.
+    def __init__(self, latencia_lote=0.2, tokens_invalidos=(), tokens_otro_remitente=(), tokens_error_lote=()):
+        self.latencia_lote = latencia_lote
+        self.tokens_invalidos = set(tokens_invalidos)
+        self.tokens_otro_remitente = set(tokens_otro_remitente)
+        self.tokens_error_lote = set(tokens_error_lote)
+        self.enviados = []
+        self.lotes = 0
+        self.tamanos_lote = []
+        self._ids = itertools.count(1)
+        self._candado = threading.Lock()
+
+    def send_each(self, mensajes):
+        time.sleep(self.latencia_lote(mensajes) if callable(self.latencia_lote) else self.latencia_lote)
+        respuestas = []
+        with self._candado:
+            self.lotes += 1
+            self.tamanos_lote.append(len(mensajes))
+            if any(mensaje.token in self.tokens_error_lote for mensaje in mensajes):
+                raise ConnectionError("Error de red simulado")
+            for mensaje in mensajes:
+                if mensaje.token in self.tokens_invalidos:
+                    respuestas.append(SendResponse(False, exception=UnregisteredError(f"Token no registrado: {mensaje.token}")))
+                elif mensaje.token in self.tokens_otro_remitente:
+                    respuestas.append(SendResponse(False, exception=SenderIdMismatchError(f"Otro remitente: {mensaje.token}")))
+                else:
+                    self.enviados.append(mensaje)
+                    respuestas.append(SendResponse(True, message_id=f"falso/{next(self._ids)}"))
+        return BatchResponse(respuestas)
@@ -0,0 +1,42 @@
+# --- Pruebas del Almacenamiento SQLite ---
+import os
+import sqlite3
+from contextlib import closing
+
+from lemargo.almacenamiento import AlmacenSQLite
+from tests.datos_sinteticos import generar_golden_record
+
+
+def test_lectores_no_esperan_al_escritor(tmp_path):
+    almacen = AlmacenSQLite(str(tmp_path / 'golden_record.db'))
+    almacen.guardar(generar_golden_record(100))
+
+    # Una escritura en curso con bloqueo exclusivo: con WAL los lectores siguen viendo la
+    # versión confirmada.
+    with closing(sqlite3.connect(almacen.ruta, isolation_level=None)) as escritor:
+        escritor.execute("BEGIN EXCLUSIVE")
+        escritor.execute(f"DELETE FROM {almacen.tabla}")
+        assert len(almacen.cargar()) == 100
+        assert len(almacen.buscar(almacen.cargar()['_destino_num'].iloc[0])) >= 1
+        escritor.execute("ROLLBACK")
+
+
+def test_cada_guardado_cambia_la_version(tmp_path):
+    almacen = AlmacenSQLite(str(tmp_path / 'golden_record.db'))
+    almacen.guardar(generar_golden_record(100))
+    anterior = os.stat(almacen.ruta).st_mtime_ns
+    os.utime(almacen.ruta, ns=(anterior - 10**9, anterior - 10**9))
+
+    almacen.guardar(generar_golden_record(50))
+    assert os.stat(almacen.ruta).st_mtime_ns > anterior - 10**9
+    assert len(almacen.cargar()) == 50
+
+
+def test_eliminar_borra_el_wal(tmp_path):
+    almacen = AlmacenSQLite(str(tmp_path / 'golden_record.db'))
+    almacen.guardar(generar_golden_record(10))
+    with closing(almacen._conectar()) as lector:
+        lector.execute(f"SELECT COUNT(*) FROM {almacen.tabla}").fetchone()
+        assert almacen.eliminar()
+
+    assert not any(os.path.exists(almacen.ruta + sufijo) for sufijo in ('', '-wal', '-shm'))
@@ -0,0 +1,57 @@
+# --- Pruebas del Endpoint de Consulta ---
+import json
+
+from lemargo.almacenamiento import AlmacenParquet
+from lemargo.api import ConsultaDestinos, crear_servidor
+from tests.datos_sinteticos import generar_golden_record
+
+
+def almacen_con_base(tmp_path, filas=50):
+    almacen = AlmacenParquet(str(tmp_path / 'golden_record.parquet'))
+    almacen.guardar(generar_golden_record(filas, destinos=5))
+    return almacen
+
+
+def test_guardado_durante_la_consulta_no_queda_en_cache(tmp_path):
+    almacen = almacen_con_base(tmp_path)
+    consulta = ConsultaDestinos(almacen)
+    numero = str(almacen.cargar()['_destino_num'].iloc[0])
+    version = consulta.version()
+
+    # Una carga guarda una base nueva mientras se arma la respuesta con la versión anterior.
+    consultar = consulta.consultar
+
+    def consultar_y_guardar(destino):
+        resumen = consultar(destino)
+        almacen.guardar(generar_golden_record(10, destinos=5, semilla=7))
+        return resumen
+
+    consulta.consultar = consultar_y_guardar
+    assert consulta.cuerpo(version, numero) is not None
+    consulta.consultar = consultar
+
+    # Con la versión anterior se vuelve a consultar en lugar de servir lo guardado.
+    llamadas = []
+    consulta.consultar = lambda destino: llamadas.append(destino) or consultar(destino)
+    consulta.cuerpo(version, numero)
+    assert llamadas == [numero]
+
+
+def test_respuestas_en_cache_por_version(tmp_path):
+    almacen = almacen_con_base(tmp_path)
+    consulta = ConsultaDestinos(almacen)
+    numero = str(almacen.cargar()['_destino_num'].iloc[0])
+    version = consulta.version()
+
+    primera = consulta.cuerpo(version, numero)
+    assert json.loads(primera)
+    consulta.consultar = lambda destino: None
+    assert consulta.cuerpo(version, numero) == primera
+
+
+def test_servidor_escucha_solo_local_por_omision(tmp_path):
+    servidor = crear_servidor(ConsultaDestinos(almacen_con_base(tmp_path)), puerto=0)
+    try:
+        assert servidor.server_address[0] == '127.0.0.1'
+    finally:
+        servidor.server_close()
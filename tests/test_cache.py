@@ -0,0 +1,20 @@
+# --- Pruebas de la Caché Compartida ---
+from lemargo.almacenamiento import AlmacenParquet
+from lemargo.cache import CacheBase
+from tests.datos_sinteticos import generar_golden_record
+
+
+def test_modificar_una_vista_no_cambia_la_copia_compartida(tmp_path):
+    almacen = AlmacenParquet(str(tmp_path / 'golden_record.parquet'))
+    almacen.guardar(generar_golden_record(20))
+    cache = CacheBase(almacen)
+
+    vista = cache.obtener()
+    litros = vista.loc[0, 'Capacidad programada (Litros)']
+    vista.loc[0, 'Capacidad programada (Litros)'] = litros + 1
+    vista['Turno'] = 'OTRO'
+
+    otra = cache.obtener()
+    assert otra.loc[0, 'Capacidad programada (Litros)'] == litros
+    assert (otra['Turno'] != 'OTRO').all()
+    assert cache.generacion == 1
@@ -0,0 +1,87 @@
+# --- Pruebas de la Cola de Notificaciones ---
+import sqlite3
+import time
+from contextlib import closing
+
+import pandas as pd
+
+from lemargo.cola import ESTADO_ENVIADO, ColaNotificaciones, TrabajadorCola
+from lemargo.notificaciones import ResultadoEnvio
+
+
+def cambios(folio='100', producto='MAGNA', estado='FACTURADO'):
+    return pd.DataFrame({
+        'Destino': ['1234 - ESTACION'],
+        'Folio pedido': [folio],
+        'Producto': [producto],
+        'Fecha': [pd.Timestamp('2024-05-01')],
+        'Estado de atención_old': ['PROGRAMADO'],
+        'Estado de atención_new': [estado],
+    })
+
+
+def marcar_enviados(cola):
+    ids = cola.pendientes()['id'].tolist()
+    cola.registrar_resultados([(ids, ResultadoEnvio(notificacion=None, exito=True))])
+
+
+def test_duplicado_pendiente_se_ignora(tmp_path):
+    cola = ColaNotificaciones(str(tmp_path / 'cola.db'))
+    tokens = {'1234': ['tok']}
+
+    assert cola.encolar_cambios(cambios(), tokens) == (1, [])
+    assert cola.encolar_cambios(cambios(), tokens) == (0, [])
+    # Otro producto del mismo folio que llega al mismo estado es otro aviso.
+    assert cola.encolar_cambios(cambios(producto='PREMIUM'), tokens) == (1, [])
+
+
+def test_aviso_enviado_puede_repetirse(tmp_path):
+    cola = ColaNotificaciones(str(tmp_path / 'cola.db'))
+    tokens = {'1234': ['tok']}
+    cola.encolar_cambios(cambios(), tokens)
+    marcar_enviados(cola)
+
+    # El pedido vuelve más tarde al mismo estado: se avisa de nuevo.
+    assert cola.encolar_cambios(cambios(), tokens) == (1, [])
+    assert cola.metricas()['por_estado'] == {ESTADO_ENVIADO: 1, 'pendiente': 1}
+
+
+def test_migra_cola_con_unique_anterior(tmp_path):
+    ruta = str(tmp_path / 'cola.db')
+    with closing(sqlite3.connect(ruta)) as conexion, conexion:
+        conexion.executescript("""
+            CREATE TABLE cola_notificaciones (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, destino TEXT NOT NULL, etiqueta_destino TEXT,
+                folio TEXT NOT NULL, producto TEXT, fecha TEXT, estado_anterior TEXT,
+                estado_nuevo TEXT NOT NULL, token TEXT NOT NULL, estado TEXT NOT NULL DEFAULT 'pendiente',
+                intentos INTEGER NOT NULL DEFAULT 0, creado REAL NOT NULL, proximo_intento REAL NOT NULL,
+                enviado REAL, error TEXT, UNIQUE (destino, folio, estado_nuevo, token)
+            );
+            CREATE INDEX idx_cola_pendientes ON cola_notificaciones (estado, proximo_intento);
+        """)
+        conexion.execute(
+            """INSERT INTO cola_notificaciones (destino, folio, producto, fecha, estado_nuevo, token, estado, creado, proximo_intento)
+               VALUES ('1234', '100', 'MAGNA', '2024-05-01 00:00:00', 'FACTURADO', 'tok', 'enviado', 1, 1)"""
+        )
+
+    cola = ColaNotificaciones(ruta)
+    assert cola.metricas()['por_estado'] == {ESTADO_ENVIADO: 1}
+    assert cola.encolar_cambios(cambios(), {'1234': ['tok']}) == (1, [])
+    # Abrir de nuevo una cola ya migrada no la toca.
+    assert ColaNotificaciones(ruta).metricas()['por_estado'] == {ESTADO_ENVIADO: 1, 'pendiente': 1}
+
+
+def test_trabajador_purga_terminados(tmp_path):
+    cola = ColaNotificaciones(str(tmp_path / 'cola.db'))
+    cola.encolar_cambios(cambios(), {'1234': ['tok']})
+    marcar_enviados(cola)
+    with closing(sqlite3.connect(cola.ruta)) as conexion, conexion:
+        conexion.execute("UPDATE cola_notificaciones SET creado = ?", (time.time() - 30 * 86400,))
+
+    trabajador = TrabajadorCola(cola, crear_despachador=lambda: None, intervalo=0.01).iniciar()
+    limite = time.time() + 5
+    while cola.metricas()['por_estado'] and time.time() < limite:
+        time.sleep(0.01)
+    trabajador.detener(1)
+
+    assert cola.metricas()['por_estado'] == {}
@@ -0,0 +1,50 @@
+# --- Pruebas de la Fusión Incremental ---
+import numpy as np
+import pandas as pd
+
+from lemargo.esquema import COLUMNA_LITROS, preparar_tipos
+from lemargo.fusion import calcular_clave, calcular_hash_fila, fusionar
+from tests.datos_sinteticos import generar_golden_record
+
+HOY = pd.Timestamp('2025-01-31')
+DIAS_RETENCION = 3650  # Ningún registro expira en estas pruebas
+
+
+def carga(df):
+    return preparar_tipos(df.infer_objects())
+
+
+def test_litros_vacios_no_cambian_el_hash_de_las_demas_filas():
+    base = fusionar(carga(generar_golden_record(300)), carga(generar_golden_record(300)), HOY, DIAS_RETENCION).df
+
+    # El mismo archivo con una fila más sin litros: la columna pasa a float64.
+    extra = generar_golden_record(1, semilla=5).assign(**{'Folio pedido': '999999', COLUMNA_LITROS: np.nan})
+    nuevo = carga(pd.concat([generar_golden_record(300), extra], ignore_index=True))
+    assert nuevo[COLUMNA_LITROS].dtype == 'float64'
+
+    resultado = fusionar(base, nuevo, HOY, DIAS_RETENCION)
+    assert (resultado.sin_cambios, resultado.actualizados, resultado.insertados) == (300, 0, 1)
+
+
+def test_hashes_no_dependen_del_dtype():
+    df = generar_golden_record(50)
+    como_float = df.assign(**{
+        COLUMNA_LITROS: df[COLUMNA_LITROS].astype('float64'),
+        'Folio pedido': df['Folio pedido'].astype('int64').astype(object),
+    })
+    categorico = df.astype({col: 'category' for col in ['Destino', 'Producto', 'Turno', 'Estado de atención']})
+
+    for variante in (como_float, categorico, carga(df)):
+        assert (calcular_hash_fila(variante) == calcular_hash_fila(df)).all()
+        assert (calcular_clave(variante) == calcular_clave(df)).all()
+
+
+def test_cambio_de_litros_se_detecta():
+    df = generar_golden_record(20)
+    base = fusionar(carga(df), carga(df), HOY, DIAS_RETENCION).df
+
+    cambiado = df.copy()
+    cambiado.loc[3, COLUMNA_LITROS] = 12345
+    cambiado.loc[7, COLUMNA_LITROS] = np.nan
+    resultado = fusionar(base, carga(cambiado), HOY, DIAS_RETENCION)
+    assert (resultado.sin_cambios, resultado.actualizados, resultado.insertados) == (18, 2, 0)
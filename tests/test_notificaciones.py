@@ -0,0 +1,51 @@
+# --- Pruebas del Despachador de Notificaciones ---
+# DespachadorNotificaciones contra el cliente FCM falso de tests/fcm_falso.py (sin red).
+from lemargo.notificaciones import TAMANO_LOTE_MAXIMO, DespachadorNotificaciones, Notificacion
+from tests.fcm_falso import ClienteFCMFalso
+
+
+def notificaciones(cantidad, prefijo='token'):
+    return [Notificacion(token=f"{prefijo}-{i}", titulo=f"Titulo {i}", cuerpo=f"Cuerpo {i}") for i in range(cantidad)]
+
+
+def test_lotes_limitados_a_500():
+    cliente = ClienteFCMFalso(latencia_lote=0)
+    resumen = DespachadorNotificaciones(cliente=cliente, tamano_lote=2000).despachar(notificaciones(1201))
+
+    assert max(cliente.tamanos_lote) == TAMANO_LOTE_MAXIMO == 500
+    assert sorted(cliente.tamanos_lote) == [201, 500, 500]
+    assert len(resumen.exitosos) == 1201
+
+
+def test_resultados_en_el_orden_de_los_mensajes():
+    # El primer lote termina al último: el resumen debe conservar el orden original.
+    def latencia(mensajes):
+        return 0.2 if mensajes[0].token == 'token-0' else 0.0
+
+    cliente = ClienteFCMFalso(latencia_lote=latencia)
+    enviadas = notificaciones(25)
+    resumen = DespachadorNotificaciones(cliente=cliente, max_hilos=4, tamano_lote=5).despachar(enviadas)
+
+    assert [r.notificacion for r in resumen.resultados] == enviadas
+    assert cliente.enviados[0].token != 'token-0'  # El primer lote sí terminó después de otros
+
+
+def test_errores_de_token_marcan_token_invalido():
+    cliente = ClienteFCMFalso(latencia_lote=0, tokens_invalidos={'token-1'}, tokens_otro_remitente={'token-3'})
+    resumen = DespachadorNotificaciones(cliente=cliente).despachar(notificaciones(5))
+
+    assert resumen.tokens_invalidos == ['token-1', 'token-3']
+    assert [r.exito for r in resumen.resultados] == [True, False, True, False, True]
+    assert all(r.token_invalido for r in resumen.fallidos)
+
+
+def test_lote_con_excepcion_se_reporta_fallido():
+    cliente = ClienteFCMFalso(latencia_lote=0, tokens_error_lote={'token-7'})
+    enviadas = notificaciones(12)
+    resumen = DespachadorNotificaciones(cliente=cliente, tamano_lote=5).despachar(enviadas)
+
+    assert [r.notificacion for r in resumen.resultados] == enviadas
+    fallidos = [r.notificacion.token for r in resumen.fallidos]
+    assert fallidos == [f"token-{i}" for i in range(5, 10)]
+    assert all("Error de red simulado" in r.error and not r.token_invalido for r in resumen.fallidos)
+    assert len(resumen.exitosos) == 7
@@ -0,0 +1,68 @@
+# --- Pruebas de la Carga Completa ---
+import io
+
+import pandas as pd
+import pytest
+
+from lemargo.esquema import destinos_de
+from lemargo.ingesta import leer_excel
+from lemargo.pipeline import ContextoCarga, ejecutar_carga
+from tests.datos_sinteticos import generar_golden_record
+
+HOY = '2025-01-31'
+
+
+def ingesta(df):
+    datos = io.BytesIO()
+    df.to_excel(datos, index=False)
+    return leer_excel(datos.getvalue())
+
+
+@pytest.fixture
+def contexto(tmp_path):
+    contexto = ContextoCarga.desde_directorio(str(tmp_path))
+    primera = ingesta(generar_golden_record(100))
+    ejecutar_carga(contexto, primera, hoy=HOY)
+    for destino in destinos_de(primera.df).unique():
+        contexto.suscripciones.suscribir(destino, f"token-{destino}")
+    return contexto
+
+
+def cancelar_todo(df):
+    return df.assign(**{'Estado de atención': 'CANCELADO', 'Fecha y hora de facturación': None})
+
+
+def test_sin_avisos_si_falla_el_guardado(contexto, monkeypatch):
+    def guardar_con_error(df):
+        raise OSError("Disco lleno")
+
+    archivo = ingesta(cancelar_todo(generar_golden_record(100)))
+    monkeypatch.setattr(contexto.almacen, 'guardar', guardar_con_error)
+    with pytest.raises(OSError):
+        ejecutar_carga(contexto, archivo, hoy=HOY)
+    assert contexto.cola.metricas()['profundidad'] == 0
+
+    # Al reintentar con la base ya guardable se detectan y encolan los mismos cambios.
+    monkeypatch.undo()
+    resultado = ejecutar_carga(contexto, archivo, hoy=HOY)
+    assert resultado.cambios_estado > 0
+    assert contexto.cola.metricas()['profundidad'] == resultado.notificaciones_encoladas > 0
+
+
+def test_cargas_sin_cambios_quedan_en_el_historial(tmp_path):
+    contexto = ContextoCarga.desde_directorio(str(tmp_path))
+    archivo = ingesta(generar_golden_record(50, dias=5))
+    ejecutar_carga(contexto, archivo, hoy=HOY, fecha='2025-01-31T08:00:00-06:00')
+
+    identica = ejecutar_carga(contexto, archivo, hoy=HOY, fecha='2025-01-31T09:00:00-06:00')
+    assert identica.identico
+    assert contexto.historial.ultima()['fecha'] == '2025-01-31T09:00:00-06:00'
+    assert contexto.historial.ultima()['detalle'] == {'identico': True}
+
+    sin_cambios = ejecutar_carga(contexto, archivo, hoy=HOY, fecha='2025-01-31T10:00:00-06:00', forzar=True)
+    assert not sin_cambios.guardado
+    ultima = contexto.historial.ultima()
+    assert ultima['fecha'] == '2025-01-31T10:00:00-06:00'
+    assert ultima['sin_cambios'] == sin_cambios.fusion.sin_cambios > 0
+    assert ultima['detalle']['sin_cambios_en_base'] is True
+    assert contexto.historial.total() == 3